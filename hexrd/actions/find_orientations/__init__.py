@@ -40,12 +40,11 @@ def find_orientations(cfg, hkls=None, clean=False, profile=False, nsim=100):
 
     eta_ome = get_eta_ome(cfg, clean=clean)
 
-    print("INFO:\tgenerating search quaternion list using %d processes" % ncpus)
+    print("INFO:\tgenerating search quaternion list")
     start = timeit.default_timer()
     qfib = generate_orientation_fibers(
         eta_ome, hedm.chi, on_map_threshold,
-        fiber_seeds, fiber_ndiv,
-        ncpus=ncpus
+        fiber_seeds, fiber_ndiv
     )
     print("INFO:\t\t...took %f seconds" % (timeit.default_timer() - start))
     print("INFO: will test %d quaternions using %d processes"
@@ -71,7 +70,8 @@ def find_orientations(cfg, hkls=None, clean=False, profile=False, nsim=100):
         omePeriod=np.radians(cfg.find_orientations.omega.period),
         threshold=on_map_threshold,
         doMultiProc=ncpus > 1,
-        nCPUs=ncpus
+        nCPUs=ncpus,
+        doThreads=cfg.multithreading
         )
     print("INFO:\t\t...took %f seconds" % (timeit.default_timer() - start))
     completeness = np.array(completeness)
@@ -121,19 +121,22 @@ def find_orientations(cfg, hkls=None, clean=False, profile=False, nsim=100):
         grain_param_list = np.vstack([rand_e, 
                                       np.zeros((3, nsim)),
                                       np.tile(cnst.identity_6x1, (nsim, 1)).T]).T
-        sim_results = hedm.simulate_rotation_series(
+        sim_results = hedm.simulate_rotation_series_multi(
                 plane_data, grain_param_list, 
                 eta_ranges=np.radians(cfg.find_orientations.eta.range),
                 ome_ranges=ome_ranges,
-                ome_period=np.radians(cfg.find_orientations.omega.period)
+                ome_period=np.radians(cfg.find_orientations.omega.period),
+                nthreads=ncpus if cfg.multithreading else 1
         )
         
         refl_per_grain = np.zeros(nsim)
         seed_refl_per_grain = np.zeros(nsim)
         for sim_result in sim_results.itervalues():
-            for i, refl_ids in enumerate(sim_result[0]):
-                refl_per_grain[i] += len(refl_ids)
-                seed_refl_per_grain[i] += np.sum([sum(refl_ids == hkl_id) for hkl_id in seed_hkl_ids])
+            grain_ids, refl_ids = sim_result[:2]
+            refl_per_grain += np.bincount(grain_ids, minlength=nsim)
+            seed_refl_per_grain += np.bincount(
+                grain_ids[np.in1d(refl_ids, seed_hkl_ids)], minlength=nsim
+            )
     
         min_samples = max(
             int(np.floor(0.5*cfg.find_orientations.clustering.completeness*min(seed_refl_per_grain))),
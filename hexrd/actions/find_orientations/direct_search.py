@@ -34,7 +34,8 @@ def test_orientation_FF_reduced(quat):
         npdiv=npdiv, threshold=threshold,
         eta_ranges=np.radians(cfg.find_orientations.eta.range),
         ome_period=(-np.pi, np.pi),
-        check_only=True)
+        check_only=True,
+        tile_indices=paramMP.get('tile_indices'))
 
     return sum(compl)/float(len(compl))
 
@@ -49,7 +50,8 @@ def direct_search():
             eta_tol=eta_tol,
             ome_tol=ome_tol,
             npdiv=npdiv,
-            threshold=cfg.fit_grains.threshold)
+            threshold=cfg.fit_grains.threshold,
+            tile_indices=cfg.tile_indices)
 
     print("INFO:\tusing direct seach")
     pool = multiprocessing.Pool(ncpus, test_orientation_FF_init, (params, ))
@@ -4,11 +4,10 @@
 import os
 import time
 import logging
-import multiprocessing as mp
 
 import numpy as np
 import timeit
-from scipy import ndimage, cluster
+from scipy import ndimage, cluster, spatial
 
 have_sklearn = False
 try:
@@ -16,7 +15,6 @@
     vstring = sklearn.__version__.split('.')
     if vstring[0] == '0' and int(vstring[1]) >= 14:
         from sklearn.cluster import dbscan
-        from sklearn.metrics.pairwise import pairwise_distances
         have_sklearn = True
 except ImportError:
     pass
@@ -78,7 +76,8 @@ def get_eta_ome(cfg, clean=False):
         imsd, instr, plane_data,
         active_hkls=active_hkls,
         threshold=build_map_threshold,
-        ome_period=cfg.find_orientations.omega.period
+        ome_period=cfg.find_orientations.omega.period,
+        tile_indices=cfg.tile_indices
     )
 
     print("INFO:  ...took %f seconds" % (timeit.default_timer() - start))
@@ -92,10 +91,13 @@ def get_eta_ome(cfg, clean=False):
 
 def generate_orientation_fibers(
         eta_ome, chi, threshold, seed_hkl_ids, fiber_ndiv,
-        filt_stdev=0.8, ncpus=1):
+        filt_stdev=0.8):
     """
     From ome-eta maps and hklid spec, generate list of
     quaternions from fibers
+
+    The fibers of all seed spots are generated at once by
+    rot.discreteFibers.
     """
     # seed_hkl_ids must be consistent with this...
     pd_hkl_ids = eta_ome.iHKLList[seed_hkl_ids]
@@ -114,18 +116,10 @@ def generate_orientation_fibers(
     bMat = pd.latVecOps['B']
     csym = pd.getLaueGroup()
 
-    params = dict(
-        bMat=bMat,
-        chi=chi,
-        csym=csym,
-        fiber_ndiv=fiber_ndiv)
-
     # =========================================================================
     # Labeling of spots from seed hkls
     # =========================================================================
 
-    qfib = []
-    input_p = []
     numSpots = []
     coms = []
     for i in seed_hkl_ids:
@@ -148,73 +142,45 @@ def generate_orientation_fibers(
         coms.append(coms_t)
         pass
 
+    # seed hkls and (tth, eta, ome) of the spot centroids
+    seed_hkls = []
+    seed_angs = []
     for i in range(len(pd_hkl_ids)):
         for ispot in range(numSpots[i]):
             if not np.isnan(coms[i][ispot][0]):
                 ome_c = eta_ome.omeEdges[0] + (0.5 + coms[i][ispot][0])*del_ome
                 eta_c = eta_ome.etaEdges[0] + (0.5 + coms[i][ispot][1])*del_eta
-                input_p.append(
-                    np.hstack(
-                        [hkls[:, pd_hkl_ids[i]],
-                         tTh[pd_hkl_ids[i]], eta_c, ome_c]
-                    )
-                )
+                seed_hkls.append(hkls[:, pd_hkl_ids[i]])
+                seed_angs.append([tTh[pd_hkl_ids[i]], eta_c, ome_c])
                 pass
             pass
         pass
 
-    # do the mapping
+    # do the mapping; all fibers are generated in one vectorized pass
     start = time.time()
-    qfib = None
-    if ncpus > 1:
-        # multiple process version
-        # QUESTION: Need a chunksize?
-        pool = mp.Pool(ncpus, discretefiber_init, (params, ))
-        qfib = pool.map(discretefiber_reduced, input_p)  # chunksize=chunksize)
-        pool.close()
+    if len(seed_angs) == 0:
+        qfib = np.zeros((4, 0))
     else:
-        # single process version.
-        global paramMP
-        discretefiber_init(params)  # sets paramMP
-        qfib = map(discretefiber_reduced, input_p)
-        paramMP = None  # clear paramMP
+        gVec_s = xfcapi.anglesToGVec(np.array(seed_angs), chi=chi).T
+        qfib = rot.discreteFibers(
+            np.array(seed_hkls, dtype=float).T, gVec_s,
+            B=bMat, ndiv=fiber_ndiv, csym=csym
+            )
     elapsed = (time.time() - start)
     logger.info("fiber generation took %.3f seconds", elapsed)
-    return np.hstack(qfib)
-
+    return qfib
 
-def discretefiber_init(params):
-    global paramMP
-    paramMP = params
 
-
-def discretefiber_reduced(params_in):
-    """
-    input parameters are [hkl_id, com_ome, com_eta]
-    """
-    bMat       = paramMP['bMat']
-    chi        = paramMP['chi']
-    csym       = paramMP['csym']
-    fiber_ndiv = paramMP['fiber_ndiv']
-
-    hkl = params_in[:3].reshape(3, 1)
-
-    gVec_s = xfcapi.anglesToGVec(
-        np.atleast_2d(params_in[3:]),
-        chi=chi,
-        ).T
-
-    tmp = mutil.uniqueVectors(
-        rot.discreteFiber(
-            hkl,
-            gVec_s,
-            B=bMat,
-            ndiv=fiber_ndiv,
-            invert=False,
-            csym=csym
-            )[0]
+def _quat_fclusterdata(quats, qsym, radius):
+    """fclusterdata on the quaternion misorientations within radius"""
+    pdist = spatial.distance.squareform(
+        xfcapi.quat_distances(quats, quats, qsym), checks=False
         )
-    return tmp
+    return cluster.hierarchy.fcluster(
+        cluster.hierarchy.linkage(pdist, method='single'),
+        radius, criterion='distance'
+        )
+
 
 def run_cluster(compl, qfib, qsym, cfg, min_samples=None, compl_thresh=None, radius=None):
     """
@@ -240,11 +206,8 @@ def run_cluster(compl, qfib, qsym, cfg, min_samples=None, compl_thresh=None, rad
         qbar = qfib[:, np.array(compl) > min_compl]
         cl = [1]
     else:
-        # use compiled module for distance
         # just to be safe, must order qsym as C-contiguous
         qsym  = np.array(qsym.T, order='C').T
-        def quat_distance(x, y):
-            return xfcapi.quat_distance(np.array(x, order='C'), np.array(y, order='C'), qsym)
 
         qfib_r = qfib[:, np.array(compl) > min_compl]
 
@@ -275,9 +238,9 @@ def quat_distance(x, y):
 
             if algorithm == 'sph-dbscan':
                 logger.info("using spherical DBSCAN")
-                # compute distance matrix
-                pdist = pairwise_distances(
-                    qfib_r.T, metric=quat_distance, n_jobs=1
+                # compute sparse distance matrix of the neighborhoods
+                pdist = rot.quatDistanceNeighbors(
+                    qfib_r, qsym, np.radians(cl_radius)
                     )
 
                 # run dbscan
@@ -313,12 +276,7 @@ def quat_distance(x, y):
             logger.info("dbscan found %d noise points", sum(noise_points))
         elif algorithm == 'fclusterdata':
             logger.info("using spherical fclusetrdata")
-            cl = cluster.hierarchy.fclusterdata(
-                qfib_r.T,
-                np.radians(cl_radius),
-                criterion='distance',
-                metric=quat_distance
-                )
+            cl = _quat_fclusterdata(qfib_r, qsym, np.radians(cl_radius))
         else:
             raise RuntimeError(
                 "Clustering algorithm %s not recognized" % algorithm
@@ -343,11 +301,7 @@ def quat_distance(x, y):
     if (algorithm == 'dbscan' or algorithm == 'ort-dbscan') \
       and qbar.size/4 > 1:
         logger.info("\tchecking for duplicate orientations...")
-        cl = cluster.hierarchy.fclusterdata(
-            qbar.T,
-            np.radians(cl_radius),
-            criterion='distance',
-            metric=quat_distance)
+        cl = _quat_fclusterdata(qbar, qsym, np.radians(cl_radius))
         nblobs_new = len(np.unique(cl))
         if nblobs_new < nblobs:
             logger.info("\tfound %d duplicates within %f degrees" \
@@ -5,12 +5,14 @@
 import multiprocessing as mp
 from multiprocessing.queues import Empty
 import os
+import threading
 import time
 
 import numpy as np
 from scipy.linalg.matfuncs import logm
 
 from hexrd.instrument import io
+from hexrd.instrument.prediction_cache import PredictionCache
 from hexrd.imageseries.omega import OmegaImageSeries
 from hexrd.coreutil import set_planedata_exclusions
 from hexrd.matrixutil import vecMVToSymm
@@ -102,6 +104,7 @@ def get_data(cfg, show_progress=False, force=False, clean=False):
         'eta_range': np.radians(cfg.find_orientations.eta.range),
         'eta_tol': cfg.fit_grains.tolerance.eta,
         'fit_only': cfg.fit_grains.fit_only,
+        'max_patch_shift': cfg.fit_grains.max_patch_shift,
         'npdiv': cfg.fit_grains.npdiv,
         'omega_period': np.radians(cfg.find_orientations.omega.period),
         'omega_tol': cfg.fit_grains.tolerance.omega,
@@ -111,6 +114,7 @@ def get_data(cfg, show_progress=False, force=False, clean=False):
         'refit_tol': cfg.fit_grains.refit,
         'spots_stem': 'spots_%05d.out',
         'threshold': cfg.fit_grains.threshold,
+        'tile_indices': cfg.tile_indices,
         'tth_tol': cfg.fit_grains.tolerance.tth,
         }
     return cfg.image_series, cfg.instrument.hedm, pkwargs
@@ -131,6 +135,8 @@ def fit_grains(cfg,
         )
     if ncpus == 1:
         logger.info('multiprocessing disabled')
+    elif cfg.multithreading:
+        logger.info('running workers as threads')
 
     # echo some of the fitting options
     if cfg.fit_grains.fit_only:
@@ -160,6 +166,15 @@ def fit_grains(cfg,
             progressbar=pbar
             )
         w.run()
+    elif cfg.multithreading:
+        # threads share the instrument and imageseries
+        results = []
+        for i in range(ncpus):
+            w = FitGrainsWorkerThread(job_queue, results,
+                                      imgser_dict, instr,
+                                      copy.deepcopy(pkwargs))
+            w.daemon = True
+            w.start()
     else:
         # multiprocessing
         manager = mp.Manager()
@@ -241,7 +256,7 @@ def __init__(self, jobs, results, imgser_dict, instr, pkwargs, **kwargs):
         self._p['wlen'] = self._p['plane_data'].wavelength
         self._pbar = kwargs.get('progressbar', None)
 
-    def pull_spots(self, grain_id, grain_params, iteration):
+    def pull_spots(self, grain_id, grain_params, iteration, cache=None):
         """
         ??? maybe pass interpolation option
         """
@@ -258,7 +273,9 @@ def pull_spots(self, grain_id, grain_params, iteration):
             dirname=self._p['analysis_directory'],
             filename=self._p['spots_stem'] % grain_id,
             save_spot_list=False, quiet=True,
-            check_only=False, interp='nearest')
+            check_only=False, interp='nearest',
+            tile_indices=self._p.get('tile_indices'),
+            prediction_cache=cache)
 
     def fit_grains(self, grain_id, grain_params, refit_tol=None):
         """
@@ -448,10 +465,14 @@ def get_residuals(self, grain_params):
     def loop(self):
         id, grain_params = self._jobs.get(False)
         iterations = (0, len(self._p['eta_tol']))
+        # predictions and patches are reused across the pulls of a grain
+        cache = None
+        if self._p.get('max_patch_shift') is not None:
+            cache = PredictionCache(max_shift=self._p['max_patch_shift'])
         for iteration in range(*iterations):
             # pull spots if asked to, otherwise just fit
             if not self._p['fit_only']:
-                self.pull_spots(id, grain_params, iteration)
+                self.pull_spots(id, grain_params, iteration, cache)
             # FITTING HERE
             _, compl, chisq, grain_params = self.fit_grains(
                 id, grain_params, refit_tol=self._p['refit_tol']
@@ -462,7 +483,7 @@ def loop(self):
 
         # final pull spots if enabled
         if not self._p['fit_only']:
-            self.pull_spots(id, grain_params, -1)
+            self.pull_spots(id, grain_params, -1, cache)
 
         emat = self.get_e_mat(grain_params)
         resd = self.get_residuals(grain_params)
@@ -487,3 +508,10 @@ class FitGrainsWorkerMP(FitGrainsWorker, mp.Process):
     def __init__(self, *args, **kwargs):
         mp.Process.__init__(self)
         FitGrainsWorker.__init__(self, *args, **kwargs)
+
+
+class FitGrainsWorkerThread(FitGrainsWorker, threading.Thread):
+
+    def __init__(self, *args, **kwargs):
+        threading.Thread.__init__(self)
+        FitGrainsWorker.__init__(self, *args, **kwargs)
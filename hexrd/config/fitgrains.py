@@ -61,6 +61,24 @@ def npdiv(self):
         return self._cfg.get('fit_grains:npdiv', 2)
 
 
+    @property
+    def max_patch_shift(self):
+        """pixels a prediction may move before its patch is recomputed
+
+        None, the default, turns the prediction cache off; 0 reuses only
+        patches whose prediction did not move at all.
+        """
+        key = 'fit_grains:max_patch_shift'
+        temp = self._cfg.get(key, None)
+        if temp is None:
+            return temp
+        if isinstance(temp, (int, float)) and temp >= 0:
+            return temp
+        raise RuntimeError(
+            '"%s" must be None or >= 0, got "%s"' % (key, temp)
+            )
+
+
     @property
     def panel_buffer(self):
         temp = self._cfg.get('fit_grains:panel_buffer')
@@ -100,6 +100,11 @@ def multiprocessing(self, val):
                 % (mp.cpu_count(), val)
                 )
 
+    @property
+    def multithreading(self):
+        # run the parallel workers as threads instead of processes
+        return bool(self.get('multithreading', default=False))
+
     @property
     def working_dir(self):
         try:
@@ -132,6 +137,7 @@ def image_series(self):
         """return the imageseries dictionary"""
         if not hasattr(self, '_image_dict'):
             self._image_dict = dict()
+            self._image_files = dict()
             fmt = self.get('image_series:format')
             imsdata = self.get('image_series:data')
             for ispec in imsdata:
@@ -144,5 +150,30 @@ def image_series(self):
                 except KeyError:
                     panel = ims.metadata['panel']
                 self._image_dict[panel] = ims
+                self._image_files[panel] = (fname, args.get('path'))
 
         return self._image_dict
+
+    @property
+    def tile_indices(self):
+        """return dictionary of imageseries tile indices, or None
+
+        Enabled by "image_series:tile_index"; each index is saved next to
+        its imageseries file, and rebuilt if the file (or its dataset path)
+        changed since.
+        """
+        if not self.get('image_series:tile_index', default=False):
+            return None
+        if not hasattr(self, '_tile_dict'):
+            self._tile_dict = dict()
+            tileindex = imageseries.tileindex
+            for panel, ims in self.image_series.items():
+                fname, path = self._image_files[panel]
+                tname = source = None
+                if fname is not None:
+                    tname = tileindex.index_file(fname, path)
+                    source = tileindex.source_key(fname, path)
+                self._tile_dict[panel] = tileindex.tile_index(
+                    ims, fname=tname, source=source)
+
+        return self._tile_dict
@@ -10,6 +10,7 @@
 fit_grains:
   do_fit: false
   estimate: %(nonexistent_file)s
+  max_patch_shift: 0.5
   npdiv: 1
   panel_buffer: 10
   threshold: 1850
@@ -21,6 +22,7 @@
 ---
 fit_grains:
   estimate: %(existing_file)s
+  max_patch_shift: null
   panel_buffer: [20, 30]
   tolerance:
     eta: [1, 2]
@@ -29,6 +31,7 @@
   tth_max: 15
 ---
 fit_grains:
+  max_patch_shift: -1
   tth_max: -1
 """ % test_data
 
@@ -59,6 +62,16 @@ def test_estimate(self):
             )
 
 
+    def test_max_patch_shift(self):
+        self.assertEqual(self.cfgs[0].fit_grains.max_patch_shift, None)
+        self.assertEqual(self.cfgs[1].fit_grains.max_patch_shift, 0.5)
+        self.assertEqual(self.cfgs[2].fit_grains.max_patch_shift, None)
+        self.assertRaises(
+            RuntimeError,
+            getattr, self.cfgs[3].fit_grains, 'max_patch_shift'
+            )
+
+
     def test_npdiv(self):
         self.assertEqual(self.cfgs[0].fit_grains.npdiv, 2)
         self.assertEqual(self.cfgs[1].fit_grains.npdiv, 1)
@@ -23,6 +23,7 @@
 multiprocessing: half
 ---
 multiprocessing: 2
+multithreading: true
 ---
 multiprocessing: 1000
 ---
@@ -91,6 +92,9 @@ def test_multiprocessing(self):
             RuntimeError, setattr, self.cfgs[7], 'multiprocessing', -2
             )
 
+    def test_multithreading(self):
+        self.assertFalse(self.cfgs[0].multithreading)
+        self.assertTrue(self.cfgs[4].multithreading)
 
 
 class TestSingleConfig(TestConfig):
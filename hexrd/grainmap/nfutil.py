@@ -12,10 +12,14 @@
 
 import numba
 import argparse
+import collections
 import contextlib
+import hashlib
 import multiprocessing
+from multiprocessing.pool import ThreadPool
 import tempfile
 import shutil 
+import h5py
 
 from hexrd.xrd import transforms as xf
 from hexrd.xrd import transforms_CAPI as xfcapi
@@ -36,6 +40,14 @@
 
 import matplotlib.pyplot as plt
 
+# Directory for the arrays shared with spawned workers; a tmpfs, so the
+# files live in memory. The system temporary directory is used if missing.
+SHARED_MEMORY_DIR = '/dev/shm'
+
+# Grains per call of the grand loop kernel; the reflection data of a block of
+# grains should stay in cache while the voxels of a chunk are tested
+GRAIN_BLOCK_SIZE = 64
+
 # ==============================================================================
 # %% SOME SCAFFOLDING
 # ==============================================================================
@@ -81,6 +93,15 @@ def handle_result(self, key, value):
         logging.debug("handle_result (%(key)s)", locals())
         self.rh.handle_result(key, value)
 
+    def handles_chunks(self, key):
+        """whether the result handler takes result key in chunks"""
+        return hasattr(self.rh, 'handle_chunk')
+
+    def handle_chunk(self, key, shape, rslice, value):
+        """pass the part rslice (along the last axis) of result key, an array
+        of the given shape, to the result handler"""
+        self.rh.handle_chunk(key, shape, rslice, value)
+
     # value limitting ----------------------------------------------------------
     def set_limit(self, key, limit_function):
         if key in self.limits:
@@ -167,6 +188,102 @@ def __del__(self):
     return SavingResultHandler(filename)
 
 
+def streaming_result_handler(filename=None, top_k=0, compression='gzip',
+                             id_remap=None):
+    """returns a result handler that reduces the confidence as its chunks
+    arrive, so the full (n_grains, n_coords) array never exists.
+
+    The handler keeps, per voxel, the best confidence (max_confidence), its
+    grain (best_grain) and optionally the top_k grains (top_grains) with
+    their confidences (top_confidence), best first. Ties go to the lowest
+    grain id, as np.argmax.
+
+    With test_orientations(..., early_exit=True) only the best grain and
+    its confidence are exact: the values of the other grains, and so the
+    top_k values after the first, are upper bounds of their confidences,
+    not confidences, and they are ranked by those bounds.
+
+    If filename is given, the raw confidence is written to that HDF5 file
+    as it arrives, chunked and compressed, in the 'raw_confidence' dataset;
+    the reductions are added as datasets of the same names on close(),
+    with id_remap, if given, as the 'id_remap' dataset so the file can be
+    remapped to far-field ids as the npz of save_raw_confidence.
+    """
+    class StreamingResultHandler(object):
+        def __init__(self, filename, top_k, compression, id_remap):
+            self.filename = filename
+            self.top_k = top_k
+            self.compression = compression
+            self.id_remap = id_remap
+            self.n_grains = None
+            self.max_confidence = None
+            self.best_grain = None
+            self.top_grains = None
+            self.top_confidence = None
+            self._file = None
+            self._raw = None
+
+        def _allocate(self, shape, value):
+            n_grains, n_coords = shape
+            self.n_grains = n_grains
+            self.max_confidence = np.zeros(n_coords)
+            self.best_grain = np.zeros(n_coords, dtype=int)
+            if self.top_k > 0:
+                k = min(self.top_k, n_grains)
+                self.top_grains = -np.ones((k, n_coords), dtype=int)
+                self.top_confidence = np.zeros((k, n_coords))
+            if self.filename is not None:
+                # chunks of the incoming width and about a megabyte
+                width = max(1, min(n_coords, value.shape[1]))
+                rows = max(1, min(n_grains, 2**20//(8*width)))
+                self._file = h5py.File(self.filename, 'w')
+                self._raw = self._file.create_dataset(
+                    'raw_confidence', shape=shape, dtype=value.dtype,
+                    chunks=(rows, width), compression=self.compression,
+                    shuffle=True)
+
+        def handle_chunk(self, key, shape, rslice, value):
+            if key != 'confidence':
+                return
+            if self.n_grains is None:
+                self._allocate(shape, value)
+            self.max_confidence[rslice] = np.max(value, axis=0)
+            self.best_grain[rslice] = np.argmax(value, axis=0)
+            if self.top_grains is not None:
+                k = len(self.top_grains)
+                order = np.argsort(-value, axis=0, kind='mergesort')[:k]
+                self.top_grains[:, rslice] = order
+                self.top_confidence[:, rslice] = np.take_along_axis(
+                    value, order, axis=0)
+            if self._raw is not None:
+                self._raw[:, rslice] = value
+
+        def handle_result(self, key, value):
+            # a whole array is a single chunk
+            if key == 'confidence' and value is not None:
+                self.handle_chunk(key, value.shape, slice(None), value)
+
+        def close(self):
+            if self._file is None:
+                return
+            logging.debug("Writing reductions in %(filename)s", self.__dict__)
+            for name in ('max_confidence', 'best_grain', 'top_grains',
+                         'top_confidence'):
+                if getattr(self, name) is not None:
+                    self._file.create_dataset(name, data=getattr(self, name))
+            if self.id_remap is not None:
+                self._file.create_dataset('id_remap',
+                                          data=np.asarray(self.id_remap))
+            self._file.close()
+            self._file = None
+            self._raw = None
+
+        def __del__(self):
+            self.close()
+
+    return StreamingResultHandler(filename, top_k, compression, id_remap)
+
+
 def checking_result_handler(filename):
     """returns a return handler that checks the results against a
     reference file.
@@ -370,8 +487,17 @@ def _gvec_to_detector_array(vG_sn, rD, rSn, rC, tD, tS, tC):
     return result
 
 
-@numba.njit
-def _quant_and_clip_confidence(coords, angles, image, base, inv_deltas, clip_vals,bshw):
+@numba.njit(nogil=True)
+def _image_hit(image, packed, z, y, x):
+    """value of pixel (z, y, x) of a plain or packed image stack"""
+    if packed:
+        return (image[z, y, x >> 3] >> (7 - (x & 7))) & 1 != 0
+    return image[z, y, x] != 0
+
+
+@numba.njit(nogil=True)
+def _quant_and_clip_confidence(coords, angles, image, base, inv_deltas, clip_vals,bshw,
+                               packed=False):
     """quantize and clip the parametric coordinates in coords + angles
 
     coords - (..., 2) array: input 2d parametric coordinates
@@ -380,6 +506,8 @@ def _quant_and_clip_confidence(coords, angles, image, base, inv_deltas, clip_val
     inv_deltas - (3,) array: inverse of the quantum size (for each dimension)
     clip_vals - (2,) array: clip size (only applied to coords dimensions)
     bshw - (1,) half width of the beam stop in mm
+    packed - True if image has its columns packed 8 to a byte (see
+             pack_image_stack)
 
     clipping is performed on ranges [0, clip_vals[0]] for x and
     [0, clip_vals[1]] for y
@@ -420,27 +548,269 @@ def _quant_and_clip_confidence(coords, angles, image, base, inv_deltas, clip_val
 
         x, y, z = int(xf), int(yf), int(zf)
 
-        #x_byte = x // 8
-        #x_off = 7 - (x % 8)
-        #if image[z, y, x_byte] (1<<x_off):
-        if image[z, y, x]:
+        if _image_hit(image, packed, z, y, x):
             matches += 1
 
     return 0 if in_sensor == 0 else float(matches)/float(in_sensor)
 
 
+@numba.njit(nogil=True)
+def _voxel_confidence(c0, c1, c2, k0, k1, omes, rMat_ss, dvecs, rD, tD, tS,
+                      image, packed, base, inv_deltas, clip_vals, bshw,
+                      early_exit, best_c):
+    """confidence of reflections k0:k1 (one grain) at voxel (c0, c1, c2)
+
+    see _grand_loop_block
+    """
+    ztol = xrdutil.epsf
+    # detector normal, rD times Zl
+    n0 = rD[0, 2]; n1 = rD[1, 2]; n2 = rD[2, 2]
+    in_sensor = 0
+    matches = 0
+    bound = 2.0
+    for k in range(k0, k1):
+        d0 = dvecs[k, 0]; d1 = dvecs[k, 1]; d2 = dvecs[k, 2]
+        denom = n0*d0 + n1*d1 + n2*d2
+        if not denom >= ztol:
+            continue
+
+        # beam origin relative to the detector origin
+        r = rMat_ss[k]
+        p0 = tD[0] - (r[0, 0]*c0 + r[0, 1]*c1 + r[0, 2]*c2 + tS[0])
+        p1 = tD[1] - (r[1, 0]*c0 + r[1, 1]*c1 + r[1, 2]*c2 + tS[1])
+        p2 = tD[2] - (r[2, 0]*c0 + r[2, 1]*c1 + r[2, 2]*c2 + tS[2])
+        u = (n0*p0 + n1*p1 + n2*p2)/denom
+        t0 = u*d0 - p0
+        t1 = u*d1 - p1
+        t2 = u*d2 - p2
+        xf = t0*rD[0, 0] + t1*rD[1, 0] + t2*rD[2, 0]
+        yf = t0*rD[0, 1] + t1*rD[1, 1] + t2*rD[2, 1]
+
+        # quantize and clip, as _quant_and_clip_confidence
+        xf = np.floor((xf - base[0]) * inv_deltas[0])
+        if not xf >= 0.0:
+            continue
+        if not xf < clip_vals[0]:
+            continue
+        if not np.abs(yf) > bshw:
+            continue
+        yf = np.floor((yf - base[1]) * inv_deltas[1])
+        if not yf >= 0.0:
+            continue
+        if not yf < clip_vals[1]:
+            continue
+        zf = np.floor((omes[k] - base[2]) * inv_deltas[2])
+
+        in_sensor += 1
+        if _image_hit(image, packed, int(zf), int(yf), int(xf)):
+            matches += 1
+
+        if early_exit:
+            # best case: all remaining reflections hit
+            left = k1 - k - 1
+            bound = float(matches + left)/float(in_sensor + left)
+            if bound < best_c:
+                return bound
+
+    if in_sensor == 0:
+        return 0.0
+    return float(matches)/float(in_sensor)
+
+
+def _grand_loop_block(coords, offsets, omes, rMat_ss, dvecs, rD, tD, tS,
+                      image, packed, base, inv_deltas, clip_vals, bshw,
+                      early_exit, best, confidence):
+    """confidence of a block of voxels for a block of grains
+
+    coords - (n, 3) array: voxel positions (the tVec_c of each test)
+    offsets - (m+1,) array: reflections of grain i are offsets[i]:offsets[i+1]
+    omes - (k,) array: omega of each reflection
+    rMat_ss - (k, 3, 3) array: sample rotation of each reflection
+    dvecs - (k, 3) array: diffracted beam direction in the lab frame of each
+            reflection, nan if it does not diffract
+    rD, tD, tS - detector rotation, detector and sample translations
+    image, packed, base, inv_deltas, clip_vals, bshw - as in
+            _quant_and_clip_confidence
+    early_exit - stop testing a grain on a voxel as soon as it can not beat
+            the best confidence of that voxel; the confidence stored is then
+            an upper bound lower than the best one
+    best - (n,) array: best confidence of each voxel so far, updated in place
+    confidence - (m, n) array: output
+
+    This fuses gvecToDetectorXYArray with _quant_and_clip_confidence: the
+    direction of the diffracted beams does not depend on the voxel, so only
+    the beam origin changes from one voxel to the next.
+    """
+    n_grains = len(offsets) - 1
+    for icrd in numba.prange(len(coords)):
+        c0 = coords[icrd, 0]; c1 = coords[icrd, 1]; c2 = coords[icrd, 2]
+        best_c = best[icrd]
+        for igrn in range(n_grains):
+            c = _voxel_confidence(c0, c1, c2, offsets[igrn], offsets[igrn + 1],
+                                  omes, rMat_ss, dvecs, rD, tD, tS,
+                                  image, packed, base, inv_deltas, clip_vals,
+                                  bshw, early_exit, best_c)
+            confidence[igrn, icrd] = c
+            if c > best_c:
+                best_c = c
+        best[icrd] = best_c
+
+
+@numba.njit(nogil=True, parallel=True)
+def _grand_loop_pairs(coords, cand_offsets, cand_grains, offsets, omes,
+                      rMat_ss, dvecs, rD, tD, tS, image, packed, base,
+                      inv_deltas, clip_vals, bshw, confidence):
+    """confidence of selected grains at each voxel
+
+    cand_offsets - (n+1,) array: the grains to test at voxel i are
+                   cand_grains[cand_offsets[i]:cand_offsets[i+1]]
+    confidence - (len(cand_grains),) array: output, per candidate
+
+    other arguments as in _grand_loop_block, for all grains
+    """
+    for icrd in numba.prange(len(coords)):
+        c0 = coords[icrd, 0]; c1 = coords[icrd, 1]; c2 = coords[icrd, 2]
+        for j in range(cand_offsets[icrd], cand_offsets[icrd + 1]):
+            igrn = cand_grains[j]
+            confidence[j] = _voxel_confidence(
+                c0, c1, c2, offsets[igrn], offsets[igrn + 1],
+                omes, rMat_ss, dvecs, rD, tD, tS, image, packed, base,
+                inv_deltas, clip_vals, bshw, False, 0.0)
+
+
+def _grand_loop_trials(coords, offsets, omes, rMat_ss, dvecs, rDs, tDs, tS,
+                       image, packed, base, inv_deltas, clip_vals, bshw, best):
+    """best confidence of each voxel for several detector placements
+
+    rDs - (n_trials, 3, 3) array: detector rotation of each trial
+    tDs - (n_trials, 3) array: detector translation of each trial
+    best - (n_trials, n_coords) array: output, the confidence of the best
+           grain of each voxel and trial
+
+    other arguments as in _grand_loop_block. Only the best grain matters, so
+    grains are abandoned as soon as they can not beat it.
+    """
+    n_trials = len(rDs)
+    n_grains = len(offsets) - 1
+    for item in numba.prange(len(coords)*n_trials):
+        icrd = item // n_trials
+        itrial = item % n_trials
+        c0 = coords[icrd, 0]; c1 = coords[icrd, 1]; c2 = coords[icrd, 2]
+        best_c = 0.0
+        for igrn in range(n_grains):
+            c = _voxel_confidence(c0, c1, c2, offsets[igrn], offsets[igrn + 1],
+                                  omes, rMat_ss, dvecs, rDs[itrial],
+                                  tDs[itrial], tS, image, packed, base,
+                                  inv_deltas, clip_vals, bshw, True, best_c)
+            if c > best_c:
+                best_c = c
+        best[itrial, icrd] = best_c
+
+
+def _project_block(coords, rMat_ss, dvecs, rD, tD, tS, xys):
+    """ideal detector coordinates of reflections for a block of voxels
+
+    xys - (n, k, 2) output array, nan where the beam misses the detector
+
+    arguments as in _grand_loop_block, for the reflections of one grain
+    """
+    ztol = xrdutil.epsf
+    n0 = rD[0, 2]; n1 = rD[1, 2]; n2 = rD[2, 2]
+    for icrd in numba.prange(len(coords)):
+        c0 = coords[icrd, 0]; c1 = coords[icrd, 1]; c2 = coords[icrd, 2]
+        for k in range(len(dvecs)):
+            d0 = dvecs[k, 0]; d1 = dvecs[k, 1]; d2 = dvecs[k, 2]
+            denom = n0*d0 + n1*d1 + n2*d2
+            if not denom >= ztol:
+                xys[icrd, k, 0] = np.nan
+                xys[icrd, k, 1] = np.nan
+                continue
+            r = rMat_ss[k]
+            p0 = tD[0] - (r[0, 0]*c0 + r[0, 1]*c1 + r[0, 2]*c2 + tS[0])
+            p1 = tD[1] - (r[1, 0]*c0 + r[1, 1]*c1 + r[1, 2]*c2 + tS[1])
+            p2 = tD[2] - (r[2, 0]*c0 + r[2, 1]*c1 + r[2, 2]*c2 + tS[2])
+            u = (n0*p0 + n1*p1 + n2*p2)/denom
+            t0 = u*d0 - p0
+            t1 = u*d1 - p1
+            t2 = u*d2 - p2
+            xys[icrd, k, 0] = t0*rD[0, 0] + t1*rD[1, 0] + t2*rD[2, 0]
+            xys[icrd, k, 1] = t0*rD[0, 1] + t1*rD[1, 1] + t2*rD[2, 1]
+    return xys
+
+
+# serial versions for the worker pools, parallel ones for a single process
+_grand_loop_block_serial = numba.njit(nogil=True)(_grand_loop_block)
+_grand_loop_block_parallel = numba.njit(nogil=True,
+                                        parallel=True)(_grand_loop_block)
+_grand_loop_trials_serial = numba.njit(nogil=True)(_grand_loop_trials)
+_grand_loop_trials_parallel = numba.njit(nogil=True,
+                                         parallel=True)(_grand_loop_trials)
+_project_block_serial = numba.njit(nogil=True)(_project_block)
+_project_block_parallel = numba.njit(nogil=True,
+                                     parallel=True)(_project_block)
+
+
+def _pack_grains(angles, precomp, rMat_c):
+    """reflection data of all grains, for _grand_loop_block
+
+    returns (offsets, omes, rMat_ss, dvecs), see _grand_loop_block
+    """
+    bHat_l = xf.bVec_ref[:, 0]/np.linalg.norm(xf.bVec_ref[:, 0])
+    ztol = xrdutil.epsf
+    offsets = np.zeros(len(angles) + 1, dtype=int)
+    offsets[1:] = np.cumsum([len(angs) for angs in angles])
+    omes = np.empty(offsets[-1])
+    rMat_ss = np.empty((offsets[-1], 3, 3))
+    dvecs = np.empty((offsets[-1], 3))
+    for i, (angs, (gvec_cs, rmat_ss)) in enumerate(zip(angles, precomp)):
+        these = slice(offsets[i], offsets[i + 1])
+        omes[these] = angs[:, 2]
+        rMat_ss[these] = rmat_ss
+
+        # unit g-vectors in the lab frame; the diffracted beam is the beam
+        # reflected by the lattice plane
+        gHat_c = gvec_cs/np.sqrt(np.sum(gvec_cs**2, axis=1)).reshape(-1, 1)
+        gvec_l = np.matmul(rmat_ss, np.dot(gHat_c, rMat_c[i].T)[:, :, None])
+        gvec_l = gvec_l[:, :, 0]
+        gDot = np.dot(gvec_l, bHat_l)
+        dvec = 2.0*gDot.reshape(-1, 1)*gvec_l - bHat_l
+        dvec[np.logical_or(-gDot < ztol, -gDot > 1.0 - ztol)] = np.nan
+        dvecs[these] = dvec
+    return offsets, omes, rMat_ss, dvecs
+
+
 # ==============================================================================
 # %% ORIENTATION TESTING
 # ==============================================================================
-def test_orientations(image_stack, experiment, test_crds, controller,multiprocessing_start_method):
+def test_orientations(image_stack, experiment, test_crds, controller,multiprocessing_start_method,
+                      early_exit=False, angle_cache=None):
     """grand loop precomputing the grown image stack
 
-    image-stack -- is the image stack to be tested against.
+    image-stack -- is the image stack to be tested against: a bool array
+                   (frames, rows, columns) or the same with the columns
+                   packed 8 to a byte, as made by pack_image_stack.
 
     experiment  -- A bunch of experiment related parameters.
 
     controller  -- An external object implementing the hooks to notify progress
                    as well as figuring out what to do with results.
+
+    multiprocessing_start_method -- 'fork', 'spawn' or 'thread'; 'thread'
+                   runs the workers as threads sharing the image stack and
+                   experiment, as the transforms and numba kernels release
+                   the GIL.
+
+    early_exit  -- stop testing a grain on a voxel once it can not beat the
+                   best grain found so far for that voxel. The best grain
+                   and its confidence are unchanged; the confidence of the
+                   abandoned grains is only an upper bound.
+
+    angle_cache -- an AngleCache to load the diffraction angles and
+                   per-grain precomputation from, instead of computing them.
+
+    Returns the confidence, (n_grains, n_coords). If the result handler of
+    the controller takes chunks (see streaming_result_handler) the
+    confidence is passed to it chunk by chunk instead, and None is returned.
     """
 
     # extract some information needed =========================================
@@ -457,7 +827,10 @@ def test_orientations(image_stack, experiment, test_crds, controller,multiproces
     # use, one entry per grain.
     #
     # Note that the angle generation is driven by the exp_maps in the experiment
-    all_angles = evaluate_diffraction_angles(experiment, controller)
+    #
+    # gVec_cs and rmat_ss can be precomputed too, do so.
+    all_angles, precomp = _grain_reflections(experiment, controller,
+                                             angle_cache)
 
     # generate coords =========================================================
     # The grid of coords to use to test
@@ -483,17 +856,6 @@ def test_orientations(image_stack, experiment, test_crds, controller,multiproces
 #        controller.update(i_image+1)
 #    controller.finish(subprocess)
 
-    # precompute per-grain stuff ==============================================
-    # gVec_cs and rmat_ss can be precomputed, do so.
-    subprocess = 'precompute gVec_cs'
-    controller.start(subprocess, len(all_angles))
-    precomp = []
-    for i, angs in enumerate(all_angles):
-        rmat_ss = xfcapi.makeOscillRotMatArray(experiment.chi, angs[:,2])
-        gvec_cs = _anglesToGVec(angs, rmat_ss, experiment.rMat_c[i])
-        precomp.append((gvec_cs, rmat_ss))
-    controller.finish(subprocess)
-
     # grand loop ==============================================================
     # The near field simulation 'grand loop'. Where the bulk of computing is
     # performed. We are looking for a confidence matrix that has a n_grains
@@ -505,22 +867,37 @@ def test_orientations(image_stack, experiment, test_crds, controller,multiproces
 
     logging.info('Checking confidence for %d coords, %d grains.',
                  n_coords, n_grains)
-    confidence = np.empty((n_grains, n_coords))
+    streaming = controller.handles_chunks("confidence")
+    if streaming:
+        confidence = None
+    else:
+        confidence = np.empty((n_grains, n_coords))
+
+    def store(rslice, rvalues):
+        if streaming:
+            controller.handle_chunk("confidence", (n_grains, n_coords),
+                                    rslice, rvalues)
+        else:
+            confidence[:, rslice] = rvalues
+
     if ncpus > 1:
         global _multiprocessing_start_method
         _multiprocessing_start_method=multiprocessing_start_method
         logging.info('Running multiprocess %d processes (%s)',
                      ncpus, _multiprocessing_start_method)
         with grand_loop_pool(ncpus=ncpus, state=(chunk_size,
+                                                 early_exit,
                                                  image_stack,
                                                  all_angles, precomp, test_crds,
                                                  experiment)) as pool:
             for rslice, rvalues in pool.imap_unordered(multiproc_inner_loop,
                                                        chunks):
                 count = rvalues.shape[1]
-                confidence[:, rslice] = rvalues
+                store(rslice, rvalues)
                 finished += count
                 controller.update(finished)
+            pool.close()
+        del _multiprocessing_start_method
     else:
         logging.info('Running in a single process')
         for chunk_start in chunks:
@@ -528,19 +905,226 @@ def test_orientations(image_stack, experiment, test_crds, controller,multiproces
             rslice, rvalues = _grand_loop_inner(image_stack, all_angles,
                                                 precomp, test_crds, experiment,
                                                 start=chunk_start,
-                                                stop=chunk_stop)
+                                                stop=chunk_stop,
+                                                early_exit=early_exit,
+                                                parallel=True)
             count = rvalues.shape[1]
-            confidence[:, rslice] = rvalues
+            store(rslice, rvalues)
             finished += count
             controller.update(finished)
 
     controller.finish(subprocess)
+    if not streaming:
+        controller.handle_result("confidence", confidence)
+
+    return confidence
+
+
+def _precompute_grains(experiment, all_angles, controller):
+    """gVec_cs and rMat_ss of all grains, packed by _pack_grains"""
+    subprocess = 'precompute gVec_cs'
+    controller.start(subprocess, len(all_angles))
+    precomp = []
+    for i, angs in enumerate(all_angles):
+        precomp.append(_grain_gvecs(experiment, angs, experiment.rMat_c[i]))
+        controller.update(i+1)
+    precomp = _pack_grains(all_angles, precomp, experiment.rMat_c)
+    controller.finish(subprocess)
+    return precomp
+
+
+def _grain_gvecs(experiment, angs, rMat_c):
+    """gVec_cs and rMat_ss of the reflections of one grain"""
+    rmat_ss = xfcapi.makeOscillRotMatArray(experiment.chi, angs[:,2])
+    gvec_cs = _anglesToGVec(angs, rmat_ss, rMat_c)
+    return gvec_cs, rmat_ss
+
+
+def _neighbor_offsets(stride, reach, active):
+    """grid index offsets -reach*stride..reach*stride along the active axes"""
+    steps = [np.arange(-reach, reach + 1)*stride if a else np.zeros(1, int)
+             for a in active]
+    return np.vstack([g.ravel() for g in np.meshgrid(*steps,
+                                                     indexing='ij')]).T
+
+
+def _gather_neighbors(idx, table, evaluated, grid_shape, offsets):
+    """table rows of the evaluated neighbors of grid points idx
+
+    idx - (n, 3) grid indices
+    table - (n_coords, k) int array, rows per flat grid index
+    evaluated - (n_coords,) bool array
+
+    returns an (n, len(offsets)*k) array, -1 for missing neighbors
+    """
+    shape = np.asarray(grid_shape)
+    k = table.shape[1]
+    out = np.full((len(idx), len(offsets)*k), -1, dtype=table.dtype)
+    for j, off in enumerate(offsets):
+        nb = idx + off
+        ok = np.all((nb >= 0) & (nb < shape), axis=1)
+        flat = np.ravel_multi_index(nb[ok].T, grid_shape)
+        ok[ok] = evaluated[flat]
+        flat = np.ravel_multi_index(nb[ok].T, grid_shape)
+        out[ok, j*k:(j + 1)*k] = table[flat]
+    return out
+
+
+def _unique_rows(values):
+    """distinct non-negative values of each row, as (counts, values)"""
+    values = np.sort(values, axis=1)
+    keep = values >= 0
+    keep[:, 1:] &= values[:, 1:] != values[:, :-1]
+    return keep.sum(axis=1), values[keep]
+
+
+def _top_k(rows, grains, conf, n_rows, top_k):
+    """the top_k grains by confidence of each row, -1 padded
+
+    rows, grains, conf - (row, grain, confidence) triplets; ties go to the
+    lowest grain id, as np.argmax. Zero confidences are not ranked.
+    """
+    table = np.full((n_rows, top_k), -1, dtype=int)
+    nz = conf > 0.
+    rows, grains, conf = rows[nz], grains[nz], conf[nz]
+    order = np.lexsort((grains, -conf, rows))
+    rows, grains = rows[order], grains[order]
+    starts = np.searchsorted(rows, np.arange(n_rows))
+    rank = np.arange(len(rows)) - starts[rows]
+    sel = rank < top_k
+    table[rows[sel], rank[sel]] = grains[sel]
+    return table
+
+
+def test_orientations_multires(image_stack, experiment, test_crds, grid_shape,
+                               controller, levels=2, top_k=4,
+                               angle_cache=None):
+    """coarse to fine version of test_orientations
+
+    image_stack, experiment, controller, angle_cache -- as in
+                   test_orientations
+
+    test_crds   -- the coords of a regular grid, C ordered, as made by
+                   gen_nf_test_grid_tomo
+
+    grid_shape  -- the shape of that grid, (ny, nx, nz) = Xs.shape
+
+    levels      -- number of refinement levels; all grains are tested on a
+                   lattice 2**levels voxels apart.
+
+    top_k       -- number of best grains of each tested voxel kept as
+                   candidates for its finer neighbors
+
+    Each level tests the voxels halfway between the ones already tested,
+    only for the top_k grains of their tested neighbors, or of a twice
+    wider neighborhood where the neighbors disagree on the best grain.
+    The confidence of a tested grain is exactly that of test_orientations;
+    grains that were not tested have zero confidence, so the result can be
+    passed to process_raw_confidence as it is.
+
+    Distortion is not supported.
+    """
+    distortion = experiment.distortion
+    if distortion is not None and len(distortion) > 0:
+        raise ValueError('test_orientations_multires does not support '
+                         'distortion')
+    grid_shape = tuple(int(i) for i in grid_shape)
+    n_grains = experiment.n_grains
+    n_coords = len(test_crds)
+    if len(grid_shape) != 3 or np.prod(grid_shape) != n_coords:
+        raise ValueError('grid_shape %s does not match %d coords'
+                         % (grid_shape, n_coords))
+
+    all_angles, precomp = _grain_reflections(experiment, controller,
+                                             angle_cache)
+    offsets, omes, rMat_ss, dvecs = precomp
+
+    rD = experiment.rMat_d
+    tD = experiment.tVec_d[:,0]
+    tS = experiment.tVec_s[:,0]
+    base = experiment.base
+    inv_deltas = experiment.inv_deltas
+    clip_vals = experiment.clip_vals
+    bshw = experiment.bsw/2.
+    packed = _is_packed(image_stack, clip_vals)
+    crds = np.ascontiguousarray(test_crds, dtype=float)
+
+    idx = np.vstack(np.unravel_index(np.arange(n_coords), grid_shape)).T
+    active = [n > 1 for n in grid_shape]
+    confidence = np.zeros((n_grains, n_coords))
+    evaluated = np.zeros(n_coords, dtype=bool)
+    table = np.full((n_coords, top_k), -1, dtype=int)
+
+    logging.info('Checking confidence for %d coords, %d grains, '
+                 '%d levels.', n_coords, n_grains, levels)
+    subprocess = 'grand_loop'
+    controller.start(subprocess, n_coords)
+
+    # coarsest lattice, all grains ============================================
+    stride = 2**levels
+    on_lattice = np.all(idx % stride == 0, axis=1)
+    pts = np.where(on_lattice)[0]
+    block = np.zeros((n_grains, len(pts)))
+    _grand_loop_block_parallel(crds[pts], offsets, omes, rMat_ss, dvecs,
+                               rD, tD, tS, image_stack, packed, base,
+                               inv_deltas, clip_vals, bshw, False,
+                               np.zeros(len(pts)), block)
+    confidence[:, pts] = block
+    evaluated[pts] = True
+    table[pts] = _top_k(np.tile(np.arange(len(pts)), n_grains),
+                        np.repeat(np.arange(n_grains), len(pts)),
+                        block.ravel(), len(pts), top_k)
+    n_evals = block.size
+    controller.update(len(pts))
+
+    # refinement levels =======================================================
+    while stride > 1:
+        stride //= 2
+        on_lattice = np.all(idx % stride == 0, axis=1)
+        pts = np.where(on_lattice & ~evaluated)[0]
+        if len(pts) == 0:
+            continue
+
+        near = _neighbor_offsets(stride, 1, active)
+        winners = _gather_neighbors(idx[pts], table[:, :1], evaluated,
+                                    grid_shape, near)
+        masked = np.ma.masked_less(winners, 0)
+        boundary = np.asarray(masked.min(axis=1) != masked.max(axis=1))
+
+        counts = np.zeros(len(pts), dtype=int)
+        grains = []
+        for sel, reach in ((~boundary, 1), (boundary, 2)):
+            cand = _gather_neighbors(idx[pts[sel]], table, evaluated,
+                                     grid_shape,
+                                     _neighbor_offsets(stride, reach, active))
+            counts[sel], g = _unique_rows(cand)
+            grains.append((np.where(sel)[0], counts[sel], g))
+
+        # candidates in pts order
+        rows = np.concatenate([np.repeat(r, c) for r, c, g in grains])
+        cand_grains = np.concatenate([g for r, c, g in grains])
+        order = np.argsort(rows, kind='mergesort')
+        rows, cand_grains = rows[order], cand_grains[order]
+        cand_offsets = np.zeros(len(pts) + 1, dtype=int)
+        np.cumsum(counts, out=cand_offsets[1:])
+
+        cand_conf = np.zeros(len(cand_grains))
+        _grand_loop_pairs(crds[pts], cand_offsets, cand_grains, offsets,
+                          omes, rMat_ss, dvecs, rD, tD, tS, image_stack,
+                          packed, base, inv_deltas, clip_vals, bshw,
+                          cand_conf)
+        confidence[cand_grains, pts[rows]] = cand_conf
+        evaluated[pts] = True
+        table[pts] = _top_k(rows, cand_grains, cand_conf, len(pts), top_k)
+        n_evals += len(cand_grains)
+        controller.update(np.count_nonzero(evaluated))
+
+    controller.finish(subprocess)
+    logging.info('Tested %d voxel/grain pairs, %.1f%% of %d.',
+                 n_evals, 100.*n_evals/max(1, n_grains*n_coords),
+                 n_grains*n_coords)
     controller.handle_result("confidence", confidence)
-    
-    del _multiprocessing_start_method
-    
-    pool.close()
-    
+
     return confidence
 
 
@@ -553,29 +1137,13 @@ def evaluate_diffraction_angles(experiment, controller=None):
     """
     # extract required data from experiment
     exp_maps = experiment.exp_maps
-    plane_data = experiment.plane_data
-    detector_params = experiment.detector_params
-    pixel_size = experiment.pixel_size
-    ome_range = experiment.ome_range
-    ome_period = experiment.ome_period
 
-    panel_dims_expanded = [(-10, -10), (10, 10)]
     subprocess='evaluate diffraction angles'
     pbar = controller.start(subprocess,
                             len(exp_maps))
     all_angles = []
-    ref_gparams = np.array([0., 0., 0., 1., 1., 1., 0., 0., 0.])
     for i, exp_map in enumerate(exp_maps):
-        gparams = np.hstack([exp_map, ref_gparams])
-        sim_results = xrdutil.simulateGVecs(plane_data,
-                                            detector_params,
-                                            gparams,
-                                            panel_dims=panel_dims_expanded,
-                                            pixel_pitch=pixel_size,
-                                            ome_range=ome_range,
-                                            ome_period=ome_period,
-                                            distortion=None)
-        all_angles.append(sim_results[2])
+        all_angles.append(_simulate_grain_angles(experiment, exp_map))
         controller.update(i+1)
         pass
     controller.finish(subprocess)
@@ -583,28 +1151,179 @@ def evaluate_diffraction_angles(experiment, controller=None):
     return all_angles
 
 
+def _simulate_grain_angles(experiment, exp_map):
+    """simulateGVecs angles of the grain with orientation exp_map"""
+    panel_dims_expanded = [(-10, -10), (10, 10)]
+    ref_gparams = np.array([0., 0., 0., 1., 1., 1., 0., 0., 0.])
+    gparams = np.hstack([exp_map, ref_gparams])
+    sim_results = xrdutil.simulateGVecs(experiment.plane_data,
+                                        experiment.detector_params,
+                                        gparams,
+                                        panel_dims=panel_dims_expanded,
+                                        pixel_pitch=experiment.pixel_size,
+                                        ome_range=experiment.ome_range,
+                                        ome_period=experiment.ome_period,
+                                        distortion=None)
+    return sim_results[2]
+
+
+class AngleCache(object):
+    """diffraction angles, gVec_cs and rMat_ss of grains, saved in a file
+
+    Multi-layer runs on the same grains and instrument simulate the same
+    reflections for every layer; with a cache shared by the runs they are
+    simulated once and loaded afterwards. Entries are stored per grain in an
+    HDF5 file, keyed by the grain orientation and everything else the
+    simulation depends on: detector parameters, pixel size, chi, omega
+    range and period, and the plane data (B matrix, wavelength and the hkls
+    in use). Changing any of them simply makes new entries.
+
+    The file is only read in place. New entries are written, with the
+    entries already in the file, to a temporary file that is then renamed
+    over it, so runs sharing a cache never see a partly written file; when
+    two runs add entries at the same time the last rename wins and the
+    entries of the other are simulated again next time.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _setup_digest(experiment):
+        plane_data = experiment.plane_data
+        digest = hashlib.sha1()
+        for item in (experiment.detector_params, experiment.pixel_size,
+                     experiment.chi, experiment.ome_range,
+                     experiment.ome_period, plane_data.latVecOps['B'],
+                     plane_data.wavelength,
+                     xrdutil._fetch_hkls_from_planedata(plane_data)):
+            item = np.ascontiguousarray(item, dtype=float)
+            digest.update(str(item.shape))
+            digest.update(item.tobytes())
+        return digest
+
+    def _read(self, keys):
+        """dict of the entries of keys found in the file"""
+        found = dict()
+        if not os.path.exists(self.filename):
+            return found
+        with h5py.File(self.filename, 'r') as f:
+            for key in keys:
+                if key in f:
+                    grp = f[key]
+                    found[key] = (grp['angles'][()], grp['gvec_cs'][()],
+                                  grp['rmat_ss'][()])
+        return found
+
+    def _write(self, entries):
+        """add entries to the file through a renamed temporary file"""
+        dirname, basename = os.path.split(os.path.abspath(self.filename))
+        fd, tmpname = tempfile.mkstemp(prefix=basename + '.', suffix='.tmp',
+                                       dir=dirname)
+        os.close(fd)
+        try:
+            with h5py.File(tmpname, 'w') as out:
+                if os.path.exists(self.filename):
+                    with h5py.File(self.filename, 'r') as f:
+                        for key in f:
+                            f.copy(key, out)
+                for key, (angs, gvec_cs, rmat_ss) in entries.iteritems():
+                    if key in out:
+                        continue
+                    grp = out.create_group(key)
+                    grp.create_dataset('angles', data=angs)
+                    grp.create_dataset('gvec_cs', data=gvec_cs)
+                    grp.create_dataset('rmat_ss', data=rmat_ss)
+            try:
+                os.rename(tmpname, self.filename)
+            except OSError:
+                # no replacing rename on Windows
+                os.remove(self.filename)
+                os.rename(tmpname, self.filename)
+        except:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+
+    def load(self, experiment, controller):
+        """angles and packed precomputation of the grains of experiment
+
+        returns (all_angles, precomp), as evaluate_diffraction_angles and
+        _precompute_grains; missing grains are computed and saved.
+        """
+        setup = self._setup_digest(experiment)
+        exp_maps = experiment.exp_maps
+        keys = []
+        for exp_map in exp_maps:
+            digest = setup.copy()
+            digest.update(np.ascontiguousarray(exp_map, dtype=float).tobytes())
+            keys.append(digest.hexdigest())
+
+        subprocess = 'load cached diffraction angles'
+        controller.start(subprocess, len(exp_maps))
+        entries = self._read(keys)
+        new_entries = dict()
+        all_angles = []
+        precomp = []
+        for i, key in enumerate(keys):
+            if key in entries:
+                angs, gvec_cs, rmat_ss = entries[key]
+                self.hits += 1
+            else:
+                angs = _simulate_grain_angles(experiment, exp_maps[i])
+                gvec_cs, rmat_ss = _grain_gvecs(experiment, angs,
+                                                experiment.rMat_c[i])
+                new_entries[key] = (angs, gvec_cs, rmat_ss)
+                self.misses += 1
+            all_angles.append(angs)
+            precomp.append((gvec_cs, rmat_ss))
+            controller.update(i+1)
+        if new_entries:
+            self._write(new_entries)
+        precomp = _pack_grains(all_angles, precomp, experiment.rMat_c)
+        controller.finish(subprocess)
+        return all_angles, precomp
+
+
+def _grain_reflections(experiment, controller, angle_cache=None):
+    """all_angles and precomp of the grains, from angle_cache if given"""
+    if angle_cache is not None:
+        return angle_cache.load(experiment, controller)
+    all_angles = evaluate_diffraction_angles(experiment, controller)
+    return all_angles, _precompute_grains(experiment, all_angles, controller)
+
+
 def _grand_loop_inner(image_stack, angles, precomp,
-                      coords, experiment, start=0, stop=None):
+                      coords, experiment, start=0, stop=None,
+                      early_exit=False, parallel=False):
     """Actual simulation code for a chunk of data. It will be used both,
     in single processor and multiprocessor cases. Chunking is performed
     on the coords.
 
-    image_stack -- the image stack from the sensors
+    image_stack -- the image stack from the sensors, plain or packed
     angles -- the angles (grains) to test
     coords -- all the coords to test
-    precomp -- (gvec_cs, rmat_ss) precomputed for each grain
+    precomp -- reflection data of all grains, from _pack_grains
     experiment -- bag with experiment parameters
     start -- chunk start offset
     stop -- chunk end offset
+    early_exit -- see test_orientations (ignored with distortion)
+    parallel -- use the parallel kernels, for the single process case
+
+    The grains are tested GRAIN_BLOCK_SIZE at a time on all the coords of
+    the chunk by a compiled kernel. With distortion the ideal coordinates of
+    each grain are projected for the whole chunk, distorted in one call and
+    then quantized.
     """
 
-    t = time.time()
     n_coords = len(coords)
     n_angles = len(angles)
+    offsets, omes, rMat_ss, dvecs = precomp
 
     # experiment geometric layout parameters
     rD = experiment.rMat_d
-    rCn = experiment.rMat_c
     tD = experiment.tVec_d[:,0]
     tS = experiment.tVec_s[:,0]
 
@@ -614,59 +1333,46 @@ def _grand_loop_inner(image_stack, angles, precomp,
     clip_vals = experiment.clip_vals
     distortion = experiment.distortion
     bshw=experiment.bsw/2.
+    packed = _is_packed(image_stack, clip_vals)
 
-    _to_detector = xfcapi.gvecToDetectorXYArray
-    #_to_detector = _gvec_to_detector_array
     stop = min(stop, n_coords) if stop is not None else n_coords
+    crds = np.ascontiguousarray(coords[start:stop], dtype=float)
 
     distortion_fn = None
-    if distortion is not None and len(distortion > 0):
+    if distortion is not None and len(distortion) > 0:
         distortion_fn, distortion_args = distortion
 
-    acc_detector = 0.0
-    acc_distortion = 0.0
-    acc_quant_clip = 0.0
     confidence = np.zeros((n_angles, stop-start))
-    grains = 0
-    crds = 0
 
     if distortion_fn is None:
-        for igrn in xrange(n_angles):
-            angs = angles[igrn]; rC = rCn[igrn]
-            gvec_cs, rMat_ss = precomp[igrn]
-            grains += 1
-            for icrd in xrange(start, stop):
-                t0 = time.time()
-                det_xy = _to_detector(gvec_cs, rD, rMat_ss, rC, tD, tS, coords[icrd])
-                t1 = time.time()
-                c = _quant_and_clip_confidence(det_xy, angs[:,2], image_stack,
-                                               base, inv_deltas, clip_vals,bshw)
-                t2 = time.time()
-                acc_detector += t1 - t0
-                acc_quant_clip += t2 - t1
-                crds += 1
-                confidence[igrn, icrd - start] = c
+        if parallel:
+            kernel = _grand_loop_block_parallel
+        else:
+            kernel = _grand_loop_block_serial
+        best = np.zeros(stop-start)
+        for g0 in xrange(0, n_angles, GRAIN_BLOCK_SIZE):
+            g1 = min(n_angles, g0 + GRAIN_BLOCK_SIZE)
+            k0, k1 = offsets[g0], offsets[g1]
+            kernel(crds, offsets[g0:g1 + 1] - k0, omes[k0:k1],
+                   rMat_ss[k0:k1], dvecs[k0:k1], rD, tD, tS,
+                   image_stack, packed, base, inv_deltas, clip_vals, bshw,
+                   early_exit, best, confidence[g0:g1])
     else:
+        if parallel:
+            project = _project_block_parallel
+        else:
+            project = _project_block_serial
         for igrn in xrange(n_angles):
-            angs = angles[igrn]; rC = rCn[igrn]
-            gvec_cs, rMat_ss = precomp[igrn]
-            grains += 1
-            for icrd in xrange(start, stop):
-                t0 = time.time()
-                tmp_xys = _to_detector(gvec_cs, rD, rMat_ss, rC, tD, tS, coords[icrd])
-                t1 = time.time()
-                det_xy = distortion_fn(tmp_xys, distortion_args, invert=True)
-                t2 = time.time()
-                c = _quant_and_clip_confidence(det_xy, angs[:,2], image_stack,
-                                               base, inv_deltas, clip_vals,bshw)
-                t3 = time.time()
-                acc_detector += t1 - t0
-                acc_distortion += t2 - t1
-                acc_quant_clip += t3 - t2
-                crds += 1
-                confidence[igrn, icrd - start] = c
-
-    t = time.time() - t
+            k0, k1 = offsets[igrn], offsets[igrn + 1]
+            tmp_xys = np.empty((stop-start, k1-k0, 2))
+            project(crds, rMat_ss[k0:k1], dvecs[k0:k1], rD, tD, tS, tmp_xys)
+            det_xys = distortion_fn(tmp_xys.reshape(-1, 2), distortion_args,
+                                    invert=True).reshape(tmp_xys.shape)
+            for icrd in xrange(stop-start):
+                confidence[igrn, icrd] = _quant_and_clip_confidence(
+                    det_xys[icrd], omes[k0:k1], image_stack,
+                    base, inv_deltas, clip_vals, bshw, packed)
+
     return slice(start, stop), confidence
 
 
@@ -674,22 +1380,71 @@ def multiproc_inner_loop(chunk):
     """function to use in multiprocessing that computes the simulation over the
     task's alloted chunk of data"""
 
+    chunk_size, early_exit = _mp_state[:2]
+    n_coords = len(_mp_state[5])
+    chunk_stop = min(n_coords, chunk+chunk_size)
+    return _grand_loop_inner(*_mp_state[2:], start=chunk, stop=chunk_stop,
+                             early_exit=early_exit)
+
+
+def multiproc_scan_loop(chunk):
+    """multiprocessing counterpart of multiproc_inner_loop for
+    scan_detector_parm"""
+
     chunk_size = _mp_state[0]
-    n_coords = len(_mp_state[4])
+    n_coords = len(_mp_state[3])
     chunk_stop = min(n_coords, chunk+chunk_size)
-    return _grand_loop_inner(*_mp_state[1:], start=chunk, stop=chunk_stop)
+    return _scan_inner(*_mp_state[1:], start=chunk, stop=chunk_stop)
 
 
-def worker_init(id_state, id_exp):
+class _SharedArray(object):
+    """reference to an array saved in the shared memory directory"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def attach(self):
+        # maps the file, nothing is read or copied
+        return np.load(self.path, mmap_mode='r')
+
+
+def _share_state(state, shm_dir):
+    """save the arrays in state (nested tuples and lists) in shm_dir
+
+    returns state with each array replaced by a _SharedArray
+    """
+    counter = [0]
+
+    def share(item):
+        if isinstance(item, np.ndarray):
+            path = os.path.join(shm_dir, 'array-%d.npy' % counter[0])
+            counter[0] += 1
+            np.save(path, np.ascontiguousarray(item))
+            return _SharedArray(path)
+        elif isinstance(item, (list, tuple)):
+            return type(item)(share(i) for i in item)
+        return item
+    return share(state)
+
+
+def _attach_state(state):
+    """inverse of _share_state, with read-only memory maps for the arrays"""
+    if isinstance(state, _SharedArray):
+        return state.attach()
+    elif isinstance(state, (list, tuple)):
+        return type(state)(_attach_state(i) for i in state)
+    return state
+
+
+def worker_init(shared_state, experiment):
     """process initialization function. This function is only used when the
     child processes are spawned (instead of forked). When using the fork model
-    of multiprocessing the data is just inherited in process memory."""
-    import joblib
+    of multiprocessing the data is just inherited in process memory.
 
+    The arrays of the state are memory maps of the files written by
+    grand_loop_pool in shared memory, so attaching copies nothing."""
     global _mp_state
-    state = joblib.load(id_state)
-    experiment = joblib.load(id_exp)
-    _mp_state = state + (experiment,)
+    _mp_state = _attach_state(shared_state) + (experiment,)
 
 @contextlib.contextmanager
 def grand_loop_pool(ncpus, state):
@@ -697,59 +1452,86 @@ def grand_loop_pool(ncpus, state):
     properly the use of spawned vs forked multiprocessing. The multiprocessing
     can be either 'fork' or 'spawn', with 'spawn' being required in non-fork
     platforms (like Windows) and 'fork' being preferred on fork platforms due
-    to its efficiency.
+    to its efficiency. With 'thread' a thread pool is used instead, sharing
+    the state without copies.
     """
     # state = ( chunk_size,
+    #           early_exit,
     #           image_stack,
     #           angles,
     #           precomp,
     #           coords,
     #           experiment )
+    # or, for scan_detector_parm,
+    # state = ( chunk_size,
+    #           image_stack,
+    #           precomp,
+    #           coords,
+    #           trials,
+    #           experiment )
     global _multiprocessing_start_method
-    if _multiprocessing_start_method == 'fork':
+    global _mp_state
+    if _multiprocessing_start_method == 'thread':
+        # Use THREADS; the state is shared through the global just like the
+        # fork case, but nothing is copied.
+        _mp_state = state
+        pool = None
+        try:
+            pool = ThreadPool(ncpus)
+            yield pool
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            del (_mp_state)
+    elif _multiprocessing_start_method == 'fork':
         # Use FORK multiprocessing.
 
         # All read-only data can be inherited in the process. So we "pass" it as
         # a global that the child process will be able to see. At the end of the
-        # processing the global is removed.
-        global _mp_state
+        # processing, or on error, the workers are stopped and the global is
+        # removed.
         _mp_state = state
-        pool = multiprocessing.Pool(ncpus)
-        yield pool
-        del (_mp_state)
+        pool = None
+        try:
+            pool = multiprocessing.Pool(ncpus)
+            yield pool
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            del (_mp_state)
     else:
         # Use SPAWN multiprocessing.
 
-        # As we can not inherit process data, all the required data is
-        # serialized into a temporary directory using joblib. The
-        # multiprocessing pool will have the "worker_init" as initialization
-        # function that takes the key for the serialized data, which will be
-        # used to load the parameter memory into the spawn process (also using
-        # joblib). In theory, joblib uses memmap for arrays if they are not
-        # compressed, so no compression is used for the bigger arrays.
-        import joblib
-        tmp_dir = tempfile.mkdtemp(suffix='-nf-grand-loop')
+        # As we can not inherit process data, the arrays of the state (image
+        # stack, angles, precomputed reflections and coords) are saved as
+        # .npy files in shared memory, and the workers map them read-only in
+        # "worker_init": nothing is deserialized or copied per worker. The
+        # small rest of the state and the experiment are pickled with the
+        # initializer arguments. The files belong to this process, so they
+        # are removed here whatever happens to the workers; a crashed worker
+        # is replaced by the pool and attaches again.
+        if os.path.isdir(SHARED_MEMORY_DIR):
+            shm_dir = tempfile.mkdtemp(prefix='hexrd-nf-grand-loop-',
+                                       dir=SHARED_MEMORY_DIR)
+        else:
+            shm_dir = tempfile.mkdtemp(prefix='hexrd-nf-grand-loop-')
+        pool = None
         try:
-            # dumb dumping doesn't seem to work very well.. do something ad-hoc
-            logging.info('Using "%s" as temporary directory.', tmp_dir)
-
-            id_exp = joblib.dump(state[-1], 
-                                 os.path.join(tmp_dir,
-                                              'grand-loop-experiment.gz'),
-                                 compress=True)
-            id_state = joblib.dump(state[:-1],
-                                   os.path.join(tmp_dir, 'grand-loop-data'))
+            logging.info('Sharing arrays through "%s".', shm_dir)
+            shared_state = _share_state(state[:-1], shm_dir)
             pool = multiprocessing.Pool(ncpus, worker_init,
-                                        (id_state[0], id_exp[0]))
+                                        (shared_state, state[-1]))
             yield pool
         finally:
-            logging.info('Deleting "%s".', tmp_dir)
-            shutil.rmtree(tmp_dir)
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            logging.info('Deleting "%s".', shm_dir)
+            shutil.rmtree(shm_dir, ignore_errors=True)
 
 
-
-
-            
 #%% Loading Utilities
             
             
@@ -959,104 +1741,441 @@ def gen_nf_test_grid_tomo(x_dim_pnts, z_dim_pnts, v_bnds, voxel_spacing):
 
 #%%
     
-def gen_nf_dark(data_folder,img_nums,num_for_dark,nrows,ncols,dark_type='median',stem='nf_',num_digits=5,ext='.tif'):
-    
-    dark_stack=np.zeros([num_for_dark,nrows,ncols])
+class _ImageFiles(object):
+    """frames of numbered image files, indexed like an imageseries"""
+
+    def __init__(self, data_folder, img_nums, stem, num_digits, ext):
+        self.filenames = [data_folder+'%s'%(stem)+str(i).zfill(num_digits)+ext
+                          for i in img_nums]
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, i):
+        return imgio.imread(self.filenames[i])
+
+
+def _ordered_imap(pool, func, items, depth):
+    """func(item) for each item, in order, at most depth of them ahead
+
+    Unlike pool.imap, the items are not all submitted at once, so the
+    results waiting to be consumed stay bounded. Without a pool the items
+    are processed as they are consumed.
+    """
+    if pool is None:
+        for item in items:
+            yield func(item)
+        return
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item, )))
+        if len(pending) >= depth:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def gen_nf_dark(data_folder,img_nums,num_for_dark,nrows,ncols,dark_type='median',stem='nf_',num_digits=5,ext='.tif',
+                threads=1):
+    """dark image from the first num_for_dark numbered image files
+
+    see gen_nf_dark_from_imageseries
+    """
+    frames = _ImageFiles(data_folder, img_nums[:num_for_dark], stem,
+                         num_digits, ext)
+    return gen_nf_dark_from_imageseries(frames, num_for_dark,
+                                        dark_type=dark_type, threads=threads)
+
+
+def gen_nf_dark_from_imageseries(ims, num_for_dark, dark_type='median',
+                                 threads=1):
+    """dark image from the first num_for_dark frames of an imageseries
+
+    ims -- an imageseries, or anything with len() and frames by index
+    dark_type -- 'median' or 'min' of the frames at each pixel
+    threads -- frames are read ahead and the dark is reduced by row bands
+               in this many threads
+
+    The frames are kept in their own dtype, not as floats; the dark is a
+    float image.
+    """
+    nf = min(num_for_dark, len(ims))
+    if dark_type == 'median':
+        reduce_fn = np.median
+    elif dark_type == 'min':
+        reduce_fn = np.min
+    else:
+        raise ValueError("dark_type must be 'median' or 'min', not %r"
+                         % (dark_type, ))
+
+    pool = ThreadPool(threads) if threads > 1 else None
+    try:
+        print('Loading data for dark generation...')
+        dark_stack = None
+        frames = _ordered_imap(pool, ims.__getitem__, range(nf), 2*threads)
+        for ii, frame in enumerate(frames):
+            if dark_stack is None:
+                dark_stack = np.empty((nf, ) + frame.shape, dtype=frame.dtype)
+            dark_stack[ii] = frame
+
+        print('making %s...' % dark_type)
+        dark = np.empty(dark_stack.shape[1:])
+        edges = np.linspace(0, len(dark), max(threads, 1) + 1).astype(int)
+
+        def reduce_band(band):
+            r0, r1 = band
+            dark[r0:r1] = reduce_fn(dark_stack[:, r0:r1], axis=0)
+
+        bands = zip(edges[:-1], edges[1:])
+        if pool is None:
+            map(reduce_band, bands)
+        else:
+            pool.map(reduce_band, bands)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
-    print('Loading data for dark generation...')
-    for ii in np.arange(num_for_dark):
-        print('Image #: ' + str(ii))
-        dark_stack[ii,:,:]=imgio.imread(data_folder+'%s'%(stem)+str(img_nums[ii]).zfill(num_digits)+ext)
-        #image_stack[ii,:,:]=np.flipud(tmp_img>threshold)
-    
-    if dark_type=='median':   
-        print('making median...')
-        dark=np.median(dark_stack,axis=0)
-    elif dark_type=='min':
-        print('making min...')
-        dark=np.min(dark_stack,axis=0)
-        
     return dark
 
 
 #%%    
-def gen_nf_image_stack(data_folder,img_nums,dark,num_erosions,num_dilations,ome_dilation_iter,threshold,nrows,ncols,stem='nf_',num_digits=5,ext='.tif'):
-    
-    
-    image_stack=np.zeros([img_nums.shape[0],nrows,ncols],dtype=bool)
+def gen_nf_image_stack(data_folder,img_nums,dark,num_erosions,num_dilations,ome_dilation_iter,threshold,nrows,ncols,stem='nf_',num_digits=5,ext='.tif',
+                       packed=False, threads=1):
+    """binary image stack from the numbered image files
+
+    see gen_nf_image_stack_from_imageseries
+    """
+    frames = _ImageFiles(data_folder, img_nums, stem, num_digits, ext)
+    return gen_nf_image_stack_from_imageseries(
+        frames, dark, num_erosions, num_dilations, ome_dilation_iter,
+        threshold, packed=packed, threads=threads)
+
+
+def gen_nf_image_stack_from_imageseries(ims, dark, num_erosions,
+                                        num_dilations, ome_dilation_iter,
+                                        threshold, packed=False, threads=1):
+    """binary image stack from an imageseries, cleaned and dilated
+
+    ims -- an imageseries, or anything with len() and frames by index
+    dark -- dark image subtracted before thresholding
+    num_erosions, num_dilations -- binary erosions then dilations of each
+               frame (scipy.ndimage iterations)
+    ome_dilation_iter -- iterations of the final binary dilation in frame,
+               row and column
+    packed -- return a stack with the columns packed 8 to a byte, see
+               pack_image_stack
+    threads -- frames are read, thresholded, eroded and dilated in this
+               many threads
+
+    The result is the same as thresholding, eroding and dilating the
+    frames, stacking them and calling scipy's binary_dilation on the
+    stack, but frames are streamed. The cross-shaped dilation iterated n
+    times spreads a pixel over the frames within n of it, by n - |dz| in
+    the frame at distance dz; so each frame is dilated in 2d up to n times
+    by the workers, and an output frame is the union of these dilations
+    over a sliding window of 2n + 1 frames. Only the window is held
+    unpacked. With ome_dilation_iter < 1 (dilate until nothing changes)
+    the stack is dilated as a whole instead.
+    """
+    nf = len(ims)
+    n_ome = ome_dilation_iter if ome_dilation_iter >= 1 else 0
+    cut = dark + threshold
+
+    def clean_frame(ii):
+        binary = ims[ii] > cut
+        binary = img.morphology.binary_erosion(binary,iterations=num_erosions)
+        binary = img.morphology.binary_dilation(binary,iterations=num_dilations)
+        dilated = [binary, ]
+        for k in range(n_ome):
+            dilated.append(img.morphology.binary_dilation(dilated[-1]))
+        return dilated
+
+    def ome_dilated(iz, window):
+        frame = window[iz][n_ome].copy()
+        for jz in range(max(iz - n_ome, 0), min(iz + n_ome + 1, nf)):
+            if jz != iz:
+                frame |= window[jz][n_ome - abs(jz - iz)]
+        return frame
+
+    image_stack = None
+    pool = ThreadPool(threads) if threads > 1 else None
+    try:
+        print('Loading and Cleaning Images...')
+        window = dict()
+        frames = _ordered_imap(pool, clean_frame, range(nf), 2*threads)
+        for ii, dilated in enumerate(frames):
+            if image_stack is None:
+                nrows, ncols = dilated[0].shape
+                if packed:
+                    image_stack = np.zeros([nf,nrows,(ncols+7)//8],dtype=np.uint8)
+                else:
+                    image_stack = np.zeros([nf,nrows,ncols],dtype=bool)
+            window[ii] = dilated
+
+            # frames with all their window in are final
+            last = nf - 1 if ii == nf - 1 else ii - n_ome
+            for iz in range(max(ii - n_ome, 0), last + 1):
+                frame = ome_dilated(iz, window)
+                if packed:
+                    image_stack[iz] = np.packbits(frame, axis=-1)
+                else:
+                    image_stack[iz] = frame
+                window.pop(iz - n_ome, None)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if n_ome == 0:
+        print('Final Dilation Including Omega....')
+        if packed:
+            image_stack=dilate_packed_stack(image_stack,ome_dilation_iter,ncols)
+        else:
+            image_stack=img.morphology.binary_dilation(image_stack,iterations=ome_dilation_iter)
 
-    print('Loading and Cleaning Images...')
-    for ii in np.arange(img_nums.shape[0]):
-        print('Image #: ' + str(ii))
-        tmp_img=imgio.imread(data_folder+'%s'%(stem)+str(img_nums[ii]).zfill(num_digits)+ext)-dark
-        #image procesing
-        image_stack[ii,:,:]=img.morphology.binary_erosion(tmp_img>threshold,iterations=num_erosions)
-        image_stack[ii,:,:]=img.morphology.binary_dilation(image_stack[ii,:,:],iterations=num_dilations)
-        
-    #%A final dilation that includes omega
-    print('Final Dilation Including Omega....')
-    image_stack=img.morphology.binary_dilation(image_stack,iterations=ome_dilation_iter)
-    
     return image_stack
 
 
+def pack_image_stack(image_stack):
+    """pack the columns of a binary image stack 8 to a byte
+
+    The result is the uint8 array of np.packbits along the last axis: pixel
+    x of a row is bit 7 - x % 8 of byte x // 8. The confidence kernels take
+    either form, telling them apart by the number of columns.
+    """
+    return np.packbits(np.asarray(image_stack, dtype=bool), axis=-1)
+
+
+def unpack_image_stack(image_stack, ncols):
+    """bool image stack of ncols columns from a packed one"""
+    return np.unpackbits(image_stack, axis=-1)[..., :ncols].astype(bool)
+
+
+def _is_packed(image_stack, clip_vals):
+    """True if image_stack is packed, from the number of columns"""
+    ncols = int(clip_vals[0])
+    if image_stack.shape[-1] == ncols:
+        return False
+    if image_stack.shape[-1] == (ncols + 7)//8 and \
+       image_stack.dtype == np.uint8:
+        return True
+    raise ValueError(
+        "image stack with %d columns for a %d columns detector"
+        % (image_stack.shape[-1], ncols))
+
+
+@numba.njit(nogil=True, parallel=True)
+def _packed_dilation_step(src, dst, last_mask):
+    """one binary dilation of a packed stack with the 3d cross
+
+    last_mask - mask of the pixel bits of the last byte of a row
+
+    returns the number of bytes changed
+    """
+    nz, ny, nb = src.shape
+    changed = 0
+    for z in numba.prange(nz):
+        for y in range(ny):
+            for j in range(nb):
+                v = src[z, y, j]
+                # neighbors along the columns, carrying across bytes
+                w = v | (v >> 1) | ((v << 1) & 0xff)
+                if j > 0:
+                    w |= (src[z, y, j - 1] & 1) << 7
+                if j < nb - 1:
+                    w |= src[z, y, j + 1] >> 7
+                if j == nb - 1:
+                    w &= last_mask
+                # neighbors along the rows and frames
+                if y > 0:
+                    w |= src[z, y - 1, j]
+                if y < ny - 1:
+                    w |= src[z, y + 1, j]
+                if z > 0:
+                    w |= src[z - 1, y, j]
+                if z < nz - 1:
+                    w |= src[z + 1, y, j]
+                dst[z, y, j] = w
+                if w != v:
+                    changed += 1
+    return changed
+
+
+def dilate_packed_stack(image_stack, iterations, ncols):
+    """binary dilation of a packed stack
+
+    Same as scipy.ndimage.binary_dilation(unpacked, iterations=iterations)
+    with its default structure, the cross connecting a pixel to its
+    neighbors in frame, row and column; iterations < 1 repeats until
+    nothing changes.
+    """
+    last_bits = ncols - 8*(image_stack.shape[-1] - 1)
+    last_mask = (0xff << (8 - last_bits)) & 0xff
+    src = np.array(image_stack, dtype=np.uint8)
+    dst = np.empty_like(src)
+    i = 0
+    while iterations < 1 or i < iterations:
+        changed = _packed_dilation_step(src, dst, last_mask)
+        src, dst = dst, src
+        i += 1
+        if changed == 0:
+            break
+    return src
+
+
 #%%    
-def scan_detector_parm(image_stack, experiment,test_crds,controller,parm_to_opt,parm_vector,slice_shape):
-    #0-distance
-    #1-x center
-    #2-xtilt
-    #3-ytilt
-    #4-ztilt
-    
-    multiprocessing_start_method = 'fork' if hasattr(os, 'fork') else 'spawn'
-    
-    #current detector parameters, note the value for the actively optimized parameters will be ignored
-    distance=experiment.detector_params[5]#mm
-    x_cen=experiment.detector_params[3]#mm
-    xtilt=experiment.detector_params[0]
-    ytilt=experiment.detector_params[1]
-    ztilt=experiment.detector_params[2]  
-    
-    num_parm_pts=len(parm_vector)
-    
-    trial_data=np.zeros([num_parm_pts,slice_shape[0],slice_shape[1]])
-    
-    tmp_td=copy.copy(experiment.tVec_d)
-    for jj in np.arange(num_parm_pts):
-        print('cycle %d of %d'%(jj+1,num_parm_pts))
+def _detector_trials(experiment, parm_to_opt, parm_vectors):
+    """detector rotations and translations of a scan
 
-        
-        if parm_to_opt==0:
-            tmp_td[2]=parm_vector[jj]        
-        else:
-            tmp_td[2]=distance   
-        
-        if parm_to_opt==1:
-            tmp_td[0]=parm_vector[jj]        
-        else:
-            tmp_td[0]=x_cen
-        
-        if  parm_to_opt==2:
-            rMat_d_tmp=makeDetectorRotMat([parm_vector[jj],ytilt,ztilt]) 
-        elif parm_to_opt==3:
-            rMat_d_tmp=makeDetectorRotMat([xtilt,parm_vector[jj],ztilt])
-        elif parm_to_opt==4:
-            rMat_d_tmp=makeDetectorRotMat([xtilt,ytilt,parm_vector[jj]])  
+    The trials are all the combinations of the values in parm_vectors, one
+    vector per parameter of parm_to_opt, with the first parameter varying
+    slowest. Returns (rMat_ds, tVec_ds), arrays (n_trials, 3, 3) and
+    (n_trials, 3).
+    """
+    # current detector parameters, the actively optimized ones are ignored
+    base_parms = [experiment.detector_params[5],  # distance, mm
+                  experiment.detector_params[3],  # x center, mm
+                  experiment.detector_params[0],  # x tilt
+                  experiment.detector_params[1],  # y tilt
+                  experiment.detector_params[2]]  # z tilt
+    grids = np.meshgrid(*parm_vectors, indexing='ij')
+    n_trials = grids[0].size
+    rMat_ds = np.empty((n_trials, 3, 3))
+    tVec_ds = np.empty((n_trials, 3))
+    for jj in range(n_trials):
+        parms = list(base_parms)
+        for parm, grid in zip(parm_to_opt, grids):
+            if parm not in range(5):
+                raise ValueError('unknown detector parameter %s' % parm)
+            parms[parm] = grid.flat[jj]
+        tVec_ds[jj] = experiment.tVec_d[:, 0]
+        tVec_ds[jj, 2] = parms[0]
+        tVec_ds[jj, 0] = parms[1]
+        rMat_ds[jj] = makeDetectorRotMat(parms[2:])
+    return rMat_ds, tVec_ds
+
+
+def _scan_inner(image_stack, precomp, coords, trials, experiment, start=0,
+                stop=None, parallel=False):
+    """best confidence of a chunk of coords for each detector trial
+
+    trials -- (rMat_ds, tVec_ds), see _detector_trials
+
+    returns the slice of coords and an (n_trials, n) array. All the trials
+    are tested in one kernel call; with distortion each trial goes through
+    _grand_loop_inner.
+    """
+    rMat_ds, tVec_ds = trials
+    offsets, omes, rMat_ss, dvecs = precomp
+    n_coords = len(coords)
+    stop = min(stop, n_coords) if stop is not None else n_coords
+    crds = np.ascontiguousarray(coords[start:stop], dtype=float)
+    best = np.zeros((len(rMat_ds), stop-start))
+
+    distortion = experiment.distortion
+    if distortion is not None and len(distortion) > 0:
+        n_grains = len(offsets) - 1
+        angles = [None]*n_grains
+        trial = copy.copy(experiment)
+        for jj in range(len(rMat_ds)):
+            trial.rMat_d = rMat_ds[jj]
+            trial.tVec_d = tVec_ds[jj].reshape(3, 1)
+            conf = _grand_loop_inner(image_stack, angles, precomp, crds,
+                                     trial, parallel=parallel)[1]
+            best[jj] = np.max(conf, axis=0)
+    else:
+        if parallel:
+            kernel = _grand_loop_trials_parallel
         else:
-            rMat_d_tmp=makeDetectorRotMat([xtilt,ytilt,ztilt])
-        
-        experiment.rMat_d = rMat_d_tmp
-        experiment.tVec_d = tmp_td
+            kernel = _grand_loop_trials_serial
+        kernel(crds, offsets, omes, rMat_ss, dvecs,
+               np.ascontiguousarray(rMat_ds), np.ascontiguousarray(tVec_ds),
+               experiment.tVec_s[:,0], image_stack,
+               _is_packed(image_stack, experiment.clip_vals),
+               experiment.base, experiment.inv_deltas, experiment.clip_vals,
+               experiment.bsw/2., best)
+    return slice(start, stop), best
+
+
+def scan_detector_parm(image_stack, experiment,test_crds,controller,parm_to_opt,parm_vector,slice_shape,
+                       angle_cache=None):
+    """best confidence map of a slice for trial detector parameters
+
+    parm_to_opt -- the parameter to scan:
+                   0-distance
+                   1-x center
+                   2-xtilt
+                   3-ytilt
+                   4-ztilt
+                   or a sequence of them for a multi-dimensional scan.
+
+    parm_vector -- the trial values of the parameter, or a sequence of
+                   vectors, one per parameter of parm_to_opt.
+
+    angle_cache -- as in test_orientations
+
+    Returns an array of the best confidence of each voxel, of shape
+    (len(parm_vector),) + slice_shape, or (len(parm_vector[0]),
+    len(parm_vector[1]), ...) + slice_shape for a multi-dimensional scan.
+
+    Only the detector placement changes between trials, so the diffraction
+    angles and per-grain precomputation are done once, the workers are
+    started once, and each kernel call tests a chunk of coords for all the
+    trials.
+    """
+    global _multiprocessing_start_method
 
-        
-        
-        conf=test_orientations(image_stack, experiment, test_crds,
-                      controller,multiprocessing_start_method)
-        
-        
-        trial_data[jj]=np.max(conf,axis=0).reshape(slice_shape)
-        
-    return trial_data
+    if np.ndim(parm_to_opt) == 0:
+        parm_to_opt = [parm_to_opt]
+        parm_vector = [parm_vector]
+    parm_vector = [np.atleast_1d(np.asarray(v, dtype=float))
+                   for v in parm_vector]
+    if len(parm_to_opt) != len(parm_vector):
+        raise ValueError('one parameter vector per scanned parameter needed')
+    scan_shape = tuple(len(v) for v in parm_vector)
+    trials = _detector_trials(experiment, parm_to_opt, parm_vector)
+
+    all_angles, precomp = _grain_reflections(experiment, controller,
+                                             angle_cache)
+
+    n_coords = len(test_crds)
+    chunk_size = controller.get_chunk_size()
+    chunks = xrange(0, n_coords, chunk_size)
+    ncpus = min(controller.get_process_count(), len(chunks))
+
+    subprocess = 'scan detector parameters'
+    controller.start(subprocess, n_coords)
+    logging.info('Scanning %d detector trials on %d coords.',
+                 len(trials[0]), n_coords)
+    trial_data = np.empty((len(trials[0]), n_coords))
+    finished = 0
+    if ncpus > 1:
+        _multiprocessing_start_method = 'fork' if hasattr(os, 'fork') \
+                                        else 'spawn'
+        with grand_loop_pool(ncpus=ncpus, state=(chunk_size, image_stack,
+                                                 precomp, test_crds, trials,
+                                                 experiment)) as pool:
+            for rslice, rvalues in pool.imap_unordered(multiproc_scan_loop,
+                                                       chunks):
+                trial_data[:, rslice] = rvalues
+                finished += rvalues.shape[1]
+                controller.update(finished)
+            pool.close()
+        del _multiprocessing_start_method
+    else:
+        for chunk_start in chunks:
+            rslice, rvalues = _scan_inner(image_stack, precomp, test_crds,
+                                          trials, experiment,
+                                          start=chunk_start,
+                                          stop=chunk_start+chunk_size,
+                                          parallel=True)
+            trial_data[:, rslice] = rvalues
+            finished += rvalues.shape[1]
+            controller.update(finished)
+    controller.finish(subprocess)
+
+    return trial_data.reshape(scan_shape + tuple(slice_shape))
     
 #%%
 
@@ -1078,8 +2197,30 @@ def process_raw_confidence(raw_confidence,vol_shape,tomo_mask=None,id_remap=None
     print('Compiling Confidence Map...')
     confidence_map=np.max(raw_confidence,axis=0).reshape(vol_shape)
     grain_map=np.argmax(raw_confidence,axis=0).reshape(vol_shape)
-    
-    
+    return _finish_grain_map(grain_map, confidence_map, tomo_mask, id_remap)
+
+
+def process_streamed_confidence(streamed, vol_shape, tomo_mask=None,
+                                id_remap=None):
+    """process_raw_confidence for the reductions of streaming_result_handler
+
+    streamed -- the handler, or the name of the HDF5 file it wrote
+    """
+    print('Compiling Confidence Map...')
+    if isinstance(streamed, basestring):
+        with h5py.File(streamed, 'r') as f:
+            confidence_map = f['max_confidence'][()]
+            grain_map = f['best_grain'][()]
+    else:
+        confidence_map = streamed.max_confidence
+        grain_map = streamed.best_grain
+    confidence_map = np.array(confidence_map).reshape(vol_shape)
+    grain_map = np.array(grain_map).reshape(vol_shape)
+    return _finish_grain_map(grain_map, confidence_map, tomo_mask, id_remap)
+
+
+def _finish_grain_map(grain_map, confidence_map, tomo_mask, id_remap):
+    """apply the tomography mask and grain id remapping"""
     if tomo_mask is not None:
         print('Applying tomography mask...')
         out_bounds=np.where(tomo_mask==0)  
@@ -1088,15 +2229,23 @@ def process_raw_confidence(raw_confidence,vol_shape,tomo_mask=None,id_remap=None
 
 
     if id_remap is not None:
-        max_grain_no=np.max(grain_map)
-        grain_map_copy=copy.copy(grain_map)
         print('Remapping grain ids to ff...')
-        for ii in np.arange(max_grain_no):
-            this_grain=np.where(grain_map==ii)
-            grain_map_copy[this_grain]=id_remap[ii]
-        grain_map=grain_map_copy
+        grain_map=remap_grain_ids(grain_map,id_remap)
 
     return grain_map, confidence_map
+
+
+def remap_grain_ids(grain_map, id_remap):
+    """grain_map with each grain id ii replaced by id_remap[ii]
+
+    Negative ids (masked voxels) are kept. A lookup table, so a single pass
+    over the voxels whatever the number of grains.
+    """
+    lut = np.asarray(id_remap)
+    remapped = np.array(grain_map, dtype=np.result_type(grain_map, lut))
+    valid = grain_map >= 0
+    remapped[valid] = lut[grain_map[valid]]
+    return remapped
     
 #%%
 
@@ -0,0 +1,122 @@
+import argparse
+import unittest
+
+import numpy as np
+
+from hexrd.xrd import material
+from hexrd.xrd import rotations as rot
+from hexrd.xrd.transforms_CAPI import gvecToDetectorXYArray, makeDetectorRotMat
+
+try:
+    from hexrd.grainmap import nfutil
+except ImportError:
+    # nfutil pulls in pyplot with the WXAgg backend of hexrd.plotwrap
+    nfutil = None
+
+have_nfutil = nfutil is not None
+
+
+@unittest.skipUnless(have_nfutil, "nfutil not importable (needs wx)")
+class GrainMapTest(unittest.TestCase):
+    pass
+
+
+def make_experiment(n_grains=4, seed=0, nframes=90, npix=256, pix=0.008):
+    """nf experiment: fcc grains on a square detector 6.5 mm downstream"""
+    rng = np.random.RandomState(seed)
+    mat = material.Material('copper')
+    mat.sgnum = 225
+    mat.latticeParameters = [3.59]
+    mat.hklMax = 12
+    pd = mat.planeData
+    pd.wavelength = 71.676
+    pd.tThMax = np.radians(25.)
+
+    tilt = np.r_[0.001, -0.002, 0.0005]
+    tvec_d = np.r_[0.05, -0.02, -6.5]
+    tvec_s = np.zeros(3)
+    chi = 0.001
+
+    x_col_edges = pix*(np.arange(npix + 1) - 0.5*npix)
+    y_row_edges = pix*(np.arange(npix + 1) - 0.5*npix)[::-1]
+    ome_edges = np.arange(nframes + 1)*2*np.pi/nframes
+
+    e = argparse.Namespace()
+    e.n_grains = n_grains
+    e.exp_maps = rng.uniform(-1, 1, (n_grains, 3))
+    e.rMat_c = rot.rotMatOfExpMap(e.exp_maps.T)
+    e.detector_params = np.hstack([tilt, tvec_d, chi, tvec_s])
+    e.plane_data = pd
+    e.pixel_size = [pix, pix]
+    e.ome_range = [(0., 2*np.pi)]
+    e.ome_period = (0., 2*np.pi)
+    e.x_col_edges = x_col_edges
+    e.y_row_edges = y_row_edges
+    e.ome_edges = ome_edges
+    e.ncols = e.nrows = npix
+    e.nframes = nframes
+    e.rMat_d = makeDetectorRotMat(tilt)
+    e.tVec_d = np.atleast_2d(tvec_d).T
+    e.chi = chi
+    e.tVec_s = np.atleast_2d(tvec_s).T
+    e.distortion = None
+    e.panel_dims = [(-0.5*npix*pix,)*2, (0.5*npix*pix,)*2]
+    e.base = np.array([x_col_edges[0], y_row_edges[0], ome_edges[0]])
+    e.inv_deltas = 1.0/np.array([x_col_edges[1] - x_col_edges[0],
+                                 y_row_edges[1] - y_row_edges[0],
+                                 ome_edges[1] - ome_edges[0]])
+    e.clip_vals = np.array([npix, npix])
+    e.bsw = 0.1
+    return e
+
+
+def make_image_stack(experiment, fill=0.3, seed=0):
+    """random bool image stack with about fill of the pixels set"""
+    rng = np.random.RandomState(seed)
+    shape = (experiment.nframes, experiment.nrows, experiment.ncols)
+    return rng.uniform(size=shape) < fill
+
+
+def make_coords(n=200, seed=0):
+    """random test coordinates in a thin slab about the origin"""
+    rng = np.random.RandomState(seed)
+    crds = rng.uniform(-0.3, 0.3, (n, 3))
+    crds[:, 1] *= 0.05
+    return crds
+
+
+def make_controller(result_handler=None, ncpus=1, chunk_size=50):
+    if result_handler is None:
+        result_handler = nfutil.forgetful_result_handler()
+    return nfutil.ProcessController(result_handler,
+                                    nfutil.null_progress_observer(),
+                                    ncpus=ncpus, chunk_size=chunk_size)
+
+
+def plant_grains(experiment, image_stack, coords, grain_ids):
+    """set the pixels of the reflections of grain grain_ids[i] at coords[i]
+
+    returns image_stack, changed in place
+    """
+    rD = experiment.rMat_d
+    tD = experiment.tVec_d[:, 0]
+    tS = experiment.tVec_s[:, 0]
+    for igrn in np.unique(grain_ids):
+        angs = nfutil._simulate_grain_angles(experiment,
+                                             experiment.exp_maps[igrn])
+        gvec_cs, rMat_ss = nfutil._grain_gvecs(experiment, angs,
+                                               experiment.rMat_c[igrn])
+        for crd in coords[grain_ids == igrn]:
+            xy = gvecToDetectorXYArray(gvec_cs, rD, rMat_ss,
+                                       experiment.rMat_c[igrn], tD, tS, crd)
+            ijk = np.floor(
+                (np.column_stack([xy, angs[:, 2]]) - experiment.base)
+                * experiment.inv_deltas)
+            on = np.all(np.isfinite(ijk), axis=1)
+            ijk = ijk[on].astype(int)
+            on = np.logical_and(np.all(ijk[:, :2] >= 0, axis=1),
+                                np.all(ijk[:, :2] < experiment.clip_vals,
+                                       axis=1))
+            x, y, z = ijk[on].T
+            image_stack[z, y, x] = True
+    return image_stack
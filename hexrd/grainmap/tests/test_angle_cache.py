@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .common import GrainMapTest, nfutil, make_experiment, make_controller
+
+
+class TestAngleCache(GrainMapTest):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, 'angles.h5')
+        self.experiment = make_experiment(n_grains=3)
+        self.controller = make_controller()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def same(self, a, b):
+        angs_a, precomp_a = a
+        angs_b, precomp_b = b
+        self.assertEqual(len(angs_a), len(angs_b))
+        for x, y in zip(angs_a, angs_b):
+            self.assertTrue(np.array_equal(x, y))
+        for x, y in zip(precomp_a, precomp_b):
+            self.assertTrue(np.array_equal(x, y))
+
+    def test_hits(self):
+        """Angle cache: second load hits every grain"""
+        expected = nfutil._grain_reflections(self.experiment, self.controller)
+
+        cache = nfutil.AngleCache(self.fname)
+        self.same(cache.load(self.experiment, self.controller), expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+        cache = nfutil.AngleCache(self.fname)
+        self.same(cache.load(self.experiment, self.controller), expected)
+        self.assertEqual((cache.hits, cache.misses), (3, 0))
+        self.assertEqual(os.listdir(self.tmpdir), ['angles.h5'])
+
+    def test_wavelength(self):
+        """Angle cache: changing the wavelength misses"""
+        nfutil.AngleCache(self.fname).load(self.experiment, self.controller)
+        pd = self.experiment.plane_data
+        pd.wavelength = 70.
+        cache = nfutil.AngleCache(self.fname)
+        cache.load(self.experiment, self.controller)
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+        # both setups are now in the file
+        cache = nfutil.AngleCache(self.fname)
+        cache.load(self.experiment, self.controller)
+        pd.wavelength = 71.676
+        cache.load(self.experiment, self.controller)
+        self.assertEqual((cache.hits, cache.misses), (6, 0))
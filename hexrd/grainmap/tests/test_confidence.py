@@ -0,0 +1,79 @@
+import numpy as np
+
+from hexrd.xrd.transforms_CAPI import gvecToDetectorXYArray
+
+from .common import (
+    GrainMapTest, nfutil, make_experiment, make_image_stack, make_coords,
+    make_controller, plant_grains
+)
+
+
+class TestConfidence(GrainMapTest):
+
+    def setUp(self):
+        e = make_experiment(n_grains=4)
+        self.experiment = e
+        self.coords = make_coords(n=60)
+        # background noise, plus grain i % 4 planted in the first 40 voxels
+        image = make_image_stack(e, fill=0.05)
+        ids = np.arange(40) % 4
+        self.image = plant_grains(e, image, self.coords[:40], ids)
+
+        controller = make_controller()
+        self.angles = nfutil.evaluate_diffraction_angles(e, controller)
+        self.precomp = nfutil._precompute_grains(e, self.angles, controller)
+
+    def reference(self):
+        """per-grain, per-voxel projection and confidence"""
+        e = self.experiment
+        rD = e.rMat_d
+        tD = e.tVec_d[:, 0]
+        tS = e.tVec_s[:, 0]
+        conf = np.zeros((e.n_grains, len(self.coords)))
+        for igrn, angs in enumerate(self.angles):
+            rC = e.rMat_c[igrn]
+            gvec_cs, rMat_ss = nfutil._grain_gvecs(e, angs, rC)
+            for icrd, crd in enumerate(self.coords):
+                det_xy = gvecToDetectorXYArray(gvec_cs, rD, rMat_ss, rC,
+                                               tD, tS, crd)
+                conf[igrn, icrd] = nfutil._quant_and_clip_confidence(
+                    det_xy, angs[:, 2], self.image, e.base, e.inv_deltas,
+                    e.clip_vals, e.bsw/2.)
+        return conf
+
+    def block(self, image, early_exit):
+        e = self.experiment
+        offsets, omes, rMat_ss, dvecs = self.precomp
+        n = len(self.coords)
+        best = np.zeros(n)
+        conf = np.empty((e.n_grains, n))
+        nfutil._grand_loop_block_serial(
+            self.coords, offsets, omes, rMat_ss, dvecs, e.rMat_d,
+            e.tVec_d[:, 0], e.tVec_s[:, 0], image,
+            image.dtype == np.uint8, e.base, e.inv_deltas, e.clip_vals,
+            e.bsw/2., early_exit, best, conf)
+        return conf, best
+
+    def test_block(self):
+        """Confidence: fused kernel matches projection + quant and clip"""
+        expected = self.reference()
+        # planted grains are found
+        self.assertTrue(np.all(
+            np.argmax(expected[:, :40], axis=0) == np.arange(40) % 4))
+        for image in (self.image, nfutil.pack_image_stack(self.image)):
+            conf, best = self.block(image, False)
+            self.assertTrue(np.allclose(conf, expected, rtol=0, atol=1e-12))
+            self.assertTrue(np.allclose(best, expected.max(axis=0)))
+
+    def test_early_exit(self):
+        """Confidence: early exit keeps the best grain and confidence"""
+        expected = self.reference()
+        conf, best = self.block(self.image, True)
+        self.assertTrue(np.array_equal(np.argmax(conf, axis=0),
+                                       np.argmax(expected, axis=0)))
+        self.assertTrue(np.allclose(conf.max(axis=0), expected.max(axis=0),
+                                    rtol=0, atol=1e-12))
+        self.assertTrue(np.allclose(best, expected.max(axis=0)))
+        # abandoned grains get an upper bound of their confidence
+        self.assertTrue(np.all(conf >= expected - 1e-12))
+        self.assertTrue(np.any(conf > expected))
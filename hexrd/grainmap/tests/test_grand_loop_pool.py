@@ -0,0 +1,31 @@
+from multiprocessing.pool import TERMINATE
+
+from .common import GrainMapTest, nfutil
+
+
+class TestGrandLoopPool(GrainMapTest):
+
+    def tearDown(self):
+        if hasattr(nfutil, '_multiprocessing_start_method'):
+            del nfutil._multiprocessing_start_method
+
+    def check_cleanup(self, method):
+        nfutil._multiprocessing_start_method = method
+        state = (10, None, None)
+        with self.assertRaises(ValueError):
+            with nfutil.grand_loop_pool(2, state) as pool:
+                raise ValueError
+        self.assertEqual(pool._state, TERMINATE)
+        self.assertFalse(hasattr(nfutil, '_mp_state'))
+
+    def test_thread(self):
+        """Grand loop pool: threads stopped on error"""
+        self.check_cleanup('thread')
+
+    def test_fork(self):
+        """Grand loop pool: processes stopped on error"""
+        self.check_cleanup('fork')
+
+    def test_spawn(self):
+        """Grand loop pool: spawned processes stopped on error"""
+        self.check_cleanup('spawn')
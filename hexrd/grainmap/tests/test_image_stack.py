@@ -0,0 +1,80 @@
+import numpy as np
+from scipy import ndimage
+
+from .common import GrainMapTest, nfutil
+
+NFRAMES, NROWS, NCOLS = 12, 40, 21
+
+
+def make_frames(seed=0):
+    """uint16 frames: a noisy background with a few bright spots"""
+    rng = np.random.RandomState(seed)
+    frames = rng.poisson(100, (NFRAMES, NROWS, NCOLS)).astype(np.uint16)
+    for n in range(60):
+        z = rng.randint(NFRAMES)
+        y = rng.randint(NROWS - 3)
+        x = rng.randint(NCOLS - 3)
+        frames[z, y:y + rng.randint(1, 4), x:x + rng.randint(1, 4)] += 500
+    return list(frames)
+
+
+def reference_dark(frames, num_for_dark, dark_type):
+    """the dark of a float stack of all the frames at once"""
+    dark_stack = np.array(frames[:num_for_dark], dtype=float)
+    if dark_type == 'median':
+        return np.median(dark_stack, axis=0)
+    return np.min(dark_stack, axis=0)
+
+
+def reference_stack(frames, dark, num_erosions, num_dilations,
+                    ome_dilation_iter, threshold):
+    """frames cleaned one by one, then the stack dilated as a whole"""
+    image_stack = np.zeros((len(frames), ) + frames[0].shape, dtype=bool)
+    for ii, frame in enumerate(frames):
+        binary = ndimage.binary_erosion(frame - dark > threshold,
+                                        iterations=num_erosions)
+        image_stack[ii] = ndimage.binary_dilation(binary,
+                                                  iterations=num_dilations)
+    return ndimage.binary_dilation(image_stack, iterations=ome_dilation_iter)
+
+
+class TestDark(GrainMapTest):
+
+    def test_matches_float_stack(self):
+        frames = make_frames()
+        for dark_type in ('median', 'min'):
+            expected = reference_dark(frames, 7, dark_type)
+            for threads in (1, 3):
+                dark = nfutil.gen_nf_dark_from_imageseries(
+                    frames, 7, dark_type=dark_type, threads=threads)
+                self.assertEqual(dark.dtype, float)
+                self.assertTrue(np.array_equal(dark, expected))
+
+    def test_bad_dark_type(self):
+        self.assertRaises(ValueError, nfutil.gen_nf_dark_from_imageseries,
+                          make_frames(), 4, dark_type='mean')
+
+
+class TestImageStack(GrainMapTest):
+
+    def test_matches_whole_stack_dilation(self):
+        frames = make_frames()
+        dark = reference_dark(frames, NFRAMES, 'median')
+        for ome_dilation_iter in (0, 1, 2, 3):
+            expected = reference_stack(frames, dark, 1, 2,
+                                       ome_dilation_iter, 150)
+            # dilating to convergence (0) fills the stack
+            self.assertTrue(expected.any())
+            if ome_dilation_iter > 0:
+                self.assertFalse(expected.all())
+            for packed in (False, True):
+                for threads in (1, 3):
+                    image_stack = nfutil.gen_nf_image_stack_from_imageseries(
+                        frames, dark, 1, 2, ome_dilation_iter, 150,
+                        packed=packed, threads=threads)
+                    if packed:
+                        self.assertEqual(image_stack.dtype, np.uint8)
+                        image_stack = nfutil.unpack_image_stack(image_stack,
+                                                                NCOLS)
+                    self.assertTrue(np.array_equal(image_stack, expected),
+                                    (ome_dilation_iter, packed, threads))
@@ -0,0 +1,41 @@
+import numpy as np
+
+from .common import (
+    GrainMapTest, nfutil, make_experiment, make_image_stack,
+    make_controller, plant_grains
+)
+
+
+class TestMultires(GrainMapTest):
+
+    def setUp(self):
+        e = make_experiment(n_grains=4)
+        self.experiment = e
+        crds, n, Xs, Ys, Zs = nfutil.gen_nf_test_grid_tomo(17, 17, (0., 0.),
+                                                           0.02)
+        self.coords = crds
+        self.grid_shape = Xs.shape
+
+        # two planted grains meeting on a slanted boundary, two absent ones
+        ids = (crds[:, 0] + 0.5*crds[:, 2] > 0.03).astype(int)
+        image = make_image_stack(e, fill=0.05)
+        self.image = plant_grains(e, image, crds, ids)
+        self.ids = ids
+        self.full = nfutil.test_orientations(self.image, e, crds,
+                                             make_controller(), 'fork')
+
+    def test_levels(self):
+        """Multires: tested pairs exact, same best grain as full search"""
+        self.assertTrue(np.array_equal(np.argmax(self.full, axis=0),
+                                       self.ids))
+        for levels in (1, 2, 3):
+            conf = nfutil.test_orientations_multires(
+                self.image, self.experiment, self.coords, self.grid_shape,
+                make_controller(), levels=levels, top_k=2)
+            tested = conf > 0.
+            self.assertTrue(np.array_equal(conf[tested],
+                                           self.full[tested]))
+            self.assertTrue(np.array_equal(np.argmax(conf, axis=0),
+                                           np.argmax(self.full, axis=0)))
+            # not every pair was tested
+            self.assertTrue(np.count_nonzero(tested) < tested.size)
@@ -0,0 +1,50 @@
+import numpy as np
+from scipy import ndimage
+
+from .common import GrainMapTest, nfutil
+
+
+def sparse_stack(ncols, seed=0, fill=0.02):
+    rng = np.random.RandomState(seed)
+    stack = rng.uniform(size=(7, 9, ncols)) < fill
+    # pixels on both sides of every byte boundary and in the last column
+    stack[3, 4, 7::8] = True
+    stack[5, 2, 8::8] = True
+    stack[1, 6, -1] = True
+    return stack
+
+
+class TestPackedStack(GrainMapTest):
+
+    def test_pack_round_trip(self):
+        for ncols in (13, 16, 21):
+            stack = sparse_stack(ncols, fill=0.5)
+            packed = nfutil.pack_image_stack(stack)
+            self.assertEqual(packed.shape, (7, 9, (ncols + 7)//8))
+            self.assertTrue(np.array_equal(
+                nfutil.unpack_image_stack(packed, ncols), stack))
+
+    def test_dilation_matches_scipy(self):
+        for ncols in (13, 16, 21):
+            for seed in range(3):
+                stack = sparse_stack(ncols, seed=seed)
+                packed = nfutil.pack_image_stack(stack)
+                for iterations in (1, 2, 0):
+                    expected = ndimage.binary_dilation(stack,
+                                                       iterations=iterations)
+                    dilated = nfutil.dilate_packed_stack(packed, iterations,
+                                                         ncols)
+                    # compared packed, so stray bits past the last column
+                    # count as differences
+                    self.assertTrue(np.array_equal(
+                        dilated, nfutil.pack_image_stack(expected)),
+                        (ncols, seed, iterations))
+                # the input is left alone
+                self.assertTrue(np.array_equal(
+                    nfutil.unpack_image_stack(packed, ncols), stack))
+
+    def test_empty_stack(self):
+        packed = np.zeros((3, 4, 2), dtype=np.uint8)
+        for iterations in (1, 0):
+            self.assertFalse(
+                nfutil.dilate_packed_stack(packed, iterations, 13).any())
@@ -0,0 +1,90 @@
+import copy
+
+import numpy as np
+
+from hexrd.xrd import distortion as dFuncs
+from hexrd.xrd.transforms_CAPI import makeDetectorRotMat
+
+from .common import (
+    GrainMapTest, nfutil, make_experiment, make_image_stack, make_coords,
+    make_controller, plant_grains
+)
+
+SLICE_SHAPE = (5, 8)
+
+
+class TestScanDetectorParm(GrainMapTest):
+
+    def setUp(self):
+        e = make_experiment(n_grains=3, nframes=60, npix=192)
+        self.experiment = e
+        self.coords = make_coords(n=np.prod(SLICE_SHAPE))
+        image = make_image_stack(e, fill=0.05)
+        ids = np.arange(len(self.coords)) % 3
+        self.image = plant_grains(e, image, self.coords, ids)
+        self.tilt = e.detector_params[:3]
+
+    def reference(self, rMat_d, tVec_d):
+        """best confidence of test_orientations on a moved detector"""
+        trial = copy.copy(self.experiment)
+        trial.rMat_d = rMat_d
+        trial.tVec_d = np.reshape(tVec_d, (3, 1))
+        conf = nfutil.test_orientations(self.image, trial, self.coords,
+                                        make_controller(), 'fork')
+        return conf.max(axis=0).reshape(SLICE_SHAPE)
+
+    def scan(self, parm_to_opt, parm_vector, ncpus=1):
+        return nfutil.scan_detector_parm(
+            self.image, self.experiment, self.coords,
+            make_controller(ncpus=ncpus, chunk_size=15),
+            parm_to_opt, parm_vector, SLICE_SHAPE)
+
+    def test_distance(self):
+        """Detector scan: 1-d distance scan matches test_orientations"""
+        e = self.experiment
+        distances = e.tVec_d[2, 0] + np.r_[-0.02, 0., 0.02]
+        expected = []
+        for distance in distances:
+            tVec_d = e.tVec_d[:, 0].copy()
+            tVec_d[2] = distance
+            expected.append(self.reference(e.rMat_d, tVec_d))
+        # the planted grains fit the unmoved detector best
+        self.assertTrue(expected[1].mean() > expected[0].mean())
+        for ncpus in (1, 2):
+            found = self.scan(0, distances, ncpus=ncpus)
+            self.assertEqual(found.shape, (3, ) + SLICE_SHAPE)
+            for jj in range(3):
+                self.assertTrue(np.array_equal(found[jj], expected[jj]))
+
+    def test_tilt_and_center(self):
+        """Detector scan: 2-d y tilt and x center scan"""
+        e = self.experiment
+        ytilts = self.tilt[1] + np.r_[-0.002, 0.002]
+        centers = e.tVec_d[0, 0] + np.r_[-0.01, 0., 0.01]
+        for ncpus in (1, 2):
+            found = self.scan([3, 1], [ytilts, centers], ncpus=ncpus)
+            self.assertEqual(found.shape, (2, 3) + SLICE_SHAPE)
+            for ii, ytilt in enumerate(ytilts):
+                rMat_d = makeDetectorRotMat([self.tilt[0], ytilt,
+                                             self.tilt[2]])
+                for jj, center in enumerate(centers):
+                    tVec_d = e.tVec_d[:, 0].copy()
+                    tVec_d[0] = center
+                    self.assertTrue(np.array_equal(
+                        found[ii, jj], self.reference(rMat_d, tVec_d)))
+
+    def test_distortion(self):
+        """Detector scan: trials go through the distortion"""
+        e = self.experiment
+        e.distortion = (dFuncs.GE_41RT,
+                        [2., -1., 3., 1.0, 1.0, 1.0])
+        ztilts = self.tilt[2] + np.r_[0., 0.003]
+        found = self.scan(4, ztilts)
+        for jj, ztilt in enumerate(ztilts):
+            rMat_d = makeDetectorRotMat([self.tilt[0], self.tilt[1], ztilt])
+            self.assertTrue(np.array_equal(
+                found[jj], self.reference(rMat_d, e.tVec_d)))
+
+    def test_bad_parameter(self):
+        self.assertRaises(ValueError, self.scan, 5, [0.])
+        self.assertRaises(ValueError, self.scan, [0, 1], [[0.]])
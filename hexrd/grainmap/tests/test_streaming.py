@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+
+from .common import (
+    GrainMapTest, nfutil, make_experiment, make_image_stack, make_coords,
+    make_controller, plant_grains
+)
+
+
+class TestStreaming(GrainMapTest):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        e = make_experiment(n_grains=5)
+        self.experiment = e
+        self.coords = make_coords(n=90)
+        image = make_image_stack(e, fill=0.05)
+        ids = np.arange(60) % 3
+        self.image = plant_grains(e, image, self.coords[:60], ids)
+        self.full = nfutil.test_orientations(
+            self.image, e, self.coords, make_controller(chunk_size=17),
+            'fork')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check(self, ncpus):
+        fname = os.path.join(self.tmpdir, 'confidence.h5')
+        id_remap = np.array([40, 12, 7, 31, 3])
+        handler = nfutil.streaming_result_handler(fname, top_k=3,
+                                                  id_remap=id_remap)
+        controller = make_controller(handler, ncpus=ncpus, chunk_size=17)
+        result = nfutil.test_orientations(self.image, self.experiment,
+                                          self.coords, controller, 'fork')
+        self.assertIsNone(result)
+        handler.close()
+
+        full = self.full
+        order = np.argsort(-full, axis=0, kind='mergesort')[:3]
+        expected = dict(
+            max_confidence=full.max(axis=0),
+            best_grain=np.argmax(full, axis=0),
+            top_grains=order,
+            top_confidence=np.take_along_axis(full, order, axis=0))
+        for name, value in expected.iteritems():
+            self.assertTrue(np.array_equal(getattr(handler, name), value))
+        with h5py.File(fname, 'r') as f:
+            self.assertTrue(np.array_equal(f['raw_confidence'][()], full))
+            for name, value in expected.iteritems():
+                self.assertTrue(np.array_equal(f[name][()], value))
+            self.assertTrue(np.array_equal(f['id_remap'][()], id_remap))
+
+    def test_single(self):
+        """Streaming: chunked reductions equal those of the full matrix"""
+        self.check(1)
+
+    def test_no_id_remap(self):
+        """Streaming: no id_remap dataset unless one is given"""
+        fname = os.path.join(self.tmpdir, 'confidence.h5')
+        handler = nfutil.streaming_result_handler(fname)
+        handler.handle_result('confidence', self.full)
+        handler.close()
+        with h5py.File(fname, 'r') as f:
+            self.assertFalse('id_remap' in f)
+
+    def test_pool(self):
+        """Streaming: chunks arriving out of order from a pool"""
+        self.check(2)
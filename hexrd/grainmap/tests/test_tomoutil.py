@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import imageio as imgio
+import numpy as np
+from scipy import ndimage
+
+from hexrd.grainmap import tomoutil
+
+
+def reference_clean(reconstruction_fbp, recon_thresh, noise_obj_size,
+                    min_hole_size):
+    """the per-label loops, over all the labels"""
+    binary_recon = reconstruction_fbp > recon_thresh
+    binary_recon = ndimage.binary_erosion(binary_recon, iterations=1)
+    binary_recon = ndimage.binary_dilation(binary_recon, iterations=4)
+
+    labeled_img, num_labels = ndimage.label(binary_recon)
+    for ii in range(1, num_labels + 1):
+        obj1 = np.where(labeled_img == ii)
+        if obj1[0].shape[0] < noise_obj_size:
+            binary_recon[obj1[0], obj1[1]] = 0
+
+    labeled_img, num_labels = ndimage.label(binary_recon != 1)
+    for ii in range(1, num_labels + 1):
+        obj1 = np.where(labeled_img == ii)
+        if obj1[0].shape[0] >= 1 and obj1[0].shape[0] < min_hole_size:
+            binary_recon[obj1[0], obj1[1]] = 1
+    return binary_recon
+
+
+def make_layer():
+    """a disc with two holes, and noise specks; the last speck and the
+    last hole in raster order are small"""
+    y, x = np.mgrid[:120, :120]
+    layer = np.zeros((120, 120))
+    layer[(y - 50)**2 + (x - 50)**2 < 35**2] = 1.
+    layer[(y - 30)**2 + (x - 40)**2 < 8**2] = 0.      # big hole
+    layer[(y - 72)**2 + (x - 62)**2 < 6**2] = 0.      # small hole, last
+    layer[5:8, 100:103] = 1.                          # speck
+    layer[110:113, 110:113] = 1.                      # speck, last
+    return layer
+
+
+class TestCleanTomoLayer(unittest.TestCase):
+
+    def test_small_objects(self):
+        rng = np.random.RandomState(0)
+        mask = rng.uniform(size=(60, 70)) < 0.4
+        labeled_img, num_labels = ndimage.label(mask)
+        for min_size in (1, 2, 5, 20):
+            expected = np.zeros_like(mask)
+            for ii in range(1, num_labels + 1):
+                obj = labeled_img == ii
+                if np.count_nonzero(obj) < min_size:
+                    expected |= obj
+            self.assertTrue(np.array_equal(
+                tomoutil._small_objects(mask, min_size), expected))
+
+    def test_clean(self):
+        layer = make_layer()
+        cleaned = tomoutil.threshold_and_clean_tomo_layer(layer, 0.5, 300,
+                                                          50)
+        self.assertTrue(np.array_equal(
+            cleaned, reference_clean(layer, 0.5, 300, 50)))
+        # both specks go, the small hole is closed, the big one stays
+        self.assertFalse(cleaned[111, 111])
+        self.assertFalse(cleaned[6, 101])
+        self.assertTrue(cleaned[72, 62])
+        self.assertFalse(cleaned[30, 40])
+
+
+class TestTomoLayers(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_attenuation_rads(self):
+        # 16-bit png, as tiff writing needs concurrent.futures on python 2
+        rng = np.random.RandomState(0)
+        tbf = rng.uniform(900, 1000, (6, 16))
+        imgs = (tbf*rng.uniform(0.2, 0.9, (10, 6, 16))).astype(np.uint16)
+        for ii, image in enumerate(imgs):
+            imgio.imwrite(os.path.join(self.tmpdir, 'nf_%05d.png' % (ii + 3)),
+                          image)
+        for threads in (1, 3):
+            rads = tomoutil.gen_attenuation_rads(
+                self.tmpdir + os.sep, tbf, 3, 10, 6, 16, ext='.png',
+                rows=[1, 4], threads=threads)
+            self.assertEqual(rads.dtype, np.float32)
+            expected = -np.log(imgs[:, [1, 4]].astype(np.float32)
+                               / tbf[[1, 4]].astype(np.float32))
+            self.assertTrue(np.array_equal(rads, expected))
+
+    def test_reconstruct_layers(self):
+        rng = np.random.RandomState(0)
+        rad_stack = rng.uniform(0, 1, (36, 4, 64)).astype(np.float32)
+        kwargs = dict(start_tomo_ang=0., end_tomo_ang=180., tomo_num_imgs=36,
+                      center=0., pixel_size=1.)
+        layers = tomoutil.tomo_reconstruct_layers(rad_stack, 40., [0, 2, 3],
+                                                  threads=2, **kwargs)
+        self.assertEqual(layers.dtype, np.float32)
+        for ii, row in enumerate([0, 2, 3]):
+            layer = tomoutil.tomo_reconstruct_layer(rad_stack, 40.,
+                                                    layer_row=row, **kwargs)
+            self.assertTrue(np.array_equal(layers[ii],
+                                           layer.astype(np.float32)))
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from hexrd.grainmap import vtkutil
+
+from .common import GrainMapTest, nfutil
+
+SCAN_SHAPE = (2, 3, 4)
+
+
+def write_scans(data_location, stems, seed=0):
+    """small grain map npz files, as saved by nfutil.save_nf_data"""
+    rng = np.random.RandomState(seed)
+    Zs, Ys, Xs = np.meshgrid(0.01*np.arange(SCAN_SHAPE[0]),
+                             0.02*np.arange(SCAN_SHAPE[1]),
+                             0.03*np.arange(SCAN_SHAPE[2]), indexing='ij')
+    for stem in stems:
+        np.savez(os.path.join(data_location, stem + '_grain_map_data.npz'),
+                 grain_map=rng.randint(-1, 5, SCAN_SHAPE),
+                 confidence_map=rng.uniform(0, 1, SCAN_SHAPE),
+                 Xs=Xs + rng.uniform(0, 0.1), Ys=Ys, Zs=Zs)
+
+
+def read_ascii_vtk(fname):
+    """points, grain ids and confidences of an output_grain_map_vtk file"""
+    with open(fname) as f:
+        lines = f.read().splitlines()
+    for ii, line in enumerate(lines):
+        words = line.split()
+        if words[:1] == ['POINTS']:
+            n = int(words[1])
+            points = np.loadtxt(lines[ii + 1:ii + 1 + n])
+        elif words[:2] == ['SCALARS', 'grain_id']:
+            ids = np.loadtxt(lines[ii + 2:ii + 2 + n], dtype=int)
+        elif words[:1] == ['confidence']:
+            conf = np.loadtxt(lines[ii + 1:ii + 1 + n])
+    return points, ids, conf
+
+
+def read_binary_vtk(fname):
+    """dimensions and arrays of a stream_grain_map_vtk file"""
+    with open(fname, 'rb') as f:
+        data = f.read()
+    arrays = {}
+    pos = 0
+    while pos < len(data):
+        end = data.index('\n', pos)
+        words = data[pos:end].split()
+        pos = end + 1
+        if words[:1] == ['DIMENSIONS']:
+            arrays['dimensions'] = [int(w) for w in words[1:]]
+        elif words[:1] == ['POINTS']:
+            n = int(words[1])
+            arrays['points'] = np.frombuffer(data, '>f4', 3*n,
+                                             pos).reshape(n, 3)
+            pos += 12*n
+        elif words[:1] == ['SCALARS']:
+            # skip the LOOKUP_TABLE line
+            pos = data.index('\n', pos) + 1
+            dtype = '>i4' if words[2] == 'int' else '>f4'
+            arrays[words[1]] = np.frombuffer(data, dtype, n, pos)
+            pos += 4*n
+    return arrays
+
+
+class TestStreamGrainMapVTK(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.stems = ['scan_a', 'scan_b']
+        write_scans(self.tmpdir, self.stems)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_matches_ascii(self):
+        """VTK: binary stream gives the points and data of the ASCII file"""
+        for top_down in (True, False):
+            vtkutil.output_grain_map_vtk(self.tmpdir, self.stems, 'ascii',
+                                         0.5, top_down=top_down)
+            vtkutil.stream_grain_map_vtk(self.tmpdir, self.stems, 'binary',
+                                         0.5, top_down=top_down)
+            points, ids, conf = read_ascii_vtk(
+                os.path.join(self.tmpdir, 'ascii_stitch.vtk'))
+            found = read_binary_vtk(
+                os.path.join(self.tmpdir, 'binary_stitch.vtk'))
+
+            nlayers, nrows, ncols = SCAN_SHAPE
+            self.assertEqual(found['dimensions'], [ncols, nrows, 2*nlayers])
+            self.assertEqual(len(ids), 2*np.prod(SCAN_SHAPE))
+            self.assertTrue(np.allclose(found['points'], points, rtol=1e-6,
+                                        atol=0.))
+            self.assertTrue(np.array_equal(found['grain_id'], ids))
+            self.assertTrue(np.allclose(found['confidence'], conf,
+                                        rtol=1e-6, atol=0.))
+            # the second scan in the file is raised by vol_spacing
+            self.assertTrue(np.allclose(
+                points[len(ids)//2:, 1] - points[:len(ids)//2, 1], 0.5))
+
+
+class TestRemapGrainIds(GrainMapTest):
+
+    def test_remap(self):
+        """Remap: every id goes through the table, -1 is kept"""
+        grain_map = np.array([[0, 3, -1], [2, 1, 3]])
+        id_remap = np.array([10, 11, 12, 13])
+        remapped = nfutil.remap_grain_ids(grain_map, id_remap)
+        self.assertTrue(np.array_equal(remapped,
+                                       [[10, 13, -1], [12, 11, 13]]))
+        # the input is left alone
+        self.assertEqual(grain_map[0, 1], 3)
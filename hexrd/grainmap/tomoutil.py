@@ -2,6 +2,7 @@
 
 import numpy as np
 import scipy as sp
+from multiprocessing.pool import ThreadPool
 
 import scipy.ndimage as img
 import imageio as imgio
@@ -35,29 +36,45 @@ def gen_bright_field(tbf_data_folder,tbf_img_start,tbf_num_imgs,nrows,ncols,stem
     return tbf
     
     
-def gen_attenuation_rads(tomo_data_folder,tbf,tomo_img_start,tomo_num_imgs,nrows,ncols,stem='nf_',num_digits=5,ext='.tif'):
-    
-    
-    
+def gen_attenuation_rads(tomo_data_folder,tbf,tomo_img_start,tomo_num_imgs,nrows,ncols,stem='nf_',num_digits=5,ext='.tif',
+                         rows=None,threads=1):
+    """float32 absorption radiographs, -log(image/bright field)
+
+    rows -- the detector rows to keep, all if None. Each image is reduced to
+            these rows as it is read, so only the rows needed for the
+            layers to reconstruct are ever held.
+    threads -- number of threads reading and converting the images
+    """
     #Reconstructs a single tompgrahy layer to find the extent of the sample
     tomo_img_nums=np.arange(tomo_img_start,tomo_img_start+tomo_num_imgs,1)
-    
-    
-    rad_stack=np.zeros([tomo_num_imgs,nrows,ncols])
-    
-    print('Loading and Calculating Absorption Radiographs ...')
-    for ii in np.arange(tomo_num_imgs):
-        print('Image #: ' + str(ii))
+    if rows is None:
+        rows=np.arange(nrows)
+    rows=np.atleast_1d(rows)
+    tbf=tbf[rows].astype(np.float32)
+
+    def load(ii):
         tmp_img=imgio.imread(tomo_data_folder+'%s'%(stem)+str(tomo_img_nums[ii]).zfill(num_digits)+ext)
-        
-        rad_stack[ii,:,:]=-np.log(tmp_img.astype(float)/tbf.astype(float))
-        
+        return -np.log(tmp_img[rows].astype(np.float32)/tbf)
+
+    rad_stack=np.zeros([tomo_num_imgs,len(rows),ncols],dtype=np.float32)
+
+    print('Loading and Calculating Absorption Radiographs ...')
+    pool=ThreadPool(threads)
+    try:
+        for ii,rad in enumerate(pool.imap(load,range(tomo_num_imgs))):
+            rad_stack[ii]=rad
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
     return rad_stack
-        
-        
-def tomo_reconstruct_layer(rad_stack,cross_sectional_dim,layer_row=1024,start_tomo_ang=0., end_tomo_ang=360.,tomo_num_imgs=360, center=0.,pixel_size=0.00148):
-    sinogram=np.squeeze(rad_stack[:,layer_row,:])
 
+
+def _reconstruct_sinogram(sinogram,cross_sectional_dim,start_tomo_ang,end_tomo_ang,tomo_num_imgs,center,pixel_size):
     rotation_axis_pos=-int(np.round(center/pixel_size))
     #rotation_axis_pos=13
     
@@ -74,13 +91,58 @@ def tomo_reconstruct_layer(rad_stack,cross_sectional_dim,layer_row=1024,start_to
     
     sinogram_cut=sinogram_cut[:,dist_from_edge:-dist_from_edge]
     
-    print('Inverting Sinogram....')
     reconstruction_fbp = iradon(sinogram_cut.T, theta=theta, circle=True)
     
     reconstruction_fbp=np.rot90(reconstruction_fbp,3)#Rotation to get the result consistent with hexrd, needs to be checked
     
     return reconstruction_fbp
-    
+
+
+def tomo_reconstruct_layer(rad_stack,cross_sectional_dim,layer_row=1024,start_tomo_ang=0., end_tomo_ang=360.,tomo_num_imgs=360, center=0.,pixel_size=0.00148):
+    sinogram=np.squeeze(rad_stack[:,layer_row,:])
+
+    print('Inverting Sinogram....')
+    return _reconstruct_sinogram(sinogram,cross_sectional_dim,start_tomo_ang,end_tomo_ang,tomo_num_imgs,center,pixel_size)
+    
+
+def tomo_reconstruct_layers(rad_stack,cross_sectional_dim,layer_rows,start_tomo_ang=0., end_tomo_ang=360.,tomo_num_imgs=360, center=0.,pixel_size=0.00148,
+                            threads=1):
+    """tomo_reconstruct_layer for several rows of rad_stack, in parallel
+
+    Returns a float32 array (len(layer_rows), n, n).
+    """
+    layer_rows=np.atleast_1d(layer_rows)
+
+    def reconstruct(layer_row):
+        return _reconstruct_sinogram(rad_stack[:,layer_row,:],cross_sectional_dim,start_tomo_ang,end_tomo_ang,tomo_num_imgs,center,pixel_size)
+
+    print('Inverting %d Sinograms....'%(len(layer_rows)))
+    pool=ThreadPool(threads)
+    try:
+        layers=None
+        for ii,layer in enumerate(pool.imap(reconstruct,layer_rows)):
+            if layers is None:
+                layers=np.empty((len(layer_rows),)+layer.shape,dtype=np.float32)
+            layers[ii]=layer
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    return layers
+
+
+def _small_objects(mask,min_size):
+    """mask of the connected objects of mask with fewer than min_size pixels"""
+    labeled_img,num_labels=img.label(mask)
+    sizes=np.bincount(labeled_img.ravel(),minlength=num_labels+1)
+    small=sizes<min_size
+    small[0]=False  # background
+    return small[labeled_img]
+
 
 def threshold_and_clean_tomo_layer(reconstruction_fbp,recon_thresh, noise_obj_size,min_hole_size,edge_cleaning_iter=None):
     binary_recon=reconstruction_fbp>recon_thresh
@@ -90,24 +152,12 @@ def threshold_and_clean_tomo_layer(reconstruction_fbp,recon_thresh, noise_obj_si
     binary_recon=img.morphology.binary_dilation(binary_recon,iterations=4)
 
     
-    labeled_img,num_labels=img.label(binary_recon)
-    
     print('Cleaning...')
     print('Removing Noise...')
-    for ii in np.arange(1,num_labels):
-        obj1=np.where(labeled_img==ii)
-        if obj1[0].shape[0]<noise_obj_size:
-            binary_recon[obj1[0],obj1[1]]=0
-    
-    
-    labeled_img,num_labels=img.label(binary_recon!=1)
-    
+    binary_recon[_small_objects(binary_recon,noise_obj_size)]=0
+
     print('Closing Holes...')
-    for ii in np.arange(1,num_labels):
-    
-        obj1=np.where(labeled_img==ii)
-        if obj1[0].shape[0]>=1 and obj1[0].shape[0]<min_hole_size:
-            binary_recon[obj1[0],obj1[1]]=1
+    binary_recon[_small_objects(~binary_recon,min_hole_size)]=1
 
 
     if edge_cleaning_iter is not None:
@@ -123,4 +123,61 @@ def output_grain_map_vtk(data_location,data_stems,output_stem,vol_spacing,top_do
         f.write('%e \n' %(conflist[i]))  
         
     
-    f.close()
\ No newline at end of file
+    f.close()
+
+
+def _stitched_scans(data_location,data_stems,top_down):
+    """(file, y offset index) of the scans, bottom layer first"""
+    num_scans=len(data_stems)
+    order=np.arange(num_scans)
+    if top_down==True:
+        order=order[::-1]
+    return [(os.path.join(data_location,data_stems[ii]+'_grain_map_data.npz'),i) for i,ii in enumerate(order)]
+
+
+def stream_grain_map_vtk(data_location,data_stems,output_stem,vol_spacing,top_down=True):
+    """output_grain_map_vtk as a binary structured grid, layer by layer
+
+    Writes the same points and data as output_grain_map_vtk, in a binary
+    legacy VTK file (big endian, float32 coordinates and confidence, int32
+    grain ids). The grid is structured, so no cells are written, and only
+    one array of one scan is loaded at a time.
+    """
+    scans=_stitched_scans(data_location,data_stems,top_down)
+
+    #assumes all volumes to be the same size
+    num_layers,num_rows,num_cols=np.load(scans[0][0])['grain_map'].shape
+    total_layers=num_layers*len(scans)
+    num_pts=total_layers*num_rows*num_cols
+
+    def layers(key):
+        for fname,i in scans:
+            print('Loading %s from %s ....'%(key,fname))
+            data=np.load(fname)[key]
+            if key=='Ys':
+                data=data+vol_spacing*i
+            for layer in data:
+                yield layer
+
+    print('Writing VTK data...')
+    with open(os.path.join(data_location, output_stem +'_stitch.vtk'), 'wb') as f:
+        f.write('# vtk DataFile Version 3.0\n')
+        f.write('grainmap Data\n')
+        f.write('BINARY\n')
+        f.write('DATASET STRUCTURED_GRID\n')
+        f.write('DIMENSIONS %d %d %d\n' % (num_cols, num_rows, total_layers))
+        f.write('POINTS %d float\n' % (num_pts))
+        for xs,ys,zs in zip(layers('Xs'),layers('Ys'),layers('Zs')):
+            np.dstack([xs,ys,zs]).astype('>f4').tofile(f)
+
+        f.write('\nPOINT_DATA %d\n' % (num_pts))
+        f.write('SCALARS grain_id int 1\n')
+        f.write('LOOKUP_TABLE default\n')
+        for layer in layers('grain_map'):
+            layer.astype('>i4').tofile(f)
+
+        f.write('\nSCALARS confidence float 1\n')
+        f.write('LOOKUP_TABLE default\n')
+        for layer in layers('confidence_map'):
+            layer.astype('>f4').tofile(f)
+        f.write('\n')
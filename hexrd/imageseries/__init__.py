@@ -9,7 +9,10 @@
 from . import load
 from . import save
 from . import stats
+from . import dark
 from . import process
+from . import sparse
+from . import tileindex
 from . import omega
 
 def open(filename, format=None, **kwargs):
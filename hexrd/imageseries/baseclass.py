@@ -28,6 +28,16 @@ def __len__(self):
     def __iter__(self):
         return self._adapter.__iter__()
 
+    def gather(self, key, rows, cols):
+        """values of frame *key* at pixels (*rows*, *cols*)
+
+        Sparse adapters provide this without making the full frame.
+        """
+        adapter = getattr(self, '_adapter', None)
+        if hasattr(adapter, 'gather'):
+            return adapter.gather(key, rows, cols)
+        return self[key][rows, cols]
+
     @property
     def dtype(self):
         return self._adapter.dtype
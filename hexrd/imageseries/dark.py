@@ -0,0 +1,133 @@
+"""Dark frame and dead pixel estimation for imageseries
+
+Frames are read once into a buffer of whole-frame row bands (several
+passes are needed only if the frames do not fit in the stats buffer), and
+each band is reduced with vectorized operations on the frame axis. The
+bands are reduced in a thread pool since numpy sorting releases the GIL.
+"""
+from __future__ import print_function
+
+import logging
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from scipy import ndimage
+
+from hexrd.imageseries import stats
+
+
+def dark(ims, nframes=0, cut_min_factor=None,
+         median_size=None, median_range=(-15, 15),
+         max_resolution=None, threads=1):
+    """dark frame, dead pixels and noise statistics for an imageseries
+
+    *ims* - an imageseries of dark (empty) frames
+    *nframes* - number of frames to use; 0 means all
+    *cut_min_factor* - if given, the dark value of a pixel is the median of
+                       its values below (min value)*cut_min_factor
+    *median_size* - if given, size of a median filter; pixels whose dark
+                    value differs from the filtered one by more than
+                    *median_range* are marked dead
+    *max_resolution* - if given, pixels whose intensity resolution (the
+                       smallest nonzero difference between their values)
+                       exceeds this are marked dead
+    *threads* - number of threads reducing row bands
+
+    returns dark, dead, std, resolution: dark image (in the imageseries
+    dtype), boolean dead pixel mask, standard deviation and intensity
+    resolution images
+
+    Pixels with zero standard deviation are always marked dead.
+    """
+    nf = stats._nframes(ims, nframes)
+    (nr, nc) = ims.shape
+    dt = ims.dtype
+
+    img = np.zeros((nr, nc), dtype=dt)
+    std = np.zeros((nr, nc))
+    res = np.zeros((nr, nc))
+
+    nrpb = stats._rows_in_buffer(nc, nf*nc*dt.itemsize)
+    pool = ThreadPool(threads) if threads > 1 else None
+    try:
+        for rr in stats._row_ranges(nr, nrpb):
+            buf = np.empty((nf, rr[1] - rr[0], nc), dtype=dt)
+            for i in range(nf):
+                logging.info('frame: %s', i)
+                buf[i] = ims[i][rr[0]:rr[1], :]
+            bands = [(buf[:, r0:r1, :], r0 + rr[0], r1 + rr[0])
+                     for r0, r1 in _bands(rr[1] - rr[0], threads)]
+
+            def reduce_band(band):
+                b, r0, r1 = band
+                img[r0:r1], std[r0:r1], res[r0:r1] = \
+                    _reduce(b, cut_min_factor)
+
+            if pool is None:
+                for band in bands:
+                    reduce_band(band)
+            else:
+                pool.map(reduce_band, bands)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    dead = std == 0.
+    logging.info('number of dead pixels with 0 std : %d', np.sum(dead))
+
+    if median_size is not None:
+        diff = img.astype(float) - ndimage.median_filter(img, size=median_size)
+        dead |= (diff < median_range[0]) | (diff > median_range[1])
+        logging.info('number of dead pixels after median filter: %d',
+                     np.sum(dead))
+
+    if max_resolution is not None:
+        dead |= res > max_resolution
+
+    return img, dead, std, res
+
+#
+# ==================== Utilities
+#
+def _bands(n, m):
+    """split n rows in (at most) m row ranges of nearly equal size"""
+    edges = np.linspace(0, n, min(max(m, 1), n) + 1).astype(int)
+    return zip(edges[:-1], edges[1:])
+
+
+def _reduce(b, cut_min_factor):
+    """clipped median, std and resolution along the first axis of b
+
+    *b* is sorted in place.
+    """
+    nf = len(b)
+
+    # std, accumulated one frame at a time to avoid a float copy of b
+    mean = np.sum(b, axis=0, dtype=float)/nf
+    var = np.zeros(mean.shape)
+    for frame in b:
+        var += (frame - mean)**2
+    std = np.sqrt(var/nf)
+
+    b.sort(axis=0)
+
+    # median of the values below the cut; as b is sorted these are the
+    # first n values of each pixel
+    if cut_min_factor is None:
+        n = np.full(mean.shape, nf, dtype=int)
+    else:
+        n = np.sum(b < b[0]*cut_min_factor, axis=0)
+        # no values below the cut: use the minimum
+        n[n == 0] = 1
+    ii, jj = np.indices(mean.shape)
+    med = 0.5*(b[(n - 1)//2, ii, jj].astype(float) + b[n//2, ii, jj])
+
+    # resolution: smallest nonzero step between sorted values
+    res = np.full(mean.shape, np.inf)
+    for k in range(1, nf):
+        step = b[k].astype(float) - b[k - 1]
+        np.minimum(res, np.where(step > 0, step, np.inf), out=res)
+    res[np.isinf(res)] = 0.
+
+    return med.astype(b.dtype), std, res
@@ -120,6 +120,11 @@ def shape(self):
     def __getitem__(self, key):
         return self._framelist[key].toarray()
 
+    def gather(self, key, rows, cols):
+        """values of frame *key* at pixels (*rows*, *cols*)"""
+        return np.asarray(self._framelist[key][rows, cols]).reshape(
+            np.shape(rows))
+
     def __iter__(self):
         return ImageSeriesIterator(self)
 
@@ -2,6 +2,12 @@
 """
 import h5py
 
+try:
+    # registers the blosc filter for compressed series
+    import hdf5plugin
+except ImportError:
+    pass
+
 from . import ImageSeriesAdapter
 from ..imageseriesiter import ImageSeriesIterator
 
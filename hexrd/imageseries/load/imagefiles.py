@@ -6,6 +6,7 @@
 import os
 import logging
 import glob
+from multiprocessing.pool import ThreadPool
 
 # # Put this before fabio import and reset level if you
 # # want to control its import warnings.
@@ -32,6 +33,12 @@ def __init__(self, fname, **kwargs):
         *kwargs* - keyword arguments
                  . 'files' = a list of image files
                  . 'metadata' = a dictionary
+
+        The yaml options section may also set:
+                 . 'lazy' = read only file headers on open; frames are then
+                   read on demand
+                 . 'scan-threads' = number of threads scanning files
+                 . 'index' = name of a sidecar file caching the scan results
         """
         self._fname = fname
         self._load_yml()
@@ -50,8 +57,15 @@ def __getitem__(self, key):
             img = fabio.open(imgf)
         else:
             (fnum, frame) = self._file_and_frame(key)
-            fimg = self.infolist[fnum].fabioimage
-            img = fimg.getframe(frame)
+            imgf = self.infolist[fnum].filename
+            img = self.infolist[fnum].getframe(frame)
+
+        # in lazy mode, or from an index, the shape was not read from
+        # this file's data
+        if img.data.shape != self._shape:
+            msg = "frame %s of %s has shape %s, expected %s" % (
+                key, imgf, img.data.shape, self._shape)
+            raise ValueError(msg)
 
         return img.data
 
@@ -74,6 +88,9 @@ def _load_yml(self):
         EMPTY = 'empty-frames'
         MAXTOTF = 'max-total-frames'
         MAXFILF = 'max-file-frames'
+        LAZY = 'lazy'
+        THREADS = 'scan-threads'
+        INDEX = 'index'
 
         with open(self._fname, "r") as f:
             d = yaml.load(f)
@@ -84,24 +101,29 @@ def _load_yml(self):
         for g in fglob.split():
             self._files += glob.glob(os.path.join(dname, g))
 
-        self.optsd = d['options'] if 'options' else None
+        self.optsd = d['options'] if 'options' in d else {}
         self._empty = self.optsd[EMPTY] if EMPTY in self.optsd else 0
         self._maxframes_tot = self.optsd[MAXTOTF] if MAXTOTF in self.optsd else 0
         self._maxframes_file = self.optsd[MAXFILF] if MAXFILF in self.optsd else 0
+        self._lazy = self.optsd[LAZY] if LAZY in self.optsd else False
+        self._threads = self.optsd[THREADS] if THREADS in self.optsd else 1
+        self._index = None
+        if INDEX in self.optsd:
+            self._index = os.path.join(os.path.dirname(self._fname),
+                                       self.optsd[INDEX])
 
         self._meta = yamlmeta(d['meta']) #, path=imgsd)
 
     def _process_files(self):
-        kw = {'empty': self._empty, 'max_frames': self._maxframes_file}
+        kw = {'empty': self._empty, 'max_frames': self._maxframes_file,
+              'lazy': self._lazy}
         fcl = None
         shp = None
         dtp = None
         nf = 0
         self._singleframes = True
-        infolist = []
-        for imgf in self._files:
-            info = FileInfo(imgf, **kw)
-            infolist.append(info)
+        infolist = self._scan_files(**kw)
+        for info in infolist:
             shp = self._checkvalue(shp, info.shape,
                                    "inconsistent image shapes")
             dtp = self._checkvalue(dtp, info.dtype,
@@ -118,6 +140,68 @@ def _process_files(self):
         self._dtype = dtp
         self._fabioclass = fcl
         self._infolist = infolist
+        self._framecounts = np.cumsum([info.nframes for info in infolist])
+
+    def _scan_files(self, **kw):
+        """make FileInfo list, using the index file and threads if given"""
+        headers = self._load_index()
+        if headers is not None:
+            return [FileInfo(imgf, header=h, **kw)
+                    for imgf, h in zip(self._files, headers)]
+
+        if self._threads > 1 and len(self._files) > 1:
+            pool = ThreadPool(self._threads)
+            try:
+                infolist = pool.map(lambda imgf: FileInfo(imgf, **kw),
+                                    self._files)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            infolist = [FileInfo(imgf, **kw) for imgf in self._files]
+
+        # fill in what the headers did not provide from the first file
+        if self._lazy and len(infolist) > 0:
+            first = infolist[0]
+            if first.shape is None or first.dtype is None:
+                first = FileInfo(first.filename, **dict(kw, lazy=False))
+            for info in infolist:
+                info.complete(first)
+
+        self._save_index(infolist)
+        return infolist
+
+    def _load_index(self):
+        """return cached headers if the index matches the files"""
+        if self._index is None or not os.path.exists(self._index):
+            return None
+        with open(self._index, "r") as f:
+            d = yaml.safe_load(f)
+        entries = d.get('files', [])
+        if len(entries) != len(self._files):
+            return None
+        headers = []
+        for imgf, e in zip(self._files, entries):
+            if e['name'] != os.path.basename(imgf) or \
+               e['stat'] != _file_stat(imgf):
+                logging.info('index out of date: %s', self._index)
+                return None
+            headers.append(e['header'])
+
+        return headers
+
+    def _save_index(self, infolist):
+        if self._index is None:
+            return
+        entries = [dict(name=os.path.basename(info.filename),
+                        stat=_file_stat(info.filename),
+                        header=info.header)
+                   for info in infolist]
+        try:
+            with open(self._index, "w") as f:
+                yaml.safe_dump({'files': entries}, f)
+        except IOError as e:
+            logging.warning('could not write index %s: %s', self._index, e)
 
     # from make_imageseries_h5
     @staticmethod
@@ -142,15 +226,10 @@ def _file_and_frame(self, key):
             raise LookupError(msg)
         k = key if key >= 0 else (nf + key)
 
-        frame = -nf - 1
-        fnum = 0
-        for info in self.infolist:
-            if k < info.nframes:
-                frame = k + info.empty
-                break
-            else:
-                k -= info.nframes
-                fnum += 1
+        fnum = int(np.searchsorted(self._framecounts, k, side='right'))
+        if fnum > 0:
+            k -= self._framecounts[fnum - 1]
+        frame = int(k) + self.infolist[fnum].empty
 
         return fnum, frame
 
@@ -188,17 +267,42 @@ def singleframes(self):
     pass  # end class
 
 
+def _file_stat(filename):
+    """size and modification time, to detect stale index entries"""
+    st = os.stat(filename)
+    return [int(st.st_size), float(st.st_mtime)]
+
+
 class FileInfo(object):
     """class for managing individual file information"""
     def __init__(self, filename, **kwargs):
-        self.filename = filename
-        img = fabio.open(filename)
-        self._fabioclass = img.classname
-        self._imgframes = img.nframes
-        self.dat = img.data
-        self.fabioimage = img
+        """Constructor
 
+        *filename* - name of image file
+        *kwargs* - keyword arguments
+                 . 'empty' = number of empty frames at start of file
+                 . 'max_frames' = maximum number of frames to use
+                 . 'lazy' = read only the header; default is False
+                 . 'header' = header information from an index, as given
+                   by the header property; the file is not opened
+        """
+        self.filename = filename
         d = kwargs.copy()
+        header = d.pop('header', None)
+        lazy = d.pop('lazy', False)
+        if header is not None:
+            self._set_header(header)
+        elif lazy:
+            self._read_header()
+        else:
+            img = fabio.open(filename)
+            self._fabioclass = img.classname
+            self._imgframes = img.nframes
+            self.dat = img.data
+            self.fabioimage = img
+            self._shape = self.dat.shape
+            self._dtype = self.dat.dtype
+
         self._empty = d.pop('empty', 0)
         # user may set max-frames to 0, indicating use all frames
         self._maxframes = d.pop('max_frames', 0)
@@ -219,17 +323,60 @@ def __str__(self):
 
         return s
 
+    def _read_header(self):
+        """file information from header only; shape and dtype may be None"""
+        img = fabio.openheader(self.filename)
+        self._fabioclass = img.classname
+        # GE headers carry the frame count, but fabio only sets it on read
+        self._imgframes = int(img.header.get('NumberOfFrames', img.nframes))
+        # without data, fabio raises AttributeError for missing values
+        try:
+            self._shape = img.shape
+        except AttributeError:
+            self._shape = None
+        try:
+            self._dtype = img.dtype
+        except AttributeError:
+            self._dtype = None
+
+    def _set_header(self, h):
+        self._fabioclass = h['fabioclass']
+        self._imgframes = h['nframes']
+        self._shape = tuple(h['shape'])
+        self._dtype = np.dtype(h['dtype'])
+
+    def complete(self, other):
+        """fill in shape and dtype missing from the header; the adapter
+        checks the shape of each frame as it is read"""
+        if self._shape is None:
+            self._shape = other.shape
+        if self._dtype is None:
+            self._dtype = other.dtype
+
+    def getframe(self, frame):
+        """return fabio image for frame, reading the file if needed"""
+        if hasattr(self, 'fabioimage'):
+            return self.fabioimage.getframe(frame)
+        else:
+            return fabio.open(self.filename, frame)
+
+    @property
+    def header(self):
+        """information needed to rebuild this instance without the file"""
+        return dict(fabioclass=self.fabioclass, nframes=self._imgframes,
+                    shape=list(self.shape), dtype=str(self.dtype))
+
     @property
     def empty(self):
         return self._empty
 
     @property
     def shape(self):
-        return self.dat.shape
+        return self._shape
 
     @property
     def dtype(self):
-        return self.dat.dtype
+        return self._dtype
 
     @property
     def fabioclass(self):
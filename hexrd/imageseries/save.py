@@ -1,13 +1,27 @@
 """Write imageseries to various formats"""
 from __future__ import print_function
 import abc
+from multiprocessing.pool import ThreadPool
 import os
 import warnings
+import zlib
 
 import numpy as np
 import h5py
 import yaml
 
+try:
+    import blosc
+    import hdf5plugin
+    haveBlosc = True
+except ImportError:
+    haveBlosc = False
+
+# HDF5 filter ID registered for blosc and its compressor codes
+BLOSC_FILTER = 32001
+BLOSC_CODES = {'blosclz': 0, 'lz4': 1, 'lz4hc': 2, 'snappy': 3, 'zlib': 4,
+               'zstd': 5}
+
 
 def write(ims, fname, fmt, **kwargs):
     """write imageseries to file with options
@@ -77,6 +91,9 @@ class WriteH5(Writer):
     dflt_gzip = 1
     dflt_chrows = 0
     dflt_shuffle = True
+    dflt_chframes = 1
+    dflt_blosc_level = 5
+    dflt_threads = 0
 
     def __init__(self, ims, fname, **kwargs):
         """Write imageseries in HDF5 file
@@ -86,7 +103,14 @@ def __init__(self, ims, fname, **kwargs):
 
            Options:
            gzip - 0-9; 0 turns off compression; 4 is default
+           blosc - name of blosc compressor (e.g. 'lz4', 'zstd'); overrides
+                   gzip; requires the blosc and hdf5plugin packages
+           blosc_level - 1-9; default is 5
            chunk_rows - number of rows per chunk; default is all
+           chunk_frames - number of frames per chunk; default is 1
+           threads - number of threads compressing chunks, which are then
+                     written directly to the file; 0 (default) leaves
+                     compression to HDF5
            """
         Writer.__init__(self, ims, fname, **kwargs)
         self._path = self._opts['path']
@@ -100,16 +124,24 @@ def write(self):
         g = f.create_group(self._path)
         s0, s1 = self._shape
 
+        h5opts = self.h5opts
+        threads = self._opts.pop('threads', self.dflt_threads)
         ds = g.create_dataset('images', (self._nframes, s0, s1), self._dtype,
-                              **self.h5opts)
+                              **h5opts)
 
-        for i in range(self._nframes):
-            ds[i, :, :] = self._ims[i]
+        frames = (self._ims[i] for i in range(self._nframes))
+        if threads > 0:
+            DirectChunkWriter(ds, threads=threads, **h5opts).write(frames)
+        else:
+            for i, frame in enumerate(frames):
+                ds[i, :, :] = frame
 
         # add metadata
         for k, v in self._meta.items():
             g.attrs[k] = v
 
+        f.close()
+
     @property
     def h5opts(self):
         d = {}
@@ -122,7 +154,11 @@ def h5opts(self):
         compress = self._opts.pop('gzip', self.dflt_gzip)
         if compress > 9:
             raise ValueError('gzip compression cannot exceed 9: %s' % compress)
-        if compress > 0:
+        bcname = self._opts.pop('blosc', None)
+        if bcname is not None:
+            blevel = self._opts.pop('blosc_level', self.dflt_blosc_level)
+            d.update(blosc_h5opts(bcname, blevel, shuffle))
+        elif compress > 0:
             d['compression'] = 'gzip'
             d['compression_opts'] = compress
 
@@ -131,13 +167,143 @@ def h5opts(self):
         chrows = self._opts.pop('chunk_rows', self.dflt_chrows)
         if chrows < 1 or chrows > s0:
             chrows = s0
-        d['chunks'] = (1, chrows, s1)
+        chframes = self._opts.pop('chunk_frames', self.dflt_chframes)
+        chframes = max(1, min(chframes, self._nframes))
+        d['chunks'] = (chframes, chrows, s1)
 
         return d
 
     pass  # end class
 
 
+def blosc_h5opts(cname, clevel, shuffle=True):
+    """HDF5 dataset options for the blosc filter
+
+    *cname* - blosc compressor name, one of BLOSC_CODES
+    *clevel* - compression level, 1-9
+    *shuffle* - apply byte shuffle inside blosc
+    """
+    if not haveBlosc:
+        raise ImportError('blosc compression requires blosc and hdf5plugin')
+    if cname not in BLOSC_CODES:
+        raise ValueError('unknown blosc compressor: %s' % cname)
+    if clevel < 1 or clevel > 9:
+        raise ValueError('blosc level must be in 1-9: %s' % clevel)
+    # the first four filter values are filled in by the filter itself
+    opts = (0, 0, 0, 0, clevel, int(bool(shuffle)), BLOSC_CODES[cname])
+    # shuffle is done by blosc, not by the HDF5 shuffle filter
+    return {'compression': BLOSC_FILTER, 'compression_opts': opts,
+            'shuffle': False}
+
+
+class DirectChunkWriter(object):
+    """Compress chunks in a thread pool and write them directly
+
+    Frames are batched along the first axis to match the dataset chunks;
+    each chunk is then shuffled and compressed by a worker thread (zlib and
+    blosc release the GIL) and stored with an HDF5 direct chunk write,
+    bypassing the serial HDF5 filter pipeline.
+    """
+
+    def __init__(self, ds, threads=1, shuffle=False, compression=None,
+                 compression_opts=None, **kwargs):
+        """Constructor
+
+        *ds* - chunked 3D HDF5 dataset (frames, rows, columns)
+        *threads* - number of compression threads
+        *shuffle*, *compression*, *compression_opts* - filter options
+            the dataset was created with, as in h5py.create_dataset
+        """
+        if ds.chunks is None:
+            raise ValueError('direct chunk writes need a chunked dataset')
+        if ds.chunks[2] != ds.shape[2]:
+            raise ValueError('chunks must span full image rows')
+        self._ds = ds
+        self._threads = max(1, threads)
+        self._shuffle = shuffle
+        self._itemsize = ds.dtype.itemsize
+        if compression == BLOSC_FILTER:
+            self._compress = self._blosc
+            cname = [k for k, v in BLOSC_CODES.items()
+                     if v == compression_opts[6]][0]
+            self._blosc_opts = dict(clevel=compression_opts[4],
+                                    shuffle=compression_opts[5],
+                                    cname=cname)
+        elif compression == 'gzip':
+            self._compress = self._gzip
+            self._level = compression_opts
+        elif compression is None:
+            self._compress = self._identity
+        else:
+            raise ValueError('unsupported compression: %s' % compression)
+
+    def write(self, frames):
+        """write frames, an iterable of 2D arrays, to the dataset"""
+        ds = self._ds
+        nf, s0, s1 = ds.shape
+        cf, cr, _ = ds.chunks
+        nrc = int(np.ceil(s0/float(cr)))
+        # edge chunks are stored full size, so pad the rows
+        blkshape = (cf, nrc*cr, s1)
+
+        pool = ThreadPool(self._threads)
+        try:
+            batch = []
+            i0 = 0
+            blk = np.zeros(blkshape, dtype=ds.dtype)
+            j = 0
+            for frame in frames:
+                if i0 + j >= nf:
+                    break
+                blk[j, :s0, :] = frame
+                j += 1
+                if j == cf:
+                    batch.extend(self._block_chunks(blk, i0, nrc, cr))
+                    i0 += cf
+                    j = 0
+                    blk = np.zeros(blkshape, dtype=ds.dtype)
+                    if len(batch) >= self._threads*nrc:
+                        self._write_batch(pool, batch)
+                        batch = []
+            if j > 0:
+                batch.extend(self._block_chunks(blk, i0, nrc, cr))
+            self._write_batch(pool, batch)
+        finally:
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def _block_chunks(blk, i0, nrc, cr):
+        return [((i0, k*cr, 0), blk[:, k*cr:(k + 1)*cr, :])
+                for k in range(nrc)]
+
+    def _write_batch(self, pool, batch):
+        dsid = self._ds.id
+        offsets = [b[0] for b in batch]
+        data = pool.map(self._compress, [b[1] for b in batch])
+        for offset, chunk in zip(offsets, data):
+            dsid.write_direct_chunk(offset, chunk)
+
+    def _byte_shuffle(self, chunk):
+        # same layout as the HDF5 shuffle filter
+        b = np.ascontiguousarray(chunk).view(np.uint8)
+        return b.reshape(-1, self._itemsize).T.tobytes()
+
+    def _identity(self, chunk):
+        if self._shuffle:
+            return self._byte_shuffle(chunk)
+        return np.ascontiguousarray(chunk).tobytes()
+
+    def _gzip(self, chunk):
+        return zlib.compress(self._identity(chunk), self._level)
+
+    def _blosc(self, chunk):
+        return blosc.compress(np.ascontiguousarray(chunk).tobytes(),
+                              typesize=self._itemsize, **self._blosc_opts)
+
+    pass  # end class
+
+
 class WriteFrameCache(Writer):
     """info from yml file"""
     fmt = 'frame-cache'
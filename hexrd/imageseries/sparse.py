@@ -0,0 +1,128 @@
+"""Imageseries thresholded on the fly into sparse frames"""
+from collections import OrderedDict
+import copy
+import threading
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .baseclass import ImageSeries
+from .imageseriesiter import ImageSeriesIterator
+
+# Default store size: 1 GB
+STORE_BYTES = 1.e9
+
+
+class SparseImageSeries(ImageSeries):
+    """Imageseries with frames thresholded into sparse matrices on demand
+
+    The first access of a frame reads it from the underlying imageseries
+    and keeps the pixels above threshold as a csr matrix; later accesses
+    are served from an in-memory store. When the store would exceed its
+    size, the least recently used frames are dropped and will be converted
+    again if needed.
+    """
+
+    def __init__(self, imser, threshold, **kwargs):
+        """sparse imageseries based on an existing one
+
+        *imser* - an existing imageseries
+        *threshold* - pixels with values <= threshold are set to zero
+
+        *keyword args*
+        'max_bytes' - size limit of the sparse frame store; default
+                      is STORE_BYTES
+        """
+        self._imser = imser
+        self._meta = copy.deepcopy(imser.metadata)
+        self._threshold = threshold
+        self._max_bytes = kwargs.pop('max_bytes', STORE_BYTES)
+        self._store = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        return self.sparse(key).toarray()
+
+    def __len__(self):
+        return len(self._imser)
+
+    def __iter__(self):
+        return ImageSeriesIterator(self)
+
+    def _index(self, key):
+        nf = len(self)
+        if key < -nf or key >= nf:
+            raise IndexError("frame out of range: %s" % key)
+        return key if key >= 0 else nf + key
+
+    def _convert(self, key):
+        frame = self._imser[key]
+        mask = frame > self._threshold
+        row, col = mask.nonzero()
+        return csr_matrix((frame[mask], (row, col)),
+                          shape=frame.shape, dtype=frame.dtype)
+
+    @staticmethod
+    def _csr_nbytes(m):
+        return m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+    #
+    # ==================== API
+    #
+    def sparse(self, key):
+        """return frame *key* as a csr matrix"""
+        key = self._index(key)
+        with self._lock:
+            if key in self._store:
+                m = self._store.pop(key)
+                self._store[key] = m
+                return m
+
+        m = self._convert(key)
+        nb = self._csr_nbytes(m)
+        with self._lock:
+            if key not in self._store:
+                self._store[key] = m
+                self._nbytes += nb
+                while self._nbytes > self._max_bytes and len(self._store) > 1:
+                    _, old = self._store.popitem(last=False)
+                    self._nbytes -= self._csr_nbytes(old)
+        return m
+
+    def gather(self, key, rows, cols):
+        """values of frame *key* at pixels (*rows*, *cols*)"""
+        return np.asarray(self.sparse(key)[rows, cols]).reshape(
+            np.shape(rows))
+
+    def memory(self):
+        """report on the frame store
+
+        returns a dict with the number of frames stored, their size in
+        bytes as sparse and as dense arrays, and the ratio of the two
+        """
+        nrows, ncols = self.shape
+        with self._lock:
+            nframes = len(self._store)
+            nbytes = self._nbytes
+        dense = nframes*nrows*ncols*np.dtype(self.dtype).itemsize
+        return dict(frames=nframes, sparse_bytes=nbytes, dense_bytes=dense,
+                    savings=(float(dense)/nbytes if nbytes > 0 else np.inf))
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    @property
+    def dtype(self):
+        return self._imser.dtype
+
+    @property
+    def shape(self):
+        return self._imser.shape
+
+    @property
+    def metadata(self):
+        # this is a modifiable copy of metadata of the original imageseries
+        return self._meta
+
+    pass  # end class
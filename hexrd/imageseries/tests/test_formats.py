@@ -3,11 +3,14 @@
 import unittest
 
 import numpy as np
+import yaml
 
 from .common import ImageSeriesTest
 from .common import make_array_ims, compare, compare_meta
 
 from hexrd import imageseries
+from hexrd.imageseries import save
+from hexrd.imageseries.load import imagefiles
 
 
 class ImageSeriesFormatTest(ImageSeriesTest):
@@ -79,6 +82,40 @@ def test_fmth5_chunk(self):
         self.assertAlmostEqual(diff, 0., "h5 reconstruction failed")
         self.assertTrue(compare_meta(self.is_a, is_h))
 
+    def test_fmth5_threads(self):
+        """HDF5 options: threaded direct chunk writes"""
+        # chunks that do not divide the series exercise the edge padding
+        imageseries.write(self.is_a, self.h5file, self.fmt,
+                          path=self.h5path, threads=2, chunk_frames=2,
+                          chunk_rows=3)
+        is_h = imageseries.open(self.h5file, self.fmt, path=self.h5path)
+
+        self.assertEqual(len(is_h), len(self.is_a))
+        for i in range(len(self.is_a)):
+            diff = np.linalg.norm(is_h[i] - self.is_a[i])
+            self.assertAlmostEqual(diff, 0., "h5 reconstruction failed")
+
+    def test_fmth5_threads_nocompress(self):
+        """HDF5 options: threaded direct chunk writes, no compression"""
+        imageseries.write(self.is_a, self.h5file, self.fmt,
+                          path=self.h5path, threads=2, gzip=0)
+        is_h = imageseries.open(self.h5file, self.fmt, path=self.h5path)
+
+        for i in range(len(self.is_a)):
+            diff = np.linalg.norm(is_h[i] - self.is_a[i])
+            self.assertAlmostEqual(diff, 0., "h5 reconstruction failed")
+
+    @unittest.skipUnless(save.haveBlosc, "blosc not available")
+    def test_fmth5_blosc(self):
+        """HDF5 options: blosc compression with threads"""
+        imageseries.write(self.is_a, self.h5file, self.fmt,
+                          path=self.h5path, blosc='lz4', threads=2)
+        is_h = imageseries.open(self.h5file, self.fmt, path=self.h5path)
+
+        for i in range(len(self.is_a)):
+            diff = np.linalg.norm(is_h[i] - self.is_a[i])
+            self.assertAlmostEqual(diff, 0., "h5 reconstruction failed")
+
 class TestFormatFrameCache(ImageSeriesFormatTest):
 
     def setUp(self):
@@ -116,3 +153,96 @@ def test_fmtfc_nparray(self):
         diff = np.linalg.norm(meta[key] - npa)
         self.assertAlmostEqual(diff, 0.,
                                "frame-cache numpy array metadata failed")
+
+
+class TestFormatImageFiles(ImageSeriesFormatTest):
+
+    def setUp(self):
+        from fabio.edfimage import EdfImage
+        self.fmt = 'image-files'
+        self.nfiles, self.nf_file = 3, 3
+        self.files = []
+        for i in range(self.nfiles):
+            fname = os.path.join(self.tmpdir, 'ims_%d.edf' % i)
+            img = EdfImage(data=self._frame(i, 0))
+            for j in range(1, self.nf_file):
+                img.append_frame(data=self._frame(i, j))
+            img.write(fname)
+            self.files.append(fname)
+        self.ymlfile = os.path.join(self.tmpdir, 'image-files.yml')
+        self.index = os.path.join(self.tmpdir, 'index.yml')
+
+    def tearDown(self):
+        for f in self.files + [self.ymlfile, self.index]:
+            if os.path.exists(f):
+                os.remove(f)
+
+    def _frame(self, i, j):
+        return np.full((4, 5), 10*i + j, dtype=np.uint16)
+
+    def _write_yml(self, **opts):
+        d = {'image-files': {'directory': self.tmpdir,
+                             'files': ' '.join(os.path.basename(f)
+                                               for f in self.files)},
+             'options': dict({'empty-frames': 1}, **opts),
+             'meta': {}}
+        with open(self.ymlfile, 'w') as f:
+            yaml.safe_dump(d, f)
+
+    def _check(self, ims):
+        self.assertEqual(len(ims), self.nfiles*(self.nf_file - 1))
+        self.assertEqual(ims.shape, (4, 5))
+        self.assertEqual(ims.dtype, np.uint16)
+        for k in range(len(ims)):
+            i, j = divmod(k, self.nf_file - 1)
+            self.assertTrue(np.all(ims[k] == self._frame(i, j + 1)))
+        self.assertTrue(np.all(ims[-1] == ims[len(ims) - 1]))
+
+    def test_fmtif(self):
+        """load image-files format"""
+        self._write_yml()
+        self._check(imageseries.open(self.ymlfile, self.fmt))
+
+    def test_fmtif_lazy(self):
+        """image-files format: header-only scan with threads and index"""
+        self._write_yml(**{'lazy': True, 'scan-threads': 2,
+                           'index': os.path.basename(self.index)})
+        self._check(imageseries.open(self.ymlfile, self.fmt))
+        self.assertTrue(os.path.exists(self.index))
+
+        # second open uses the index, without reading any file
+        def no_read(*args, **kwargs):
+            raise AssertionError('file read despite index')
+        openheader = imagefiles.fabio.openheader
+        imagefiles.fabio.openheader = no_read
+        try:
+            ims = imageseries.open(self.ymlfile, self.fmt)
+        finally:
+            imagefiles.fabio.openheader = openheader
+        self._check(ims)
+
+    def test_fmtif_frame_shape(self):
+        """image-files format: frames checked against the expected shape"""
+        self.files.append(os.path.join(self.tmpdir, 'ims_3.edf'))
+        from fabio.edfimage import EdfImage
+        img = EdfImage(data=np.zeros((3, 5), dtype=np.uint16))
+        for j in range(1, self.nf_file):
+            img.append_frame(data=np.zeros((3, 5), dtype=np.uint16))
+        img.write(self.files[-1])
+        self._write_yml(**{'lazy': True,
+                           'index': os.path.basename(self.index)})
+        # an index claiming the usual shape for the odd file
+        entries = [dict(name=os.path.basename(f),
+                        stat=imagefiles._file_stat(f),
+                        header=dict(fabioclass='edfimage',
+                                    nframes=self.nf_file,
+                                    shape=[4, 5], dtype='uint16'))
+                   for f in self.files]
+        with open(self.index, 'w') as f:
+            yaml.safe_dump({'files': entries}, f)
+
+        ims = imageseries.open(self.ymlfile, self.fmt)
+        self.assertEqual(ims.shape, (4, 5))
+        self.assertTrue(np.all(ims[0] == self._frame(0, 1)))
+        with self.assertRaises(ValueError):
+            ims[len(ims) - 1]
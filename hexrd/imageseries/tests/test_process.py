@@ -3,7 +3,7 @@
 from .common import ImageSeriesTest, make_array, make_array_ims, compare
 
 from hexrd import imageseries
-from hexrd.imageseries import process, ImageSeries
+from hexrd.imageseries import process, sparse, ImageSeries
 
 class TestImageSeriesProcess(ImageSeriesTest):
 
@@ -104,3 +104,25 @@ def test_process_dtype(self):
         ops = []
         is_p = process.ProcessedImageSeries(is_a, ops)
         self.assertEqual(is_p.dtype, is_p[0].dtype)
+
+    def test_process_sparse(self):
+        """Processed image series: sparse thresholded frames"""
+        a = make_array()
+        is_a = imageseries.open(None, 'array', data=a)
+        is_s = sparse.SparseImageSeries(is_a, 1.5)
+        athresh = np.where(a > 1.5, a, 0)
+        is_t = imageseries.open(None, 'array', data=athresh)
+        diff = compare(is_t, is_s)
+        self.assertAlmostEqual(diff, 0., msg="sparse image series failed")
+        rows, cols = np.array([1, 1, 0]), np.array([2, 3, 0])
+        g = is_s.gather(2, rows, cols)
+        self.assertTrue(np.all(g == athresh[2, rows, cols]))
+        self.assertEqual(is_s.memory()['frames'], len(is_a))
+
+    def test_process_sparse_store(self):
+        """Processed image series: sparse frame store size limit"""
+        is_a = make_array_ims()
+        is_s = sparse.SparseImageSeries(is_a, 0.5, max_bytes=1)
+        for i in range(len(is_a)):
+            is_s[i]
+        self.assertEqual(is_s.memory()['frames'], 1)
@@ -25,3 +25,25 @@ def test_stats_max(self):
         amax = np.max(a, axis=0)
         err = np.linalg.norm(amax - ismax)
         self.assertAlmostEqual(err, 0., msg="max image failed")
+
+    def test_stats_dark(self):
+        """Processed imageseries: dark and dead pixels"""
+        a = np.random.RandomState(0).randint(0, 100, (9, 6, 5))
+        a[:, 2, 3] = 7
+        is_a = imageseries.open(None, 'array', data=a)
+        dark, dead, std, res = imageseries.dark.dark(is_a, threads=2)
+        err = np.linalg.norm(np.median(a, axis=0).astype(a.dtype) - dark)
+        self.assertAlmostEqual(err, 0., msg="dark image failed")
+        err = np.linalg.norm(np.std(a, axis=0) - std)
+        self.assertAlmostEqual(err, 0., msg="dark std failed")
+        self.assertTrue(dead[2, 3] and np.sum(dead) == 1)
+        self.assertEqual(res[2, 3], 0.)
+
+    def test_stats_dark_cut(self):
+        """Processed imageseries: dark with cut on minimum"""
+        a = make_array()
+        a[:, 0, 0] = [1, 3, 4]
+        is_a = imageseries.open(None, 'array', data=a)
+        dark, dead, std, res = imageseries.dark.dark(is_a, cut_min_factor=3.5)
+        self.assertEqual(dark[0, 0], 2)
+        self.assertEqual(res[0, 0], 1.)
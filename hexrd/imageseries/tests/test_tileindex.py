@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from hexrd import imageseries
+from hexrd.imageseries import tileindex
+
+from .common import ImageSeriesTest
+
+
+class TestTileIndex(ImageSeriesTest):
+
+    def setUp(self):
+        self.a = np.zeros((4, 10, 7))
+        self.a[1, 9, 6] = 5.
+        self.a[2, 0, 0] = 3.
+        self.ims = imageseries.open(None, 'array', data=self.a)
+
+    def test_tile_max(self):
+        """Tile index: tile maxima"""
+        tidx = tileindex.TileIndex.build(self.ims, tile=4)
+        self.assertEqual(tidx.frame_tiles(1).shape, (6,))
+        for i in range(len(self.a)):
+            self.assertEqual(tidx.frame_max(i), self.a[i].max())
+        tiles = tidx.tiles(np.array([9]), np.array([6]))
+        self.assertEqual(list(tiles), [5])
+        self.assertTrue(tidx.any_above([0, 1], tiles, 4.))
+        self.assertFalse(tidx.any_above([0, 2], tiles, 4.))
+        self.assertFalse(tidx.any_above(1, tiles, 5.))
+
+    def test_tile_index_file(self):
+        """Tile index: save and reuse"""
+        fname = os.path.join(tempfile.mkdtemp(), 'tiles.npz')
+        t1 = tileindex.tile_index(self.ims, fname=fname, tile=4)
+        t2 = tileindex.tile_index(self.ims, fname=fname, tile=4)
+        self.assertEqual(t2.shape, self.ims.shape)
+        self.assertTrue(np.all(t1.frame_tiles(2) == t2.frame_tiles(2)))
+        os.remove(fname)
+        os.rmdir(os.path.dirname(fname))
+
+    def test_stale_index_file(self):
+        """Tile index: rebuilt when the data file changes"""
+        tmpdir = tempfile.mkdtemp()
+        h5file = os.path.join(tmpdir, 'data.h5')
+        imageseries.write(self.ims, h5file, 'hdf5', path='a')
+        fname = tileindex.index_file(h5file, 'a')
+        self.assertNotEqual(fname, tileindex.index_file(h5file, 'b'))
+
+        ims = imageseries.open(h5file, 'hdf5', path='a')
+        source = tileindex.source_key(h5file, 'a')
+        tileindex.tile_index(ims, fname=fname, tile=4, source=source)
+        t1 = tileindex.tile_index(ims, fname=fname, tile=4, source=source)
+        self.assertEqual(t1.source, source)
+        self.assertEqual(t1.frame_max(0), 0.)
+
+        # same shape, new content and mtime
+        a = np.array(self.a)
+        a[0, 3, 3] = 7.
+        os.remove(h5file)
+        imageseries.write(imageseries.open(None, 'array', data=a),
+                          h5file, 'hdf5', path='a')
+        os.utime(h5file, (source[2] + 10, source[2] + 10))
+        ims = imageseries.open(h5file, 'hdf5', path='a')
+        source2 = tileindex.source_key(h5file, 'a')
+        self.assertNotEqual(source2, source)
+        t2 = tileindex.tile_index(ims, fname=fname, tile=4, source=source2)
+        self.assertEqual(t2.frame_max(0), 7.)
+        self.assertEqual(tileindex.TileIndex.load(fname).source, source2)
+
+        # another dataset of the same file does not match
+        self.assertNotEqual(tileindex.source_key(h5file, 'b'), source2)
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,146 @@
+"""Coarse per-frame tile index for imageseries
+
+The index holds the maximum value of each square tile of each frame. It
+lets threshold-based consumers decide whether a frame region can contain
+signal without reading the pixel data.
+"""
+import logging
+import os
+
+import numpy as np
+
+# Default tile size in pixels
+TILE_SIZE = 64
+
+
+class TileIndex(object):
+    """maximum value per tile per frame"""
+
+    def __init__(self, tmax, shape, tile=TILE_SIZE, source=None):
+        """Constructor
+
+        *tmax* - array (nframes, ntile_rows, ntile_cols) of tile maxima
+        *shape* - frame shape
+        *tile* - tile size in pixels
+        *source* - the data the index was built from, as made by
+                   source_key, or None
+        """
+        self._tmax = tmax
+        self._shape = tuple(shape)
+        self._tile = tile
+        self._source = source
+
+    @classmethod
+    def build(cls, ims, tile=TILE_SIZE, source=None):
+        """make the index for an imageseries"""
+        nr, nc = ims.shape
+        ntr = int(np.ceil(nr/float(tile)))
+        ntc = int(np.ceil(nc/float(tile)))
+        pad = ((0, ntr*tile - nr), (0, ntc*tile - nc))
+        tmax = np.empty((len(ims), ntr, ntc), dtype=ims.dtype)
+        for i in range(len(ims)):
+            # edge padding leaves the tile maxima unchanged
+            frame = np.pad(ims[i], pad, mode='edge')
+            tmax[i] = frame.reshape(ntr, tile, ntc, tile).max(axis=(1, 3))
+        return cls(tmax, (nr, nc), tile, source)
+
+    @classmethod
+    def load(cls, fname):
+        """load index from npz file"""
+        arrs = np.load(fname)
+        source = None
+        if 'source_file' in arrs.files:
+            source = (str(arrs['source_file']), str(arrs['source_path']),
+                      float(arrs['source_mtime']), int(arrs['source_size']))
+        return cls(arrs['tmax'], arrs['shape'], int(arrs['tile']), source)
+
+    def save(self, fname):
+        """save index to npz file"""
+        kwargs = dict()
+        if self._source is not None:
+            kwargs = dict(zip(
+                ('source_file', 'source_path', 'source_mtime', 'source_size'),
+                self._source))
+        np.savez_compressed(fname, tmax=self._tmax, shape=self._shape,
+                            tile=self._tile, **kwargs)
+
+    def __len__(self):
+        return len(self._tmax)
+
+    @property
+    def shape(self):
+        """frame shape"""
+        return self._shape
+
+    @property
+    def tile(self):
+        """tile size in pixels"""
+        return self._tile
+
+    @property
+    def source(self):
+        """the data the index was built from, see source_key"""
+        return self._source
+
+    def frame_max(self, key):
+        """maximum value of frame *key*"""
+        return self._tmax[key].max()
+
+    def frame_tiles(self, key):
+        """flattened tile maxima of frame *key*"""
+        return self._tmax[key].ravel()
+
+    def tiles(self, rows, cols):
+        """flat indices of the tiles containing pixels (*rows*, *cols*)"""
+        ntc = self._tmax.shape[2]
+        t = (np.ravel(rows)//self._tile)*ntc + np.ravel(cols)//self._tile
+        return np.unique(t)
+
+    def any_above(self, frames, tiles, threshold):
+        """True if any of *tiles* in any of *frames* exceeds *threshold*"""
+        tm = self._tmax.reshape(len(self._tmax), -1)
+        return bool(np.any(tm[np.atleast_1d(frames)][:, tiles] > threshold))
+
+    pass  # end class
+
+
+def source_key(fname, path=None):
+    """key of the data in file *fname* (and dataset *path*) for an index
+
+    The absolute file name, dataset path, modification time and size; an
+    index saved with a different key is stale.
+    """
+    stat = os.stat(fname)
+    return (os.path.abspath(fname), '' if path is None else str(path),
+            float(stat.st_mtime), int(stat.st_size))
+
+
+def index_file(fname, path=None):
+    """name of the index file of the data in *fname* (and dataset *path*)"""
+    if path:
+        fname = '%s.%s' % (fname, str(path).strip('/').replace('/', '.'))
+    return fname + '.tiles.npz'
+
+
+def tile_index(ims, fname=None, tile=TILE_SIZE, source=None):
+    """return tile index for imageseries, using a saved one if possible
+
+    *ims* - an imageseries
+    *fname* - name of npz file for the index; the index is loaded from it
+              if it matches the imageseries, otherwise built and saved
+    *tile* - tile size in pixels
+    *source* - key of the data of the imageseries, see source_key; a saved
+               index built from other data is rebuilt
+    """
+    if fname is not None and os.path.exists(fname):
+        tidx = TileIndex.load(fname)
+        if len(tidx) == len(ims) and tidx.shape == tuple(ims.shape) \
+           and tidx.tile == tile and tidx.source == source:
+            return tidx
+        logging.warning('tile index does not match imageseries, '
+                        'rebuilding: %s', fname)
+
+    tidx = TileIndex.build(ims, tile=tile, source=source)
+    if fname is not None:
+        tidx.save(fname)
+    return tidx
@@ -5,3 +5,5 @@
 from .eta_omega import GenerateEtaOmeMaps
 from .io import PatchDataWriter, GrainDataWriter, GrainDataWriter_h5
 from .io import unwrap_dict_to_h5
+from .caking import CakingEngine, PanelCaker, caking_engine
+from .prediction_cache import PredictionCache
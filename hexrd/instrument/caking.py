@@ -0,0 +1,419 @@
+"""Caking of detector frames onto a fixed (tth, eta) grid
+
+The caking engine maps every pixel of every panel onto the bins of a
+(tth, eta) grid once, as a sparse matrix of bin weights, so that caking a
+frame is a single sparse matrix product. Frames are caked in batches, and
+the weights can be saved and reloaded for the same geometry.
+"""
+from __future__ import print_function
+
+import logging
+import os
+
+import numpy as np
+from scipy import sparse
+
+from hexrd import constants as ct
+from hexrd.xrd.transforms_CAPI import detectorXYToGvec, \
+                                      makeOscillRotMat, \
+                                      mapAngle
+
+# Default number of frames caked per sparse matrix product
+BATCH_SIZE = 16
+
+# Number of pixels mapped at a time when building the weights
+BUILD_CHUNK = 1 << 20
+
+
+def _bin_index(edges, vals):
+    """bin of each value in edges, -1 outside"""
+    idx = np.searchsorted(edges, vals, side='right') - 1
+    idx[np.logical_or(idx < 0, idx >= len(edges) - 1)] = -1
+    return idx
+
+
+def _frame_batches(images, frames, batch):
+    """(frame ids, stacked flat frames) for batches of an image stack"""
+    if isinstance(images, np.ndarray) and images.ndim == 2:
+        images = images[np.newaxis]
+    if frames is None:
+        frames = range(len(images))
+    frames = list(frames)
+    for i in range(0, len(frames), batch):
+        ids = frames[i:i + batch]
+        yield ids, np.array(
+            [np.asarray(images[j], dtype=float).ravel() for j in ids]
+        )
+
+
+class PanelCaker(object):
+    """(tth, eta) bin weights of the pixels of one panel"""
+
+    def __init__(self, weights, norm, shape, tth_edges, eta_edges,
+                 signature):
+        """Constructor
+
+        *weights* - csr matrix (neta*ntth, npixels) of bin weights, including
+                    any intensity corrections
+        *norm* - array (neta*ntth,) of pixel area fractions in each bin
+        *shape* - frame shape
+        *tth_edges*, *eta_edges* - bin edges in radians
+        *signature* - array describing the geometry the weights were made for
+        """
+        self._weights = weights
+        self._norm = norm
+        self._shape = tuple(shape)
+        self._tth_edges = np.asarray(tth_edges, dtype=float)
+        self._eta_edges = np.asarray(eta_edges, dtype=float)
+        self._signature = np.asarray(signature, dtype=float)
+
+    @staticmethod
+    def signature(panel, chi=0., tvec_s=ct.zeros_3, npdiv=1,
+                  solid_angle=False, polarization=None):
+        """array describing the panel geometry and caking options"""
+        if panel.distortion is None:
+            dparams = []
+        else:
+            dparams = np.asarray(panel.distortion[1], dtype=float).flatten()
+        return np.hstack([
+            panel.rows, panel.cols,
+            panel.pixel_size_row, panel.pixel_size_col,
+            np.asarray(panel.tvec).flatten(), np.asarray(panel.tilt).flatten(),
+            panel.bvec.flatten(), panel.evec.flatten(),
+            chi, np.asarray(tvec_s).flatten(),
+            npdiv, float(solid_angle),
+            polarization is not None,
+            0. if polarization is None else polarization,
+            len(dparams), dparams,
+        ])
+
+    @classmethod
+    def build(cls, panel, tth_edges, eta_edges, chi=0., tvec_s=ct.zeros_3,
+              npdiv=1, solid_angle=False, polarization=None):
+        """make the bin weights for a panel
+
+        *panel* - a PlanarDetector
+        *tth_edges*, *eta_edges* - bin edges in radians; eta bins must lie
+                                   within 2*pi of the first edge
+        *chi*, *tvec_s* - sample tilt and position
+        *npdiv* - pixels are split into npdiv x npdiv sub-pixels, each
+                  assigned to the bin containing its center
+        *solid_angle* - if True, scale intensities to the solid angle of a
+                        pixel at normal incidence at the panel distance
+        *polarization* - if not None, the degree of horizontal polarization
+                         of the beam, from -1 to 1, used to divide out the
+                         polarization factor
+        """
+        tth_edges = np.asarray(tth_edges, dtype=float)
+        eta_edges = np.asarray(eta_edges, dtype=float)
+        ntth = len(tth_edges) - 1
+        neta = len(eta_edges) - 1
+        eta_period = [eta_edges[0], eta_edges[0] + 2*np.pi]
+
+        rmat_s = makeOscillRotMat([chi, 0.])
+        tvec_s = np.asarray(tvec_s, dtype=float).flatten()
+
+        def pixel_angles(xy):
+            if panel.distortion is not None:
+                xy = panel.distortion[0](xy, panel.distortion[1])
+            angs = detectorXYToGvec(
+                xy, panel.rmat, rmat_s,
+                panel.tvec, tvec_s, ct.zeros_3,
+                beamVec=panel.bvec, etaVec=panel.evec)[0]
+            return angs[0], mapAngle(angs[1], eta_period, units='radians')
+
+        # sub-pixel offsets, as fractions of the pixel size
+        sub = (np.arange(npdiv) + 0.5)/npdiv - 0.5
+        row_vec = panel.row_pixel_vec
+        col_vec = panel.col_pixel_vec
+        nrows, ncols = panel.rows, panel.cols
+        npix = nrows*ncols
+        rows_per_chunk = max(BUILD_CHUNK // ncols, 1)
+
+        bins = []
+        pixels = []
+        for r0 in range(0, nrows, rows_per_chunk):
+            r1 = min(r0 + rows_per_chunk, nrows)
+            pix = np.arange(r0*ncols, r1*ncols)
+            for dy in sub*panel.pixel_size_row:
+                for dx in sub*panel.pixel_size_col:
+                    xy = np.ascontiguousarray(np.vstack([
+                        np.tile(col_vec + dx, r1 - r0),
+                        np.repeat(row_vec[r0:r1] + dy, ncols)
+                    ]).T)
+                    tth, eta = pixel_angles(xy)
+                    it = _bin_index(tth_edges, tth)
+                    ie = _bin_index(eta_edges, eta)
+                    on = np.logical_and(it >= 0, ie >= 0)
+                    bins.append(ie[on]*ntth + it[on])
+                    pixels.append(pix[on])
+        bins = np.hstack(bins)
+        pixels = np.hstack(pixels)
+
+        # duplicate (bin, pixel) entries are summed
+        frac = sparse.coo_matrix(
+            (np.ones(len(bins))/npdiv**2, (bins, pixels)),
+            shape=(neta*ntth, npix)).tocsr()
+        norm = np.asarray(frac.sum(axis=1)).flatten()
+
+        # per-pixel intensity corrections
+        corr = np.ones(npix)
+        if solid_angle or polarization is not None:
+            pix_j, pix_i = np.meshgrid(col_vec, row_vec)
+            xy = np.ascontiguousarray(
+                np.vstack([pix_j.flatten(), pix_i.flatten()]).T
+            )
+            if solid_angle:
+                # lab frame pixel positions relative to the sample
+                if panel.distortion is not None:
+                    xy = panel.distortion[0](xy, panel.distortion[1])
+                p_l = np.dot(xy, panel.rmat[:, :2].T) + panel.tvec \
+                    - np.dot(rmat_s, tvec_s)
+                dist = np.sqrt(np.sum(p_l**2, axis=1))
+                dnrm = np.abs(np.dot(panel.tvec - np.dot(rmat_s, tvec_s),
+                                     panel.normal))
+                cos_a = np.abs(np.dot(p_l, panel.normal))/dist
+                corr *= (dist/dnrm)**2/cos_a
+            if polarization is not None:
+                tth, eta = pixel_angles(
+                    np.ascontiguousarray(
+                        np.vstack([pix_j.flatten(), pix_i.flatten()]).T
+                    )
+                )
+                pfac = 0.5*(1. + np.cos(tth)**2
+                            - polarization*np.cos(2.*eta)*np.sin(tth)**2)
+                corr /= pfac
+        weights = frac
+        weights.data *= corr[weights.indices]
+
+        signature = cls.signature(panel, chi=chi, tvec_s=tvec_s, npdiv=npdiv,
+                                  solid_angle=solid_angle,
+                                  polarization=polarization)
+        return cls(weights, norm, (nrows, ncols), tth_edges, eta_edges,
+                   signature)
+
+    @property
+    def weights(self):
+        """csr matrix of bin weights"""
+        return self._weights
+
+    @property
+    def norm(self):
+        """pixel area fractions in each bin"""
+        return self._norm
+
+    @property
+    def shape(self):
+        """frame shape"""
+        return self._shape
+
+    @property
+    def tth_edges(self):
+        return self._tth_edges
+
+    @property
+    def eta_edges(self):
+        return self._eta_edges
+
+    @property
+    def cake_shape(self):
+        """(neta, ntth)"""
+        return len(self._eta_edges) - 1, len(self._tth_edges) - 1
+
+    def matches(self, signature, tth_edges, eta_edges):
+        """True if the weights are for this geometry and these bins"""
+        return np.array_equal(self._signature, signature) \
+            and np.array_equal(self._tth_edges, tth_edges) \
+            and np.array_equal(self._eta_edges, eta_edges)
+
+    def sums(self, images, frames=None, batch=BATCH_SIZE):
+        """weighted bin sums, array (nframes, neta*ntth)"""
+        out = []
+        for ids, fstack in _frame_batches(images, frames, batch):
+            if fstack.shape[1] != self._weights.shape[1]:
+                raise ValueError(
+                    "frame shape does not match panel: %s" % (self._shape,)
+                )
+            out.append(self._weights.dot(fstack.T).T)
+        if len(out) == 0:
+            return np.zeros((0, self._weights.shape[0]))
+        return np.vstack(out)
+
+    def cake(self, images, frames=None, batch=BATCH_SIZE):
+        """caked frames
+
+        *images* - a frame, an array of frames or an imageseries
+        *frames* - indices of the frames to cake; default is all
+        *batch* - number of frames per sparse matrix product
+
+        returns an array (nframes, neta, ntth) of mean (corrected) pixel
+        intensities; bins without pixels are nan
+        """
+        sums = self.sums(images, frames=frames, batch=batch)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = sums/self._norm
+        out[:, self._norm == 0] = np.nan
+        return out.reshape((len(out),) + self.cake_shape)
+
+    def arrays(self, prefix=''):
+        """dict of arrays for saving"""
+        w = self._weights
+        return {
+            prefix + 'data': w.data,
+            prefix + 'indices': w.indices,
+            prefix + 'indptr': w.indptr,
+            prefix + 'norm': self._norm,
+            prefix + 'shape': self._shape,
+            prefix + 'signature': self._signature,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrs, tth_edges, eta_edges, prefix=''):
+        """instance from arrays made by arrays()"""
+        shape = tuple(arrs[prefix + 'shape'])
+        norm = arrs[prefix + 'norm']
+        weights = sparse.csr_matrix(
+            (arrs[prefix + 'data'], arrs[prefix + 'indices'],
+             arrs[prefix + 'indptr']),
+            shape=(len(norm), shape[0]*shape[1]))
+        return cls(weights, norm, shape, tth_edges, eta_edges,
+                   arrs[prefix + 'signature'])
+
+    pass  # end class
+
+
+class CakingEngine(object):
+    """caking of all panels of an instrument onto a common (tth, eta) grid"""
+
+    def __init__(self, panel_cakers, tth_edges, eta_edges):
+        """Constructor
+
+        *panel_cakers* - dict of PanelCaker instances by panel id
+        *tth_edges*, *eta_edges* - bin edges in radians
+        """
+        self._cakers = panel_cakers
+        self._tth_edges = np.asarray(tth_edges, dtype=float)
+        self._eta_edges = np.asarray(eta_edges, dtype=float)
+
+    @classmethod
+    def build(cls, instr, tth_edges, eta_edges, npdiv=1, solid_angle=False,
+              polarization=None):
+        """make the engine for an HEDMInstrument; see PanelCaker.build"""
+        cakers = dict()
+        for det_key, panel in instr.detectors.iteritems():
+            cakers[det_key] = PanelCaker.build(
+                panel, tth_edges, eta_edges,
+                chi=instr.chi, tvec_s=instr.tvec, npdiv=npdiv,
+                solid_angle=solid_angle, polarization=polarization)
+        return cls(cakers, tth_edges, eta_edges)
+
+    @classmethod
+    def load(cls, fname):
+        """load engine from npz file"""
+        arrs = np.load(fname)
+        tth_edges = arrs['tth_edges']
+        eta_edges = arrs['eta_edges']
+        cakers = dict()
+        for i, det_key in enumerate(arrs['panels']):
+            cakers[str(det_key)] = PanelCaker.from_arrays(
+                arrs, tth_edges, eta_edges, prefix='%d_' % i)
+        return cls(cakers, tth_edges, eta_edges)
+
+    def save(self, fname):
+        """save engine to npz file"""
+        panels = sorted(self._cakers)
+        arrs = dict(panels=np.array(panels), tth_edges=self._tth_edges,
+                    eta_edges=self._eta_edges)
+        for i, det_key in enumerate(panels):
+            arrs.update(self._cakers[det_key].arrays(prefix='%d_' % i))
+        np.savez(fname, **arrs)
+
+    def matches(self, instr, tth_edges, eta_edges, npdiv=1,
+                solid_angle=False, polarization=None):
+        """True if the engine was made for this instrument and these bins"""
+        if set(self._cakers) != set(instr.detectors):
+            return False
+        for det_key, panel in instr.detectors.iteritems():
+            signature = PanelCaker.signature(
+                panel, chi=instr.chi, tvec_s=instr.tvec, npdiv=npdiv,
+                solid_angle=solid_angle, polarization=polarization)
+            if not self._cakers[det_key].matches(signature, tth_edges,
+                                                 eta_edges):
+                return False
+        return True
+
+    @property
+    def panels(self):
+        """dict of PanelCaker instances by panel id"""
+        return self._cakers
+
+    @property
+    def tth_edges(self):
+        return self._tth_edges
+
+    @property
+    def eta_edges(self):
+        return self._eta_edges
+
+    @property
+    def tth_centers(self):
+        return 0.5*(self._tth_edges[1:] + self._tth_edges[:-1])
+
+    @property
+    def eta_centers(self):
+        return 0.5*(self._eta_edges[1:] + self._eta_edges[:-1])
+
+    def cake(self, imgser_dict, frames=None, batch=BATCH_SIZE):
+        """caked frames of all panels
+
+        *imgser_dict* - dict of frames, frame arrays or imageseries by
+                        panel id; panels missing from it are skipped
+        *frames* - indices of the frames to cake; default is all
+        *batch* - number of frames per sparse matrix product
+
+        returns an array (nframes, neta, ntth) of mean (corrected) pixel
+        intensities over all panels; bins without pixels are nan
+        """
+        sums = 0.
+        norm = 0.
+        for det_key, caker in self._cakers.iteritems():
+            if det_key not in imgser_dict:
+                continue
+            sums = sums + caker.sums(imgser_dict[det_key], frames=frames,
+                                     batch=batch)
+            norm = norm + caker.norm
+        sums = np.atleast_2d(sums)
+        norm = np.asarray(norm)*np.ones(sums.shape[1])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out = sums/norm
+        out[:, norm == 0] = np.nan
+        neta = len(self._eta_edges) - 1
+        ntth = len(self._tth_edges) - 1
+        return out.reshape(len(out), neta, ntth)
+
+    pass  # end class
+
+
+def caking_engine(instr, tth_edges, eta_edges, fname=None, npdiv=1,
+                  solid_angle=False, polarization=None):
+    """return caking engine for an instrument, using a saved one if possible
+
+    *instr* - an HEDMInstrument
+    *tth_edges*, *eta_edges* - bin edges in radians
+    *fname* - name of npz file for the weights; they are loaded from it if
+              they match the instrument and options, otherwise built and
+              saved
+    *npdiv*, *solid_angle*, *polarization* - see PanelCaker.build
+    """
+    kwargs = dict(npdiv=npdiv, solid_angle=solid_angle,
+                  polarization=polarization)
+    if fname is not None and os.path.exists(fname):
+        engine = CakingEngine.load(fname)
+        if engine.matches(instr, tth_edges, eta_edges, **kwargs):
+            return engine
+        logging.info('caking weights do not match instrument: %s', fname)
+
+    engine = CakingEngine.build(instr, tth_edges, eta_edges, **kwargs)
+    if fname is not None:
+        engine.save(fname)
+    return engine
@@ -1,22 +1,31 @@
 """Detector module"""
 from __future__ import print_function
 
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
+from scipy import sparse
 
 from hexrd import constants as ct
 from hexrd.gridutil import cellIndices
 from hexrd import matrixutil as mutil
 from hexrd.xrd import xrdutil
 from hexrd.xrd.crystallography import PlaneData
-from hexrd.xrd.transforms_CAPI import anglesToGVec, \
+from hexrd.xrd.rotations import rotMatOfExpMap
+from hexrd.xrd.transforms_CAPI import anglesToDVec, \
+                                      anglesToGVec, \
                                       detectorXYToGvec, \
                                       gvecToDetectorXY, \
+                                      makeOscillRotMatArray, \
                                       makeRotMatOfExpMap, \
                                       mapAngle, \
                                       oscillAnglesOfHKLs, \
                                       rowNorm
 from skimage.draw import polygon
 
+# Default number of grains per block in simulate_rotation_series_multi
+SIM_BLOCK_SIZE = 256
+
 
 class PlanarDetector(object):
     """
@@ -514,6 +523,54 @@ def interpolate_nearest(self, xy, img, pad_with_nans=True):
         int_xy[on_panel] = int_vals
         return int_xy
 
+    def bilinear_stencil(self, xy):
+        """
+        flat pixel indices and weights for bilinear interpolation at xy
+
+        returns a boolean mask of the points on the panel, and arrays
+        (n_on, 4) of the flat indices and weights of the four pixels whose
+        centers surround each of those points
+        """
+        # clip away points too close to or off the edges of the detector
+        xy_clip, on_panel = self.clip_to_panel(xy, buffer_edges=True)
+
+        # grab fractional pixel indices of clipped points
+        ij_frac = self.cartToPixel(xy_clip)
+
+        # get floors/ceils from array of pixel _centers_
+        i_floor = cellIndices(self.row_pixel_vec, xy_clip[:, 1])
+        j_floor = cellIndices(self.col_pixel_vec, xy_clip[:, 0])
+        i_ceil = i_floor + 1
+        j_ceil = j_floor + 1
+
+        wi_floor = i_ceil - ij_frac[:, 0]
+        wi_ceil = ij_frac[:, 0] - i_floor
+        wj_floor = j_ceil - ij_frac[:, 1]
+        wj_ceil = ij_frac[:, 1] - j_floor
+
+        indices = np.vstack([
+            i_floor*self.cols + j_floor, i_floor*self.cols + j_ceil,
+            i_ceil*self.cols + j_floor, i_ceil*self.cols + j_ceil]).T
+        weights = np.vstack([
+            wi_floor*wj_floor, wi_floor*wj_ceil,
+            wi_ceil*wj_floor, wi_ceil*wj_ceil]).T
+        return on_panel, indices, weights
+
+    def interpolation_matrix(self, xy):
+        """
+        sparse bilinear interpolation operator for the points xy
+
+        returns a csr matrix (len(xy), rows*cols), whose product with a
+        flattened image gives the interpolated values, and the boolean mask
+        of the points on the panel; rows of points off the panel are empty
+        """
+        on_panel, indices, weights = self.bilinear_stencil(xy)
+        rows = np.repeat(np.where(on_panel)[0], 4)
+        imat = sparse.csr_matrix(
+            (weights.flatten(), (rows, indices.flatten())),
+            shape=(len(xy), self.rows*self.cols))
+        return imat, on_panel
+
     def interpolate_bilinear(self, xy, img, pad_with_nans=True):
         """
         TODO: revisit normalization in here?
@@ -530,31 +587,8 @@ def interpolate_bilinear(self, xy, img, pad_with_nans=True):
         else:
             int_xy = np.zeros(len(xy))
 
-        # clip away points too close to or off the edges of the detector
-        xy_clip, on_panel = self.clip_to_panel(xy, buffer_edges=True)
-
-        # grab fractional pixel indices of clipped points
-        ij_frac = self.cartToPixel(xy_clip)
-
-        # get floors/ceils from array of pixel _centers_
-        i_floor = cellIndices(self.row_pixel_vec, xy_clip[:, 1])
-        j_floor = cellIndices(self.col_pixel_vec, xy_clip[:, 0])
-        i_ceil = i_floor + 1
-        j_ceil = j_floor + 1
-
-        # first interpolate at top/bottom rows
-        row_floor_int = \
-            (j_ceil - ij_frac[:, 1])*img[i_floor, j_floor] \
-            + (ij_frac[:, 1] - j_floor)*img[i_floor, j_ceil]
-        row_ceil_int = \
-            (j_ceil - ij_frac[:, 1])*img[i_ceil, j_floor] \
-            + (ij_frac[:, 1] - j_floor)*img[i_ceil, j_ceil]
-
-        # next interpolate across cols
-        int_vals = \
-            (i_ceil - ij_frac[:, 0])*row_floor_int \
-            + (ij_frac[:, 0] - i_floor)*row_ceil_int
-        int_xy[on_panel] = int_vals
+        on_panel, indices, weights = self.bilinear_stencil(xy)
+        int_xy[on_panel] = np.sum(img.ravel()[indices]*weights, axis=1)
         return int_xy
 
     def make_powder_rings(
@@ -580,9 +614,8 @@ def make_powder_rings(
                 )
         else:
             # Okay, we have a PlaneData object
-            pd = PlaneData.makeNew(pd)    # make a copy to munge
             if delta_tth is not None:
-                pd.tThWidth = np.radians(delta_tth)
+                pd = pd.view(tThWidth=np.radians(delta_tth))
             else:
                 delta_tth = np.degrees(pd.tThWidth)
 
@@ -768,6 +801,122 @@ def simulate_rotation_series(self, plane_data, grain_param_list,
             ang_pixel_size.append(self.angularPixelSize(xys_p))
         return valid_ids, valid_hkls, valid_angs, valid_xys, ang_pixel_size
 
+    def simulate_rotation_series_multi(self, plane_data, grain_param_list,
+                                       eta_ranges=[(-np.pi, np.pi), ],
+                                       ome_ranges=[(-np.pi, np.pi), ],
+                                       ome_period=(-np.pi, np.pi),
+                                       chi=0., tVec_s=ct.zeros_3,
+                                       wavelength=None,
+                                       block=SIM_BLOCK_SIZE, nthreads=1):
+        """
+        simulate_rotation_series for many grains at once
+
+        The reflections of a block of grains are stacked, so each step is a
+        single vectorized call over all grains and hkls of the block. Blocks
+        are run on nthreads threads.
+
+        Returns flat arrays over all simulated reflections, ordered by
+        grain:
+
+        grain_ids      -- (n, ) index of the grain in grain_param_list
+        hkl_ids        -- (n, ) G-vector ids
+        hkls           -- (n, 3)
+        angs           -- (n, 3) tth, eta, ome
+        xys            -- (n, 2) detector coordinates
+        ang_pixel_size -- (n, 2)
+        """
+        # grab B-matrix from plane data
+        bMat = plane_data.latVecOps['B']
+
+        # reconcile wavelength, as in simulate_rotation_series
+        if wavelength is None:
+            wavelength = plane_data.wavelength
+        else:
+            if plane_data.wavelength != wavelength:
+                plane_data.wavelength = ct.keVToAngstrom(wavelength)
+        assert not np.any(np.isnan(plane_data.getTTh())),\
+            "plane data exclusions incompatible with wavelength"
+
+        # vstacked G-vector id, h, k, l
+        full_hkls = xrdutil._fetch_hkls_from_planedata(plane_data)
+        nhkls = len(full_hkls)
+        gvec_c = np.dot(bMat, full_hkls[:, 1:].T)
+
+        grain_param_list = np.atleast_2d(grain_param_list)
+        tVec_s = np.asarray(tVec_s, dtype=float).flatten()
+        nVec_l = self.rmat[:, 2]
+
+        def simulate_block(g0):
+            gparms = grain_param_list[g0:g0 + block]
+            ngrains = len(gparms)
+            rMat_c = rotMatOfExpMap(gparms[:, :3].T)
+            vInv_s = np.array([mutil.vecMVToSymm(i) for i in gparms[:, 6:]])
+
+            # G-vectors in the (stretched) SAMPLE FRAME of all grains; with
+            # identity B, rMat_c and vInv the kernel does the same arithmetic
+            gvec_s = np.dot(np.matmul(vInv_s, rMat_c), gvec_c).transpose(0, 2, 1)
+            angList = np.vstack(
+                oscillAnglesOfHKLs(
+                    gvec_s.reshape(ngrains*nhkls, 3), chi,
+                    ct.identity_3x3, ct.identity_3x3, wavelength,
+                    vInv=ct.identity_6x1,
+                    beamVec=self.bvec, etaVec=self.evec,
+                    )
+                )
+
+            # filter by eta and omega ranges; rows are grain id, gvec id, hkl
+            grain_hkls = np.hstack([
+                np.repeat(np.arange(g0, g0 + ngrains), nhkls)[:, np.newaxis],
+                np.tile(full_hkls, (ngrains, 1))
+            ])
+            allAngs, allHKLs = xrdutil._filter_hkls_eta_ome(
+                grain_hkls, angList, eta_ranges, ome_ranges
+                )
+            # the two omega solutions come stacked; order by grain instead
+            order = np.argsort(allHKLs[:, 0], kind='mergesort')
+            allAngs = allAngs[order]
+            allHKLs = allHKLs[order]
+            allAngs[:, 2] = mapAngle(allAngs[:, 2], ome_period)
+
+            # intersect the diffracted beams, which leave the grain centroids,
+            # with the detector plane
+            rMat_s = makeOscillRotMatArray(chi, allAngs[:, 2])
+            tVec_c = gparms[allHKLs[:, 0].astype(int) - g0, 3:6]
+            P0_l = np.matmul(rMat_s, tVec_c[:, :, np.newaxis])[:, :, 0] + tVec_s
+            dVec_l = anglesToDVec(
+                np.hstack([allAngs[:, :2], np.zeros((len(allAngs), 1))]),
+                bHat_l=self.bvec, eHat_l=self.evec)
+            denom = np.dot(dVec_l, nVec_l)
+            valid = denom < -ct.epsf
+            u = np.dot(self.tvec - P0_l[valid], nVec_l)/denom[valid]
+            det_xy = np.dot(
+                P0_l[valid] + u[:, np.newaxis]*dVec_l[valid] - self.tvec,
+                self.rmat[:, :2])
+            if self.distortion is not None:
+                det_xy = self.distortion[0](det_xy,
+                                            self.distortion[1],
+                                            invert=True)
+
+            # find points that fall on the panel
+            xys_p, on_panel = self.clip_to_panel(det_xy)
+            allHKLs = allHKLs[valid][on_panel]
+            return (allHKLs[:, 0].astype(int), allHKLs[:, 1].astype(int),
+                    allHKLs[:, 2:], allAngs[valid][on_panel], xys_p,
+                    self.angularPixelSize(xys_p))
+
+        starts = list(range(0, len(grain_param_list), block))
+        if nthreads > 1 and len(starts) > 1:
+            pool = ThreadPool(nthreads)
+            results = pool.map(simulate_block, starts)
+            pool.close()
+        else:
+            results = [simulate_block(i) for i in starts]
+        if len(results) == 0:
+            return (np.zeros(0, dtype=int), np.zeros(0, dtype=int),
+                    np.zeros((0, 3)), np.zeros((0, 3)), np.zeros((0, 2)),
+                    np.zeros((0, 2)))
+        return tuple(np.concatenate(i) for i in zip(*results))
+
     def simulate_laue_pattern(self, crystal_data,
                               minEnergy=5., maxEnergy=35.,
                               rmat_s=None, tvec_s=None,
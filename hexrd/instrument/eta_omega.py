@@ -29,11 +29,13 @@ class GenerateEtaOmeMaps(object):
     """
     def __init__(self, image_series_dict, instrument, plane_data,
                  active_hkls=None, eta_step=0.25, threshold=None,
-                 ome_period=(0, 360)):
+                 ome_period=(0, 360), tile_indices=None):
         """
         image_series must be OmegaImageSeries class
         instrument_params must be a dict (loaded from yaml spec)
         active_hkls must be a list (required for now)
+        tile_indices is an optional dict of imageseries TileIndex
+        instances used to skip empty frames when thresholding
         """
 
         self._planeData = plane_data
@@ -51,7 +53,7 @@ def __init__(self, image_series_dict, instrument, plane_data,
         eta_mapping, etas = instrument.extract_polar_maps(
             plane_data, image_series_dict,
             active_hkls=active_hkls, threshold=threshold,
-            tth_tol=None, eta_tol=eta_step)
+            tth_tol=None, eta_tol=eta_step, tile_indices=tile_indices)
 
         # grab a det key
         # WARNING: this process assumes that the imageseries for all panels
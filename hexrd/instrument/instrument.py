@@ -291,11 +291,16 @@ def write_config(self, filename=None, calibration_dict={}):
 
     def extract_polar_maps(self, plane_data, imgser_dict,
                            active_hkls=None, threshold=None,
-                           tth_tol=None, eta_tol=0.25):
+                           tth_tol=None, eta_tol=0.25,
+                           tile_indices=None):
         """
         Quick and dirty way to histogram angular patch data for make
         pole figures suitable for fiber generation
 
+        If a threshold and a dict of imageseries TileIndex instances
+        (keyed like imgser_dict) are given, frames and eta bins without
+        signal above threshold are skipped without reading the pixels.
+
         TODO: streamline projection code
         TODO: normalization
         """
@@ -359,6 +364,13 @@ def extract_polar_maps(self, plane_data, imgser_dict,
                 nrows_ome = len(omegas)
                 ncols_eta = len(full_etas)
                 this_map = np.nan*np.ones((nrows_ome, ncols_eta))
+                if threshold and tile_indices is not None:
+                    self._fill_polar_map_indexed(
+                        this_map, eta_idx[i_r], ring_map,
+                        imgser_dict[det_key], tile_indices[det_key],
+                        threshold)
+                    ring_maps.append(this_map)
+                    continue
                 for i_row, image in enumerate(imgser_dict[det_key]):
                     psum = np.zeros(len(ring_map))
                     for i_k, k in enumerate(ring_map):
@@ -375,6 +387,26 @@ def extract_polar_maps(self, plane_data, imgser_dict,
             ring_maps_panel[det_key] = ring_maps
         return ring_maps_panel, full_etas
 
+    @staticmethod
+    def _fill_polar_map_indexed(this_map, eta_idx, ring_map, ims, tidx,
+                                threshold):
+        """fill ring map rows, reading only bins with tiles above threshold"""
+        bin_tiles = [tidx.tiles(k[0], k[1]) for k in ring_map]
+        # empty bins average to nan, as in the unindexed loop
+        psum0 = np.array([0. if len(k[0]) > 0 else np.nan for k in ring_map])
+        for i_row in range(len(ims)):
+            tmax = tidx.frame_tiles(i_row)
+            active = [np.any(tmax[t] > threshold) for t in bin_tiles]
+            psum = np.copy(psum0)
+            if np.any(active):
+                image = ims[i_row]
+                for i_k in np.where(active)[0]:
+                    k = ring_map[i_k]
+                    pdata = image[k[0], k[1]]
+                    pdata[pdata <= threshold] = 0
+                    psum[i_k] = np.average(pdata)
+            this_map[i_row, eta_idx] = psum
+
     def extract_line_positions(self, plane_data, imgser_dict,
                                tth_tol=None, eta_tol=1., npdiv=2,
                                collapse_eta=True, collapse_tth=False,
@@ -382,13 +414,18 @@ def extract_line_positions(self, plane_data, imgser_dict,
         """
         export 'caked' sector data over an instrument
 
+        The interpolation operator of each ring is made once and applied to
+        all images. The image data of a patch is an array with the image
+        index first: (n_images, n_tth) if collapse_eta, otherwise
+        (n_images, n_eta, n_tth); with collapse_tth the patch data of a ring
+        is an array (n_patches, n_images).
+
         FIXME: must handle merged ranges (fixed by JVB 2018/06/28)
         """
 
         if not hasattr(plane_data, '__len__'):
-            plane_data = plane_data.makeNew()  # make local copy to munge
             if tth_tol is not None:
-                plane_data.tThWidth = np.radians(tth_tol)
+                plane_data = plane_data.view(tThWidth=np.radians(tth_tol))
             tth_ranges = np.degrees(plane_data.getMergedRanges()[1])
             tth_tols = np.vstack([i[1] - i[0] for i in tth_ranges])
         else:
@@ -440,53 +477,75 @@ def extract_line_positions(self, plane_data, imgser_dict,
                     npdiv=npdiv, quiet=True,
                     beamVec=self.beam_vector)
 
-                # loop over patches
-                # FIXME: fix initialization
-                if collapse_tth:
-                    patch_data = np.zeros((len(angs), n_images))
-                else:
-                    patch_data = []
+                # gather the evaluation points of all patches, so that the
+                # interpolation stencils are made once for all images
+                ang_data = []
+                area_facs = []
+                xy_evals = []
+                pix_idx = []
+                pix_on = []
                 for i_p, patch in enumerate(patches):
                     # strip relevant objects out of current patch
                     vtx_angs, vtx_xy, conn, areas, xy_eval, ijs = patch
                     if collapse_tth:
-                        ang_data = (vtx_angs[0][0, [0, -1]],
-                                    vtx_angs[1][[0, -1], 0])
+                        ang_data.append((vtx_angs[0][0, [0, -1]],
+                                         vtx_angs[1][[0, -1], 0]))
                     else:
-                        ang_data = (vtx_angs[0][0, :],
-                                    angs[i_p][-1])
-                    prows, pcols = areas.shape
-                    area_fac = areas/float(native_area)
+                        ang_data.append((vtx_angs[0][0, :],
+                                         angs[i_p][-1]))
+                    area_facs.append(areas/float(native_area))
                     # need to reshape eval pts for interpolation
-                    xy_eval = np.vstack([
+                    xy_evals.append(np.vstack([
                         xy_eval[0].flatten(),
-                        xy_eval[1].flatten()]).T
-
-                    # interpolate
-                    if not collapse_tth:
-                        ims_data = []
+                        xy_eval[1].flatten()]).T)
+                    # pixels past the panel edge are clipped here and
+                    # masked below, as in the interpolated branch
+                    pix_idx.append(
+                        np.ravel_multi_index(ijs, (panel.rows, panel.cols),
+                                             mode='clip').flatten()
+                    )
+                    pix_on.append(np.logical_and(
+                        np.logical_and(ijs[0] >= 0, ijs[0] < panel.rows),
+                        np.logical_and(ijs[1] >= 0, ijs[1] < panel.cols)
+                    ).flatten())
+                    pass  # close patch loop
+                n_pts = [len(i) for i in xy_evals]
+                offsets = np.hstack([0, np.cumsum(n_pts)])
+
+                # values at all patch points, array (n_images, total points)
+                if do_interpolation:
+                    imat, on_panel = panel.interpolation_matrix(
+                        np.vstack(xy_evals))
+                    ring_vals = np.empty((n_images, offsets[-1]))
                     for j_p, image in enumerate(images):
-                        # catch interpolation type
-                        if do_interpolation:
-                            tmp = panel.interpolate_bilinear(
-                                    xy_eval,
-                                    image,
-                                ).reshape(prows, pcols)*area_fac
-                        else:
-                            tmp = image[ijs[0], ijs[1]]*area_fac
+                        ring_vals[j_p] = imat.dot(image.ravel())
+                    ring_vals[:, ~on_panel] = np.nan
+                else:
+                    flat_idx = np.hstack(pix_idx)
+                    ring_vals = np.array(
+                        [image.ravel()[flat_idx] for image in images],
+                        dtype=float
+                    )
+                    ring_vals[:, ~np.hstack(pix_on)] = np.nan
 
-                        # catch collapsing options
-                        if collapse_tth:
-                            patch_data[i_p, j_p] = np.sum(tmp)
-                            # ims_data.append(np.sum(tmp))
+                # split into patches; arrays are (n_images, ...)
+                if collapse_tth:
+                    patch_data = np.zeros((len(area_facs), n_images))
+                else:
+                    patch_data = []
+                for i_p, area_fac in enumerate(area_facs):
+                    tmp = ring_vals[:, offsets[i_p]:offsets[i_p + 1]].reshape(
+                        (n_images, ) + area_fac.shape)*area_fac
+
+                    # catch collapsing options
+                    if collapse_tth:
+                        patch_data[i_p] = np.sum(tmp, axis=(1, 2))
+                    else:
+                        if collapse_eta:
+                            ims_data = np.sum(tmp, axis=1)
                         else:
-                            if collapse_eta:
-                                ims_data.append(np.sum(tmp, axis=0))
-                            else:
-                                ims_data.append(tmp)
-                        pass  # close image loop
-                    if not collapse_tth:
-                        patch_data.append((ang_data, ims_data))
+                            ims_data = tmp
+                        patch_data.append((ang_data[i_p], ims_data))
                     pass  # close patch loop
                 ring_data.append(patch_data)
                 pass  # close ring loop
@@ -530,6 +589,29 @@ def simulate_rotation_series(self, plane_data, grain_param_list,
                 wavelength=wavelength)
         return results
 
+    def simulate_rotation_series_multi(self, plane_data, grain_param_list,
+                                       eta_ranges=[(-np.pi, np.pi), ],
+                                       ome_ranges=[(-np.pi, np.pi), ],
+                                       ome_period=(-np.pi, np.pi),
+                                       wavelength=None, nthreads=1):
+        """
+        vectorized simulate_rotation_series for many grains
+
+        returns a dict by panel of the flat arrays (grain_ids, hkl_ids, hkls,
+        angs, xys, ang_pixel_size) of
+        PlanarDetector.simulate_rotation_series_multi
+        """
+        results = dict.fromkeys(self.detectors)
+        for det_key, panel in self.detectors.iteritems():
+            results[det_key] = panel.simulate_rotation_series_multi(
+                plane_data, grain_param_list,
+                eta_ranges=eta_ranges,
+                ome_ranges=ome_ranges,
+                ome_period=ome_period,
+                chi=self.chi, tVec_s=self.tvec,
+                wavelength=wavelength, nthreads=nthreads)
+        return results
+
     def pull_spots(self, plane_data, grain_params,
                    imgser_dict,
                    tth_tol=0.25, eta_tol=1., ome_tol=1.,
@@ -539,10 +621,20 @@ def pull_spots(self, plane_data, grain_params,
                    dirname='results', filename=None, output_format='text',
                    save_spot_list=False,
                    quiet=True, check_only=False,
-                   interp='nearest'):
+                   interp='nearest', tile_indices=None,
+                   prediction_cache=None):
         """
         Exctract reflection info from a rotation series encoded as an
         OmegaImageseries object
+
+        tile_indices is an optional dict of imageseries TileIndex
+        instances keyed like imgser_dict; patches whose tiles are all at
+        or below threshold are then skipped without reading pixel data
+        (except when writing hdf5 output, which stores the patch data).
+
+        prediction_cache is an optional PredictionCache for this grain; the
+        simulation and the patch geometry of reflections whose predictions
+        barely moved since the previous call are then reused.
         """
 
         # grain parameters
@@ -573,11 +665,18 @@ def pull_spots(self, plane_data, grain_params,
             label_struct = ndimage.generate_binary_structure(3, 3)
 
         # simulate rotation series
-        sim_results = self.simulate_rotation_series(
-            plane_data, [grain_params, ],
-            eta_ranges=eta_ranges,
-            ome_ranges=ome_ranges,
-            ome_period=ome_period)
+        if prediction_cache is None:
+            sim_results = self.simulate_rotation_series(
+                plane_data, [grain_params, ],
+                eta_ranges=eta_ranges,
+                ome_ranges=ome_ranges,
+                ome_period=ome_period)
+        else:
+            sim_results = prediction_cache.simulate(
+                self, plane_data, grain_params,
+                eta_ranges=eta_ranges,
+                ome_ranges=ome_ranges,
+                ome_period=ome_period)
 
         # patch vertex generator (global for instrument)
         tol_vec = 0.5*np.radians(
@@ -619,6 +718,10 @@ def pull_spots(self, plane_data, grain_params,
 
             # pull out the OmegaImageSeries for this panel from input dict
             ome_imgser = imgser_dict[detector_id]
+            tidx = None
+            if tile_indices is not None and not (
+                    filename is not None and output_format.lower() == 'hdf5'):
+                tidx = tile_indices[detector_id]
 
             # extract simulation results
             sim_results_p = sim_results[detector_id]
@@ -630,28 +733,57 @@ def pull_spots(self, plane_data, grain_params,
 
             # now verify that full patch falls on detector...
             # ???: strictly necessary?
-            #
-            # patch vertex array from sim
-            nangs = len(ang_centers)
-            patch_vertices = (
-                np.tile(ang_centers[:, :2], (1, 4)) +
-                np.tile(tol_vec, (nangs, 1))
-            ).reshape(4*nangs, 2)
-            ome_dupl = np.tile(
-                ang_centers[:, 2], (4, 1)
-            ).T.reshape(len(patch_vertices), 1)
-
-            # find vertices that all fall on the panel
-            det_xy, _ = xrdutil._project_on_detector_plane(
-                np.hstack([patch_vertices, ome_dupl]),
-                panel.rmat, rMat_c, self.chi,
-                panel.tvec, tVec_c, self.tvec,
-                panel.distortion)
-            _, on_panel = panel.clip_to_panel(det_xy, buffer_edges=True)
-
-            # all vertices must be on...
-            patch_is_on = np.all(on_panel.reshape(nangs, 4), axis=1)
-            patch_xys = det_xy.reshape(nangs, 4, 2)[patch_is_on]
+            def reflection_patches(idx):
+                """on-panel flags, vertex xys and patches of reflections"""
+                # patch vertex array from sim
+                nangs = len(idx)
+                patch_vertices = (
+                    np.tile(ang_centers[idx, :2], (1, 4)) +
+                    np.tile(tol_vec, (nangs, 1))
+                ).reshape(4*nangs, 2)
+                ome_dupl = np.tile(
+                    ang_centers[idx, 2], (4, 1)
+                ).T.reshape(len(patch_vertices), 1)
+
+                # find vertices that all fall on the panel
+                det_xy, _ = xrdutil._project_on_detector_plane(
+                    np.hstack([patch_vertices, ome_dupl]),
+                    panel.rmat, rMat_c, self.chi,
+                    panel.tvec, tVec_c, self.tvec,
+                    panel.distortion)
+                _, on_panel = panel.clip_to_panel(det_xy, buffer_edges=True)
+
+                # all vertices must be on...
+                patch_is_on = np.all(on_panel.reshape(nangs, 4), axis=1)
+                patch_xys = det_xy.reshape(nangs, 4, 2)
+
+                # make the tth,eta patches for interpolation
+                patches = [None]*nangs
+                if not check_only and np.any(patch_is_on):
+                    on_idx = idx[patch_is_on]
+                    made = xrdutil.make_reflection_patches(
+                        instr_cfg, ang_centers[on_idx, :2],
+                        ang_pixel_size[on_idx],
+                        omega=ang_centers[on_idx, 2],
+                        tth_tol=tth_tol, eta_tol=eta_tol,
+                        rMat_c=rMat_c, tVec_c=tVec_c,
+                        distortion=panel.distortion,
+                        npdiv=npdiv, quiet=True,
+                        beamVec=self.beam_vector)
+                    for i, patch in zip(np.where(patch_is_on)[0], made):
+                        patches[i] = patch
+                return patch_is_on, patch_xys, patches
+
+            if prediction_cache is None:
+                patch_is_on, patch_xys, patches = reflection_patches(
+                    np.arange(len(ang_centers)))
+            else:
+                patch_is_on, patch_xys, patches = prediction_cache.patches(
+                    detector_id, (tth_tol, eta_tol, npdiv, check_only),
+                    panel, hkl_ids, ang_centers, xy_centers, ang_pixel_size,
+                    np.radians(delta_ome), reflection_patches)
+            patch_xys = patch_xys[patch_is_on]
+            patches = [p for p, on in zip(patches, patch_is_on) if on]
 
             # re-filter...
             hkl_ids = hkl_ids[patch_is_on]
@@ -685,23 +817,16 @@ def pull_spots(self, plane_data, grain_params,
                         ijs = panel.cartToPixel(these_vertices)
                         ii, jj = polygon(ijs[:, 0], ijs[:, 1])
                         contains_signal = False
-                        for i_frame in frame_indices:
-                            contains_signal = contains_signal or np.any(
-                                ome_imgser[i_frame][ii, jj] > threshold
-                            )
+                        if tidx is None or tidx.any_above(
+                                frame_indices, tidx.tiles(ii, jj), threshold):
+                            for i_frame in frame_indices:
+                                contains_signal = contains_signal or np.any(
+                                    ome_imgser.gather(i_frame, ii, jj)
+                                    > threshold
+                                )
                         compl.append(contains_signal)
                         patch_output.append((ii, jj, frame_indices))
             else:
-                # make the tth,eta patches for interpolation
-                patches = xrdutil.make_reflection_patches(
-                    instr_cfg, ang_centers[:, :2], ang_pixel_size,
-                    omega=ang_centers[:, 2],
-                    tth_tol=tth_tol, eta_tol=eta_tol,
-                    rMat_c=rMat_c, tVec_c=tVec_c,
-                    distortion=panel.distortion,
-                    npdiv=npdiv, quiet=True,
-                    beamVec=self.beam_vector)
-
                 # GRAND LOOP over reflections for this panel
                 patch_output = []
                 for i_pt, patch in enumerate(patches):
@@ -754,15 +879,22 @@ def pull_spots(self, plane_data, grain_params,
 
                         # quick check for intensity
                         contains_signal = False
-                        patch_data_raw = []
-                        for i_frame in frame_indices:
-                            tmp = ome_imgser[i_frame][ijs[0], ijs[1]]
-                            contains_signal = contains_signal or np.any(
-                                tmp > threshold
-                            )
-                            patch_data_raw.append(tmp)
-                            pass
-                        patch_data_raw = np.stack(patch_data_raw, axis=0)
+                        if tidx is not None and not tidx.any_above(
+                                frame_indices, tidx.tiles(ijs[0], ijs[1]),
+                                threshold):
+                            # nothing above threshold; skip pixel data
+                            patch_data_raw = None
+                        else:
+                            patch_data_raw = []
+                            for i_frame in frame_indices:
+                                tmp = ome_imgser.gather(
+                                    i_frame, ijs[0], ijs[1])
+                                contains_signal = contains_signal or np.any(
+                                    tmp > threshold
+                                )
+                                patch_data_raw.append(tmp)
+                                pass
+                            patch_data_raw = np.stack(patch_data_raw, axis=0)
                         compl.append(contains_signal)
 
                         if contains_signal:
@@ -0,0 +1,138 @@
+"""Cache of reflection predictions and patch geometry for pull_spots
+
+When a grain is refit, pull_spots is called over and over with grain
+parameters that barely change. The cache keeps the simulated reflections
+for (quantized) grain parameters, and the patch geometry of each
+reflection for each set of tolerances. A patch is reused as long as its
+reflection's predicted center has moved by less than a fraction of a
+pixel; only the reflections that moved further are recomputed.
+"""
+import numpy as np
+
+# Default largest shift of a predicted center, in pixels, for reusing a patch
+MAX_SHIFT = 0.25
+
+# Default quantum of grain parameters for reusing a simulation
+PARAM_QUANTUM = 1.e-10
+
+
+class PredictionCache(object):
+    """reflection predictions and patch geometry of one grain"""
+
+    def __init__(self, max_shift=MAX_SHIFT, param_quantum=PARAM_QUANTUM):
+        """Constructor
+
+        *max_shift* - patches are reused if the predicted center moved by at
+                      most this many pixels, and its omega by at most this
+                      many frames; 0 reuses only unmoved patches
+        *param_quantum* - grain parameters equal after rounding to this
+                          quantum share their simulation
+        """
+        self._max_shift = max_shift
+        self._param_quantum = param_quantum
+        self._sim_key = None
+        self._sim = None
+        self._patches = dict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_shift(self):
+        return self._max_shift
+
+    def clear(self):
+        self._sim_key = None
+        self._sim = None
+        self._patches = dict()
+
+    def simulate(self, instr, plane_data, grain_params, **kwargs):
+        """instr.simulate_rotation_series for one grain, reused if possible
+
+        kwargs are passed on to simulate_rotation_series
+        """
+        key = (
+            tuple(np.rint(np.asarray(grain_params)/self._param_quantum)),
+            repr(sorted((k, np.asarray(v).tolist())
+                        for k, v in kwargs.items()))
+        )
+        if key != self._sim_key:
+            self._sim = instr.simulate_rotation_series(
+                plane_data, [grain_params, ], **kwargs)
+            self._sim_key = key
+        return self._sim
+
+    def patches(self, det_key, tol_key, panel, hkl_ids, ang_centers,
+                xy_centers, ang_pixel_size, delta_ome, compute):
+        """patch data of reflections, reusing cached patches that still fit
+
+        *det_key* - panel id
+        *tol_key* - hashable key of the patch tolerances and options
+        *panel* - the PlanarDetector, for the pixel size
+        *hkl_ids*, *ang_centers*, *xy_centers*, *ang_pixel_size* - the
+            predicted reflections
+        *delta_ome* - the omega step of the frames, in radians
+        *compute* - function of an index array of reflections returning
+            their on-panel flags, vertex coordinates (n, 4, 2) and list of
+            patches
+
+        returns the on-panel flags, vertex coordinates and patches of all
+        reflections
+        """
+        nrefl = len(hkl_ids)
+        use = -np.ones(nrefl, dtype=int)
+        cached = self._patches.get((det_key, tol_key))
+        if cached is not None and nrefl > 0:
+            c_ids, c_angs, c_xys, c_on, c_vtx, c_patches = cached
+            pix = np.r_[panel.pixel_size_col, panel.pixel_size_row]
+
+            # cached reflections of each hkl id are order[lo:hi]; an hkl
+            # has few reflections, so loop over the j-th candidates
+            order = np.argsort(c_ids, kind='mergesort')
+            lo = np.searchsorted(c_ids[order], hkl_ids, side='left')
+            hi = np.searchsorted(c_ids[order], hkl_ids, side='right')
+            best = np.inf*np.ones(nrefl)
+            for j in range(int(np.max(hi - lo))):
+                i = np.where(lo + j < hi)[0]
+                cand = order[lo[i] + j]
+                shift = np.max(np.abs(c_xys[cand] - xy_centers[i])/pix,
+                               axis=1)
+                dome = np.abs(c_angs[cand, 2] - ang_centers[i, 2])
+                ok = np.logical_and(
+                    np.logical_and(shift <= self._max_shift,
+                                   dome <= self._max_shift*delta_ome),
+                    shift < best[i])
+                use[i[ok]] = cand[ok]
+                best[i[ok]] = shift[ok]
+
+        # recompute the rest
+        redo = np.where(use < 0)[0]
+        self.hits += nrefl - len(redo)
+        self.misses += len(redo)
+        is_on = np.zeros(nrefl, dtype=bool)
+        vtx = np.zeros((nrefl, 4, 2))
+        patches = [None]*nrefl
+        if len(redo) > 0:
+            r_on, r_vtx, r_patches = compute(redo)
+            is_on[redo] = r_on
+            vtx[redo] = r_vtx
+            for i, p in zip(redo, r_patches):
+                patches[i] = p
+
+        # cached entries keep the centers their patches were made for
+        keep = np.where(use >= 0)[0]
+        centers = np.array(ang_centers, dtype=float)
+        xys = np.array(xy_centers, dtype=float)
+        if len(keep) > 0:
+            is_on[keep] = c_on[use[keep]]
+            vtx[keep] = c_vtx[use[keep]]
+            centers[keep] = c_angs[use[keep]]
+            xys[keep] = c_xys[use[keep]]
+            for i in keep:
+                patches[i] = c_patches[use[i]]
+
+        self._patches[(det_key, tol_key)] = (
+            np.array(hkl_ids), centers, xys, is_on, vtx, patches
+        )
+        return is_on, vtx, patches
+
+    pass  # end class
@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+
+from hexrd import imageseries
+from hexrd import instrument
+from hexrd.imageseries.omega import OmegaImageSeries
+from hexrd.xrd import material
+
+_ENERGY = 65.351  # keV
+
+
+class InstrumentTest(unittest.TestCase):
+    pass
+
+
+def make_instrument(rows=256, cols=256, pixel_size=(1.6, 1.6),
+                    distortion=None):
+    """single panel instrument, normal to the beam 1 m downstream"""
+    beam = instrument.beam.Beam(_ENERGY, np.r_[0., 0., -1.])
+    panel = instrument.PlanarDetector(
+        rows=rows, cols=cols, pixel_size=pixel_size,
+        tvec=np.r_[0., 0., -1000.], tilt=np.r_[0.001, -0.002, 0.003],
+        distortion=distortion)
+    stage = instrument.oscillation_stage.OscillationStage(np.zeros(3), 0.)
+    return instrument.HEDMInstrument(beam, {'panel': panel}, stage)
+
+
+def make_plane_data(tth_max=12.):
+    mat = material.Material('nickel')
+    mat.sgnum = 225
+    mat.latticeParameters = [3.52]
+    mat.hklMax = 10
+    pd = mat.planeData
+    pd.wavelength = _ENERGY
+    pd.tThMax = np.radians(tth_max)
+    return pd
+
+
+def make_omega_series(rows=256, cols=256, nframes=90, seed=0):
+    """poisson noise over a full rotation, 360/nframes degrees per frame"""
+    rng = np.random.RandomState(seed)
+    step = 360./nframes
+    omega = np.empty((nframes, 2))
+    omega[:, 0] = -180. + step*np.arange(nframes)
+    omega[:, 1] = omega[:, 0] + step
+    data = rng.poisson(5, (nframes, rows, cols)).astype(float)
+    ims = imageseries.open(None, 'array', data=data, meta=dict(omega=omega))
+    return OmegaImageSeries(ims)
+
+
+def make_grain_params(n=1, seed=0):
+    """(n, 12) random orientations at the origin, unstrained"""
+    rng = np.random.RandomState(seed)
+    gparams = np.tile(np.r_[0., 0., 0., 0., 0., 0., 1., 1., 1., 0., 0., 0.],
+                      (n, 1))
+    gparams[:, :3] = rng.uniform(-1, 1, (n, 3))
+    return gparams
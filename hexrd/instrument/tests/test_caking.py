@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from hexrd.instrument import caking
+
+from .common import InstrumentTest, make_instrument
+
+
+class TestCaking(InstrumentTest):
+
+    def setUp(self):
+        self.instr = make_instrument(rows=64, cols=64, pixel_size=(3.2, 3.2))
+        self.panel = self.instr.detectors['panel']
+        self.tth, self.eta = self.panel.pixel_angles
+        self.tth_edges = np.linspace(self.tth.min(), self.tth.max(), 11)
+        self.eta_edges = np.linspace(-np.pi, np.pi, 9)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_tth_image(self):
+        """Caking: a frame of pixel tth values gives the bin tth"""
+        engine = caking.CakingEngine.build(self.instr, self.tth_edges,
+                                           self.eta_edges)
+        cake = engine.cake({'panel': self.tth})[0]
+        self.assertEqual(cake.shape, (8, 10))
+
+        # binning the pixel centers directly
+        it = caking._bin_index(self.tth_edges, self.tth.ravel())
+        ie = caking._bin_index(self.eta_edges, self.eta.ravel())
+        on = np.logical_and(it >= 0, ie >= 0)
+        flat = ie[on]*10 + it[on]
+        count = np.bincount(flat, minlength=80)
+        total = np.bincount(flat, weights=self.tth.ravel()[on],
+                            minlength=80)
+        filled = count > 0
+        self.assertTrue(np.array_equal(np.isfinite(cake.ravel()), filled))
+        self.assertTrue(np.allclose(cake.ravel()[filled],
+                                    total[filled]/count[filled]))
+
+        # every bin mean lies in its bin, near its center
+        centers = np.tile(engine.tth_centers, (8, 1))
+        width = self.tth_edges[1] - self.tth_edges[0]
+        dev = np.abs(cake - centers)[np.isfinite(cake)]
+        self.assertTrue(np.all(dev <= 0.5*width))
+        self.assertTrue(np.median(dev) < 0.1*width)
+
+    def test_save_load(self):
+        """Caking: weights saved and reloaded"""
+        fname = os.path.join(self.tmpdir, 'cake.npz')
+        e1 = caking.caking_engine(self.instr, self.tth_edges, self.eta_edges,
+                                  fname=fname, npdiv=2)
+        e2 = caking.CakingEngine.load(fname)
+        self.assertTrue(e2.matches(self.instr, self.tth_edges,
+                                   self.eta_edges, npdiv=2))
+        self.assertFalse(e2.matches(self.instr, self.tth_edges,
+                                    self.eta_edges, npdiv=1))
+        frames = np.random.RandomState(0).uniform(size=(3, 64, 64))
+        c1 = e1.cake({'panel': frames})
+        c2 = caking.caking_engine(self.instr, self.tth_edges, self.eta_edges,
+                                  fname=fname, npdiv=2).cake(
+                                      {'panel': frames})
+        self.assertTrue(np.array_equal(np.isnan(c1), np.isnan(c2)))
+        self.assertTrue(np.array_equal(c1[np.isfinite(c1)],
+                                       c2[np.isfinite(c2)]))
+
+    def test_moved_panel(self):
+        """Caking: saved weights rejected after the panel moved"""
+        fname = os.path.join(self.tmpdir, 'cake.npz')
+        caking.caking_engine(self.instr, self.tth_edges, self.eta_edges,
+                             fname=fname)
+        moved = make_instrument(rows=64, cols=64, pixel_size=(3.2, 3.2))
+        panel = moved.detectors['panel']
+        panel.tvec = panel.tvec + np.r_[1., 0., 0.]
+        engine = caking.CakingEngine.load(fname)
+        self.assertTrue(engine.matches(self.instr, self.tth_edges,
+                                       self.eta_edges))
+        self.assertFalse(engine.matches(moved, self.tth_edges,
+                                        self.eta_edges))
+        rebuilt = caking.caking_engine(moved, self.tth_edges, self.eta_edges,
+                                       fname=fname)
+        self.assertTrue(rebuilt.matches(moved, self.tth_edges,
+                                        self.eta_edges))
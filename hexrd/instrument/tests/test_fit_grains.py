@@ -0,0 +1,114 @@
+import copy
+import Queue
+import shutil
+import tempfile
+
+import numpy as np
+
+from hexrd import imageseries
+from hexrd.actions.fit_grains import FitGrainsWorker, FitGrainsWorkerThread
+
+from .common import (
+    InstrumentTest, make_instrument, make_plane_data, make_grain_params
+)
+
+NFRAMES = 90
+
+
+def make_spot_series(instr, pd, gparams, seed=0):
+    """poisson noise with a bright 3x3 spot at each predicted reflection"""
+    rng = np.random.RandomState(seed)
+    panel = instr.detectors['panel']
+    step = 360./NFRAMES
+    omega = np.empty((NFRAMES, 2))
+    omega[:, 0] = -180. + step*np.arange(NFRAMES)
+    omega[:, 1] = omega[:, 0] + step
+    data = rng.poisson(5, (NFRAMES, panel.rows, panel.cols)).astype(float)
+    _, _, angs, xys, _ = panel.simulate_rotation_series(
+        pd, gparams, chi=instr.chi, tVec_s=instr.tvec)
+    for gangs, gxys in zip(angs, xys):
+        ij = np.floor(panel.cartToPixel(gxys)).astype(int)
+        frames = np.floor(
+            (np.degrees(gangs[:, 2]) + 180.) % 360./step).astype(int)
+        for (i, j), k in zip(ij, frames):
+            if 1 <= i < panel.rows - 1 and 1 <= j < panel.cols - 1:
+                data[k, i-1:i+2, j-1:j+2] += 200.
+    return imageseries.open(None, 'array', data=data, meta=dict(omega=omega))
+
+
+class TestFitGrainsWorkers(InstrumentTest):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pd = make_plane_data()
+        cls.gparams = make_grain_params(n=4, seed=2)
+        cls.ims = {'panel': make_spot_series(make_instrument(), cls.pd,
+                                             cls.gparams)}
+
+    def setUp(self):
+        self.tmpdirs = []
+
+    def tearDown(self):
+        for tmpdir in self.tmpdirs:
+            shutil.rmtree(tmpdir)
+
+    def pkwargs(self):
+        tmpdir = tempfile.mkdtemp()
+        self.tmpdirs.append(tmpdir)
+        return {
+            'analysis_directory': tmpdir,
+            'eta_range': [(-np.pi, np.pi), ],
+            'eta_tol': [2., 1.],
+            'fit_only': False,
+            'max_patch_shift': None,
+            'npdiv': 2,
+            'omega_period': np.radians([-180., 180.]),
+            'omega_tol': [8., 6.],
+            'panel_buffer': [2., 2.],
+            'plane_data': self.pd,
+            'refit_tol': None,
+            'spots_stem': 'spots_%05d.out',
+            'threshold': 25,
+            'tth_tol': [0.5, 0.25],
+        }
+
+    def jobs(self):
+        jobs = Queue.Queue()
+        for i, gparams in enumerate(self.gparams):
+            # start off the true parameters, so there is something to fit
+            estimate = np.array(gparams)
+            estimate[:3] += 1e-3
+            jobs.put((i, estimate))
+        return jobs
+
+    def test_threads(self):
+        """Fit grains: worker threads give the serial results"""
+        serial = []
+        FitGrainsWorker(self.jobs(), serial, self.ims, make_instrument(),
+                        self.pkwargs()).run()
+        self.assertEqual(len(serial), len(self.gparams))
+        for result, gparams in zip(sorted(serial), self.gparams):
+            # the grains are found, to within the 1.6 mm pixels
+            self.assertTrue(result[2] > 0.9)
+            self.assertTrue(np.allclose(result[1][:3], gparams[:3],
+                                        atol=5e-3))
+
+        threaded = []
+        jobs = self.jobs()
+        instr = make_instrument()
+        pkwargs = self.pkwargs()
+        workers = [FitGrainsWorkerThread(jobs, threaded, self.ims, instr,
+                                         copy.deepcopy(pkwargs))
+                   for i in range(3)]
+        for w in workers:
+            w.daemon = True
+            w.start()
+        for w in workers:
+            w.join()
+
+        self.assertEqual(len(threaded), len(serial))
+        for mine, ref in zip(sorted(threaded), sorted(serial)):
+            self.assertEqual(mine[0], ref[0])
+            self.assertEqual(mine[2], ref[2])
+            for a, b in zip(mine[1:], ref[1:]):
+                self.assertTrue(np.array_equal(a, b))
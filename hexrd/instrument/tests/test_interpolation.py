@@ -0,0 +1,68 @@
+import numpy as np
+
+from .common import InstrumentTest, make_instrument, make_plane_data
+
+
+class TestInterpolation(InstrumentTest):
+
+    def setUp(self):
+        self.instr = make_instrument(rows=64, cols=96, pixel_size=(1., 1.))
+        self.panel = self.instr.detectors['panel']
+        rng = np.random.RandomState(0)
+        # points over and around the panel, some off it
+        self.xy = np.vstack([rng.uniform(-60., 60., 500),
+                             rng.uniform(-40., 40., 500)]).T
+        self.img = rng.uniform(size=(64, 96))
+
+    def test_matrix(self):
+        """Interpolation: matrix and stencil agree with interpolate_bilinear"""
+        panel = self.panel
+        expected = panel.interpolate_bilinear(self.xy, self.img)
+        imat, on_panel = panel.interpolation_matrix(self.xy)
+        found = imat.dot(self.img.ravel())
+        self.assertTrue(np.any(~on_panel) and np.any(on_panel))
+        self.assertTrue(np.array_equal(np.isnan(expected), ~on_panel))
+        self.assertTrue(np.allclose(found[on_panel], expected[on_panel]))
+        self.assertTrue(np.all(found[~on_panel] == 0.))
+
+        on, indices, weights = panel.bilinear_stencil(self.xy)
+        self.assertTrue(np.array_equal(on, on_panel))
+        self.assertTrue(np.allclose(weights.sum(axis=1), 1.))
+
+    def test_linear_image(self):
+        """Interpolation: exact for an image linear in the pixel indices"""
+        panel = self.panel
+        i, j = np.meshgrid(np.arange(64), np.arange(96), indexing='ij')
+        img = 2.*i - 3.*j + 1.
+        vals = panel.interpolate_bilinear(self.xy, img)
+        on = np.isfinite(vals)
+        ij = panel.cartToPixel(self.xy[on])
+        self.assertTrue(np.allclose(vals[on], 2.*ij[:, 0] - 3.*ij[:, 1] + 1.))
+
+    def test_line_positions_off_panel(self):
+        """Interpolation: off-panel pixels are NaN, not wrapped"""
+        instr = make_instrument(rows=64, cols=96, pixel_size=(2.5, 2.5))
+        panel = instr.detectors['panel']
+        panel.panel_buffer = np.r_[2.5, 2.5]
+        pd = make_plane_data(tth_max=6.)
+        tth = pd.getTTh()
+
+        # a full ring; make_powder_rings keeps only patches wholly on
+        # the panel, but this ring runs off the top and bottom edges
+        eta = np.radians(np.arange(-180., 180., 10.))
+        angs = np.vstack([np.tile(tth, len(eta)), eta]).T
+
+        def full_rings(*args, **kwargs):
+            return [angs], [panel.angles_to_cart(angs)]
+        panel.make_powder_rings = full_rings
+
+        img = np.arange(64*96).reshape(64, 96)
+        for interp in (True, False):
+            data = instr.extract_line_positions(
+                pd, {'panel': img}, tth_tol=0.2, eta_tol=5., npdiv=1,
+                collapse_eta=False, do_interpolation=interp)
+            vals = np.hstack(
+                [patch[1].flatten() for patch in data['panel'][0]]
+            )
+            self.assertTrue(np.any(np.isnan(vals)))
+            self.assertTrue(np.any(np.isfinite(vals)))
@@ -0,0 +1,69 @@
+import numpy as np
+
+from hexrd.instrument import PredictionCache
+
+from .common import InstrumentTest, make_instrument, make_plane_data, \
+    make_omega_series, make_grain_params
+
+
+def same_output(a, b):
+    """pull_spots outputs are equal"""
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and \
+            all(same_output(i, j) for i, j in zip(a, b))
+    if isinstance(a, dict):
+        return sorted(a) == sorted(b) and \
+            all(same_output(a[k], b[k]) for k in a)
+    return np.array_equal(a, b)
+
+
+class TestPredictionCache(InstrumentTest):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.instr = make_instrument()
+        cls.pd = make_plane_data()
+        cls.ims = {'panel': make_omega_series()}
+        cls.gparams = make_grain_params()[0]
+
+    def pull(self, gparams, cache=None):
+        return self.instr.pull_spots(
+            self.pd, gparams, self.ims,
+            tth_tol=0.5, eta_tol=2., ome_tol=8., threshold=8,
+            prediction_cache=cache)
+
+    def shifted(self, dx):
+        """grain parameters moved by dx mm along the lab x axis"""
+        gparams = np.array(self.gparams)
+        gparams[3] += dx
+        return gparams
+
+    def test_unmoved(self):
+        """Prediction cache: max_shift 0 matches the uncached output"""
+        ref = self.pull(self.gparams)
+        cache = PredictionCache(max_shift=0.)
+        first = self.pull(self.gparams, cache)
+        nrefl = cache.misses
+        self.assertTrue(nrefl > 0)
+        self.assertEqual(cache.hits, 0)
+        second = self.pull(self.gparams, cache)
+        self.assertEqual(cache.hits, nrefl)
+        self.assertEqual(cache.misses, nrefl)
+        self.assertTrue(same_output(first, ref))
+        self.assertTrue(same_output(second, ref))
+
+    def test_shift_threshold(self):
+        """Prediction cache: patches reused below the shift threshold"""
+        cache = PredictionCache(max_shift=0.25)
+        self.pull(self.gparams, cache)
+        nrefl = cache.misses
+
+        # ~0.03 pixel: every patch reused
+        self.pull(self.shifted(0.05), cache)
+        self.assertEqual(cache.hits, nrefl)
+        self.assertEqual(cache.misses, nrefl)
+
+        # ~2 pixels: every patch recomputed
+        self.pull(self.shifted(3.), cache)
+        self.assertEqual(cache.hits, nrefl)
+        self.assertEqual(cache.misses, 2*nrefl)
@@ -0,0 +1,64 @@
+import numpy as np
+
+from hexrd.xrd import distortion
+
+from .common import (
+    InstrumentTest, make_instrument, make_plane_data, make_grain_params
+)
+
+
+class TestSimulateMulti(InstrumentTest):
+
+    def setUp(self):
+        dparams = [2.e-4, -3.e-4, 1.e-4, 2., 1., 2.]
+        self.instr = make_instrument(
+            rows=1024, cols=1024, pixel_size=(0.4, 0.4),
+            distortion=(distortion.GE_41RT, dparams))
+        self.pd = make_plane_data()
+
+        # translated and strained grains
+        rng = np.random.RandomState(1)
+        gparams = make_grain_params(n=25, seed=1)
+        gparams[:, 3:6] = rng.uniform(-0.5, 0.5, (25, 3))
+        gparams[:, 6:] += rng.uniform(-1.e-3, 1.e-3, (25, 6))
+        self.gparams = gparams
+
+    def check_panel(self, panel, multi):
+        grain_ids, hkl_ids, hkls, angs, xys, ang_ps = multi
+        for i, gp in enumerate(self.gparams):
+            ids, ghkls, gangs, gxys, gps = panel.simulate_rotation_series(
+                self.pd, [gp], chi=self.instr.chi,
+                tVec_s=self.instr.tvec)
+            mine = grain_ids == i
+            self.assertTrue(np.array_equal(hkl_ids[mine], ids[0]))
+            self.assertTrue(np.array_equal(hkls[mine], ghkls[0]))
+            self.assertTrue(np.allclose(angs[mine], gangs[0],
+                                        rtol=0, atol=1e-10))
+            self.assertTrue(np.allclose(xys[mine], gxys[0],
+                                        rtol=0, atol=1e-9))
+            self.assertTrue(np.allclose(ang_ps[mine], gps[0],
+                                        rtol=0, atol=1e-10))
+        self.assertTrue(np.all(np.diff(grain_ids) >= 0))
+
+    def test_panel(self):
+        """Multi-grain simulation: same as the per-grain loop"""
+        panel = self.instr.detectors['panel']
+        multi = panel.simulate_rotation_series_multi(
+            self.pd, self.gparams, chi=self.instr.chi,
+            tVec_s=self.instr.tvec, block=7)
+        self.assertTrue(len(multi[0]) > 0)
+        self.check_panel(panel, multi)
+
+    def test_threads(self):
+        """Multi-grain simulation: blocks run on threads"""
+        panel = self.instr.detectors['panel']
+        multi = panel.simulate_rotation_series_multi(
+            self.pd, self.gparams, chi=self.instr.chi,
+            tVec_s=self.instr.tvec, block=4, nthreads=3)
+        self.check_panel(panel, multi)
+
+    def test_instrument(self):
+        """Multi-grain simulation: instrument wrapper"""
+        results = self.instr.simulate_rotation_series_multi(
+            self.pd, self.gparams)
+        self.check_panel(self.instr.detectors['panel'], results['panel'])
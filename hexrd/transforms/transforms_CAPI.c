@@ -33,7 +33,9 @@ static PyMethodDef _transform_methods[] = {
   {"validateAngleRanges",validateAngleRanges,METH_VARARGS,""},
   {"rotate_vecs_about_axis",rotate_vecs_about_axis,METH_VARARGS,"Rotate vectors about an axis"},
   {"quat_distance",quat_distance,METH_VARARGS,"Compute distance between two unit quaternions"},
+  {"quat_distances",quat_distances,METH_VARARGS,"Compute distances between two lists of unit quaternions"},
   {"homochoricOfQuat",homochoricOfQuat,METH_VARARGS,"Compute homochoric parameterization of list of unit quaternions"},
+  {"setNumThreads",setNumThreads,METH_VARARGS,"Set the number of threads of the parallel kernels"},
   {NULL,NULL}
 };
 
@@ -99,10 +101,12 @@ static PyObject * anglesToGVec(PyObject * self, PyObject * args)
   gVec_c_ptr = (double*)PyArray_DATA(gVec_c);
 
   /* Call the actual function */
+  Py_BEGIN_ALLOW_THREADS
   anglesToGvec_cfunc(nvecs, angs_ptr,
 		     bHat_l_ptr, eHat_l_ptr,
 		     chi, rMat_c_ptr,
 		     gVec_c_ptr);
+  Py_END_ALLOW_THREADS
 
   /* Build and return the nested data structure */
   return((PyObject*)gVec_c);
@@ -161,10 +165,12 @@ static PyObject * anglesToDVec(PyObject * self, PyObject * args)
   dVec_c_ptr = (double*)PyArray_DATA(dVec_c);
 
   /* Call the actual function */
+  Py_BEGIN_ALLOW_THREADS
   anglesToDvec_cfunc(nvecs, angs_ptr,
 		     bHat_l_ptr, eHat_l_ptr,
 		     chi, rMat_c_ptr,
 		     dVec_c_ptr);
+  Py_END_ALLOW_THREADS
 
   /* Build and return the nested data structure */
   return((PyObject*)dVec_c);
@@ -269,11 +275,13 @@ static PyObject * gvecToDetectorXY(PyObject * self, PyObject * args)
   result_Ptr     = (double*)PyArray_DATA(result);
 
   /* Call the computational routine */
+  Py_BEGIN_ALLOW_THREADS
   gvecToDetectorXY_cfunc(npts, gVec_c_Ptr,
 			 rMat_d_Ptr, rMat_s_Ptr, rMat_c_Ptr,
 			 tVec_d_Ptr, tVec_s_Ptr, tVec_c_Ptr,
 			 beamVec_Ptr,
 			 result_Ptr);
+  Py_END_ALLOW_THREADS
 
   /* Build and return the nested data structure */
   return((PyObject*)result);
@@ -378,11 +386,13 @@ static PyObject * gvecToDetectorXYArray(PyObject * self, PyObject * args)
   result_Ptr     = (double*)PyArray_DATA(result);
 
   /* Call the computational routine */
+  Py_BEGIN_ALLOW_THREADS
   gvecToDetectorXYArray_cfunc(npts, gVec_c_Ptr,
 			 rMat_d_Ptr, rMat_s_Ptr, rMat_c_Ptr,
 			 tVec_d_Ptr, tVec_s_Ptr, tVec_c_Ptr,
 			 beamVec_Ptr,
 			 result_Ptr);
+  Py_END_ALLOW_THREADS
 
   /* Build and return the nested data structure */
   return((PyObject*)result);
@@ -486,11 +496,13 @@ static PyObject * detectorXYToGvec(PyObject * self, PyObject * args)
   etaVec_Ptr  = (double*)PyArray_DATA(etaVec);
 
   /* Call the computational routine */
+  Py_BEGIN_ALLOW_THREADS
   detectorXYToGvec_cfunc(npts, xy_Ptr,
 			 rMat_d_Ptr, rMat_s_Ptr,
 			 tVec_d_Ptr, tVec_s_Ptr, tVec_c_Ptr,
 			 beamVec_Ptr, etaVec_Ptr,
 			 tTh_Ptr, eta_Ptr, gVec_l_Ptr);
+  Py_END_ALLOW_THREADS
 
   /* Build and return the nested data structure */
   /* Note that Py_BuildValue with 'O' increases reference count */
@@ -606,11 +618,13 @@ static PyObject * detectorXYToGvecArray(PyObject * self, PyObject * args)
   etaVec_Ptr  = (double*)PyArray_DATA(etaVec);
 
   /* Call the computational routine */
+  Py_BEGIN_ALLOW_THREADS
   detectorXYToGvecArray_cfunc(npts, xy_Ptr,
                               rMat_d_Ptr, rMat_s_Ptr,
                               tVec_d_Ptr, tVec_s_Ptr, tVec_c_Ptr,
                               beamVec_Ptr, etaVec_Ptr,
                               tTh_Ptr, eta_Ptr, gVec_l_Ptr);
+  Py_END_ALLOW_THREADS
 
   /* Build and return the nested data structure */
   /* Note that Py_BuildValue with 'O' increases reference count */
@@ -691,10 +705,12 @@ static PyObject * oscillAnglesOfHKLs(PyObject * self, PyObject * args)
   oangs1_Ptr  = (double*)PyArray_DATA(oangs1);
 
   /* Call the computational routine */
+  Py_BEGIN_ALLOW_THREADS
   oscillAnglesOfHKLs_cfunc(npts, hkls_Ptr, chi_d,
 			   rMat_c_Ptr, bMat_Ptr, wavelen_d,
 			   vInv_s_Ptr, beamVec_Ptr, etaVec_Ptr,
 			   oangs0_Ptr, oangs1_Ptr);
+  Py_END_ALLOW_THREADS
 
   /* Build and return the list data structure */
   return_tuple = Py_BuildValue("OO",oangs0,oangs1);
@@ -786,7 +802,9 @@ static PyObject * unitRowVectors(PyObject *self, PyObject *args)
   cIn  = (double*)PyArray_DATA(vecIn);
   cOut = (double*)PyArray_DATA(vecOut);
 
+  Py_BEGIN_ALLOW_THREADS
   unitRowVectors_cfunc(m,n,cIn,cOut);
+  Py_END_ALLOW_THREADS
 
   return((PyObject*)vecOut);
 }
@@ -891,9 +909,11 @@ static PyObject * makeOscillRotMatArray(PyObject * self, PyObject * args)
   rPtr = (double*)PyArray_DATA(rMat);
 
   /* Call the actual function repeatedly */
+  Py_BEGIN_ALLOW_THREADS
   for (i = 0; i < no; ++i) {
       makeOscillRotMat_cfunc(chi, oPtr[i], rPtr + i*9);
   }
+  Py_END_ALLOW_THREADS
 
   return((PyObject*)rMat);
 }
@@ -965,7 +985,9 @@ static PyObject * makeRotMatOfQuat(PyObject * self, PyObject * args)
   rPtr = (double*)PyArray_DATA(rMat);
 
   /* Call the actual function */
+  Py_BEGIN_ALLOW_THREADS
   makeRotMatOfQuat_cfunc(nq, qPtr, rPtr);
+  Py_END_ALLOW_THREADS
 
   return((PyObject*)rMat);
 }
@@ -1082,7 +1104,9 @@ static PyObject * validateAngleRanges(PyObject * self, PyObject * args)
   rPtr   = (bool*)PyArray_DATA(reflInRange);
 
   /* Call the actual function */
+  Py_BEGIN_ALLOW_THREADS
   validateAngleRanges_cfunc(na,aPtr,nmin,minPtr,maxPtr,rPtr,ccwVal);
+  Py_END_ALLOW_THREADS
 
   return((PyObject*)reflInRange);
 }
@@ -1127,7 +1151,9 @@ static PyObject * rotate_vecs_about_axis(PyObject * self, PyObject * args)
   rPtr    = (double*)PyArray_DATA(rVecs);
 
   /* Call the actual function */
+  Py_BEGIN_ALLOW_THREADS
   rotate_vecs_about_axis_cfunc(na,aPtr,nax0,axesPtr,nv0,vecsPtr,rPtr);
+  Py_END_ALLOW_THREADS
 
   return((PyObject*)rVecs);
 }
@@ -1163,7 +1189,9 @@ static PyObject * quat_distance(PyObject * self, PyObject * args)
   qsymPtr = (double*)PyArray_DATA(qsym);
 
   /* Call the actual function */
+  Py_BEGIN_ALLOW_THREADS
   dist = quat_distance_cfunc(nsym,q1Ptr,q2Ptr,qsymPtr);
+  Py_END_ALLOW_THREADS
   if (dist < 0) {
     PyErr_SetString(PyExc_RuntimeError, "Could not allocate memory");
     return NULL;
@@ -1171,6 +1199,56 @@ static PyObject * quat_distance(PyObject * self, PyObject * args)
   return(PyFloat_FromDouble(dist));
 }
 
+static PyObject * quat_distances(PyObject * self, PyObject * args)
+{
+  PyArrayObject *q1, *q2, *qsym, *dist;
+  double *q1Ptr, *q2Ptr, *qsymPtr, *dPtr;
+  int dq1, dq2, dqsym;
+  int nq1, nq2, nqsym, nsym;
+  npy_intp n1, n2, dims[2];
+  int status;
+
+  /* Parse arguments */
+  if ( !PyArg_ParseTuple(args,"OOO", &q1,&q2,&qsym)) return(NULL);
+  if ( q1 == NULL || q2 == NULL || qsym == NULL ) return(NULL);
+
+  /* Verify shape of input arrays */
+  dq1   = PyArray_NDIM(q1);
+  dq2   = PyArray_NDIM(q2);
+  dqsym = PyArray_NDIM(qsym);
+  assert( dq1 == 2 && dq2 == 2 && dqsym == 2 );
+
+  /* Verify dimensions of input arrays; all are (n, 4) */
+  n1    = PyArray_DIMS(q1)[0];
+  nq1   = PyArray_DIMS(q1)[1];
+  n2    = PyArray_DIMS(q2)[0];
+  nq2   = PyArray_DIMS(q2)[1];
+  nsym  = PyArray_DIMS(qsym)[0];
+  nqsym = PyArray_DIMS(qsym)[1];
+  assert( nq1 == 4 && nq2 == 4 && nqsym == 4 );
+
+  /* Allocate the result matrix with appropriate dimensions and type */
+  dims[0] = n1; dims[1] = n2;
+  dist = (PyArrayObject*)PyArray_EMPTY(2,dims,NPY_DOUBLE,0);
+
+  /* Grab pointers to the various data arrays */
+  q1Ptr   = (double*)PyArray_DATA(q1);
+  q2Ptr   = (double*)PyArray_DATA(q2);
+  qsymPtr = (double*)PyArray_DATA(qsym);
+  dPtr    = (double*)PyArray_DATA(dist);
+
+  /* Call the actual function */
+  Py_BEGIN_ALLOW_THREADS
+  status = quat_distances_cfunc(nsym,qsymPtr,n1,q1Ptr,n2,q2Ptr,dPtr);
+  Py_END_ALLOW_THREADS
+  if (status < 0) {
+    Py_DECREF(dist);
+    PyErr_SetString(PyExc_RuntimeError, "Could not allocate memory");
+    return NULL;
+  }
+  return((PyObject*)dist);
+}
+
 static PyObject * homochoricOfQuat(PyObject * self, PyObject * args)
 {
   PyArrayObject *quat, *hVec;
@@ -1206,7 +1284,19 @@ static PyObject * homochoricOfQuat(PyObject * self, PyObject * args)
   hPtr = (double*)PyArray_DATA(hVec);
 
   /* Call the actual function */
+  Py_BEGIN_ALLOW_THREADS
   homochoricOfQuat_cfunc(nq, qPtr, hPtr);
+  Py_END_ALLOW_THREADS
 
   return((PyObject*)hVec);
 }
+
+static PyObject * setNumThreads(PyObject * self, PyObject * args)
+{
+  int n;
+
+  /* Parse arguments */
+  if ( !PyArg_ParseTuple(args,"i", &n)) return(NULL);
+
+  return(PyInt_FromLong(setNumThreads_cfunc(n)));
+}
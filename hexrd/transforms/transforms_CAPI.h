@@ -76,4 +76,8 @@ static PyObject * rotate_vecs_about_axis(PyObject * self, PyObject * args);
 
 static PyObject * quat_distance(PyObject * self, PyObject * args);
 
+static PyObject * quat_distances(PyObject * self, PyObject * args);
+
 static PyObject * homochoricOfQuat(PyObject * self, PyObject * args);
+
+static PyObject * setNumThreads(PyObject * self, PyObject * args);
@@ -6,6 +6,10 @@
 
 #include "transforms_CFUNC.h"
 
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
 /*
  * Microsoft's C compiler, when running in C mode, does not support the inline
  * keyword. However it does support an __inline one.
@@ -41,6 +45,13 @@ static double epsf      = 2.2e-16;
 static double sqrt_epsf = 1.5e-8;
 static double Zl[3] = {0.0,0.0,1.0};
 
+/*
+ * Minimum number of points for the per-point loops to run in parallel;
+ * smaller problems are not worth the thread startup. Without OpenMP the
+ * pragmas are ignored and all loops run serially.
+ */
+#define OMP_MIN_POINTS 10000
+
 
 /******************************************************************************/
 /* Functions */
@@ -341,6 +352,7 @@ void anglesToGvec_cfunc(long int nvecs, double * angs,
     makeEtaFrameRotMat_cfunc(bHat_l, eHat_l, rMat_e);
 
     /* make vector array */
+#pragma omp parallel for private(j, k, l, rMat_s, rMat_ctst, gVec_e, gVec_l, gVec_c_tmp) if (nvecs > OMP_MIN_POINTS)
     for (i = 0; i < nvecs; i++) {
         /* components in BEAM frame */
         gVec_e[0] = cos(0.5*angs[3*i]) * cos(angs[3*i+1]);
@@ -397,6 +409,7 @@ void anglesToDvec_cfunc(long int nvecs, double * angs,
     makeEtaFrameRotMat_cfunc(bHat_l, eHat_l, rMat_e);
 
     /* make vector array */
+#pragma omp parallel for private(j, k, l, rMat_s, rMat_ctst, gVec_e, gVec_l, gVec_c_tmp) if (nvecs > OMP_MIN_POINTS)
     for (i=0; i<nvecs; i++) {
 	double c0 = cos(angs[3*i]);
 	double c1 = cos(angs[3*i+1]);
@@ -649,6 +662,7 @@ void gvecToDetectorXYArray_cfunc(long int npts, double * gVec_c,
     /* Normalize the beam vector */
     unitRowVector_cfunc(3,beamVec,bHat_l);
 
+#pragma omp parallel for private(j, k, l, num, nVec_l, P0_l, P3_l, rMat_sc) if (npts > OMP_MIN_POINTS)
     for (i=0L; i < npts; i++) {
         /* Initialize the detector normal and frame origins */
         num = 0.0;
@@ -724,6 +738,7 @@ void gvecToDetectorXY_cfunc(long int npts, double * gVec_c,
       }
     }
 
+#pragma omp parallel for if (npts > OMP_MIN_POINTS)
   for (i=0L; i<npts; i++) {
     gvecToDetectorXYOne_cfunc(&gVec_c[3*i], rMat_d, rMat_sc, tVec_d,
                   bHat_l, nVec_l, num,
@@ -850,6 +865,7 @@ void detectorXYToGvec_cfunc(long int npts, double * xy,
     }
   }
 
+#pragma omp parallel for if (npts > OMP_MIN_POINTS)
   for (i=0; i<npts; i++) {
         detectorXYToGVecOne_cfunc(xy+2*i, rMat_d, rMat_e, tVec1, bVec, tTh + i, eta + i, gVec_l + 3*i);
     }
@@ -894,6 +910,7 @@ void detectorXYToGvecArray_cfunc(long int npts, double * xy,
       }
     }
 
+#pragma omp parallel for private(j, k, tVec1) if (npts > OMP_MIN_POINTS)
     for (i=0; i<npts; i++) {
         /* Compute shift vector */
     for (j=0; j<3; j++) {
@@ -1491,6 +1508,67 @@ double quat_distance_cfunc(int nsym, double * q1, double * q2, double * qsym)
   return(dist);
 }
 
+int quat_distances_cfunc(int nsym, double * qsym,
+                        long int n1, double * q1,
+                        long int n2, double * q2,
+                        double * dist)
+{
+  /*
+   * Misorientation angles between each of the n1 quaternions in q1 and
+   * each of the n2 quaternions in q2, both (n, 4) row-major, written to
+   * the (n1, n2) array dist. The arithmetic is that of quat_distance_cfunc,
+   * so the results are the same, but the symmetric equivalents of q2 are
+   * only computed once.
+   */
+  long int i, j;
+  int k;
+  double q0, q0_max;
+  double *q2s, *qs;
+
+  if ( NULL == (q2s = (double *)malloc(4*nsym*n2*sizeof(double))) ) {
+      return(-1);
+  }
+
+  /* symmetric equivalents of each q2 */
+  for (j=0; j<n2; j++) {
+    double *q = q2 + 4*j;
+    qs = q2s + 4*nsym*j;
+    for (k=0; k<nsym; k++) {
+      qs[4*k+0] = q[0]*qsym[4*k+0] - q[1]*qsym[4*k+1] - q[2]*qsym[4*k+2] - q[3]*qsym[4*k+3];
+      qs[4*k+1] = q[1]*qsym[4*k+0] + q[0]*qsym[4*k+1] - q[3]*qsym[4*k+2] + q[2]*qsym[4*k+3];
+      qs[4*k+2] = q[2]*qsym[4*k+0] + q[3]*qsym[4*k+1] + q[0]*qsym[4*k+2] - q[1]*qsym[4*k+3];
+      qs[4*k+3] = q[3]*qsym[4*k+0] - q[2]*qsym[4*k+1] + q[1]*qsym[4*k+2] + q[0]*qsym[4*k+3];
+    }
+  }
+
+#pragma omp parallel for private(j, k, q0, q0_max, qs) if (n1*n2 > OMP_MIN_POINTS)
+  for (i=0; i<n1; i++) {
+    double *p = q1 + 4*i;
+    for (j=0; j<n2; j++) {
+      qs = q2s + 4*nsym*j;
+      q0_max = 0.0;
+      for (k=0; k<nsym; k++) {
+        q0 = p[0]*qs[4*k+0] + p[1]*qs[4*k+1] + p[2]*qs[4*k+2] + p[3]*qs[4*k+3];
+        if ( fabs(q0) > q0_max ) {
+          q0_max = fabs(q0);
+        }
+      }
+
+      if ( q0_max <= 1.0 )
+        dist[n2*i+j] = 2.0*acos(q0_max);
+      else if ( q0_max - 1. < 1e-12 )
+        /* in case of quats loaded from single precision file */
+        dist[n2*i+j] = 0.;
+      else
+        dist[n2*i+j] = NAN;
+    }
+  }
+
+  free(q2s);
+
+  return(0);
+}
+
 void homochoricOfQuat_cfunc(int nq, double * qPtr, double * hPtr)
 {
   int i;
@@ -1519,3 +1597,16 @@ void homochoricOfQuat_cfunc(int nq, double * qPtr, double * hPtr)
     }
   }
 }
+
+int setNumThreads_cfunc(int n)
+{
+  /* set the number of threads of the parallel loops; returns the number
+     in use, which is always 1 without OpenMP */
+#ifdef _OPENMP
+  if (n > 0)
+    omp_set_num_threads(n);
+  return omp_get_max_threads();
+#else
+  return 1;
+#endif
+}
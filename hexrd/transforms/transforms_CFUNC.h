@@ -92,4 +92,11 @@ void rotate_vecs_about_axis_cfunc(long int na, double * angles,
 
 double quat_distance_cfunc(int nsym, double * q1, double * q2, double * qsym);
 
+int quat_distances_cfunc(int nsym, double * qsym,
+			 long int n1, double * q1,
+			 long int n2, double * q2,
+			 double * dist);
+
 void homochoricOfQuat_cfunc(int nq, double * qPtr, double * hPtr);
+
+int setNumThreads_cfunc(int n);
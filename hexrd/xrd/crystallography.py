@@ -514,6 +514,12 @@ class PlaneData(object):
     if not None, tThWidth takes priority over strainMag in setting
     two-theta ranges; changing strainMag automatically turns off
     tThWidth
+
+    Derived quantities (two-theta values and ranges, merged ranges,
+    symmetric hkls, ...) are memoized; the cache is cleared by the
+    setters for lparms, wavelength, strainMag, exclusions and tThMax, and
+    keyed on tThWidth where it matters.  Use view() for cheap read-only
+    access that shares the cached arrays instead of copying them.
     """
 
     def __init__(self,
@@ -525,6 +531,7 @@ def __init__(self,
         self.__doTThSort = True
         self.__exclusions = None
         self.__tThMax = None
+        self.__cache = dict()
         #
         if len(args) == 4:
             lparms, laueGroup, wavelength, strainMag = args
@@ -570,7 +577,24 @@ def __init__(self,
 
         return
 
+    def __invalidate(self):
+        self.__cache.clear()
+        return
+
+    def _memo(self, key, func):
+        """
+        cached value of func() under key; func must return read-only arrays,
+        as the cached values are shared
+        """
+        try:
+            retval = self.__cache[key]
+        except KeyError:
+            retval = func()
+            self.__cache[key] = retval
+        return retval
+
     def __calc(self):
+        self.__invalidate()
         symmGroup = symmetry.ltypeOfLaueGroup(self.__laueGroup)
         latPlaneData, latVecOps, hklDataList = PlaneData.makePlaneData(
             self.__hkls, self.__lparms, self.__qsym, symmGroup, self.__strainMag, self.wavelength)
@@ -630,6 +654,7 @@ def get_tThMax(self):
     def set_tThMax(self, tThMax):
         self.__tThMax = toFloat(tThMax, 'radians')
         # self.__calc() # no need to redo calc for tThMax
+        self.__invalidate()
         return
     tThMax = property(get_tThMax, set_tThMax, None)
 
@@ -661,6 +686,7 @@ def set_exclusions(self, exclusions):
                     raise RuntimeError, \
                         'do not now what to do with exclusions with shape '+str(exclusions.shape)
         self.__exclusions = excl
+        self.__invalidate()
         self.nHKLs = num.sum(num.logical_not(self.__exclusions))
         return
     exclusions = property(get_exclusions, set_exclusions, None)
@@ -782,11 +808,11 @@ def getPlaneSpacings(self):
         """
         gets plane spacings
         """
-        dspacings = []
-        for iHKLr, hklData in enumerate(self.hklDataList):
-            if not self.__thisHKL(iHKLr): continue
-            dspacings.append(hklData['dSpacings'])
-        return dspacings
+        return list(self._getPlaneSpacings())
+    def _getPlaneSpacings(self):
+        def calc():
+            return [hklData['dSpacings'] for hklData in self.__included()]
+        return self._memo('dspacings', calc)
     def getPlaneNormals(self):
         """
         gets both +(hkl) and -(hkl) normals
@@ -802,10 +828,30 @@ def getLatticeOperators(self):
         gets lattice vector operators as a new (deepcopy)
         """
         return copy.deepcopy(self.__latVecOps)
+    def _getLatticeOperators(self):
+        """
+        shared lattice vector operators with read-only arrays
+        """
+        def calc():
+            retval = dict()
+            for key, val in self.__latVecOps.iteritems():
+                if isinstance(val, num.ndarray):
+                    val = _readOnly(num.array(val))
+                retval[key] = val
+            return retval
+        return self._memo('latVecOps', calc)
     def setLatticeOperators(self, val):
         raise RuntimeError, 'do not set latVecOps directly, change other things instead'
     latVecOps = property(getLatticeOperators, setLatticeOperators, None)
 
+    def __included(self):
+        """
+        hklData of the included hkls, in 2-theta order
+        """
+        def calc():
+            return [hklData for iHKLr, hklData in enumerate(self.hklDataList)
+                    if self.__thisHKL(iHKLr)]
+        return self._memo('included', calc)
     def __thisHKL(self,iHKLr):
         retval = True
         hklData   = self.hklDataList[iHKLr]
@@ -819,10 +865,13 @@ def __thisHKL(self,iHKLr):
         return retval
     def __getTThRange(self,iHKLr):
         hklData = self.hklDataList[iHKLr]
-        if self.tThWidth is not None: # tThHi-tThLo < self.tThWidth
+        return PlaneData.__hklTThRange(hklData, self.tThWidth)
+    @staticmethod
+    def __hklTThRange(hklData, tThWidth):
+        if tThWidth is not None: # tThHi-tThLo < tThWidth
             tTh   = hklData['tTheta']
-            tThHi = tTh + self.tThWidth * 0.5
-            tThLo = tTh - self.tThWidth * 0.5
+            tThHi = tTh + tThWidth * 0.5
+            tThLo = tTh - tThWidth * 0.5
         else:
             tThHi = hklData['tThetaHi']
             tThLo = hklData['tThetaLo']
@@ -834,30 +883,46 @@ def getTThRanges(self, strainMag=None, lparms=None):
         return array is n x 2
         """
         if lparms is None:
+            if strainMag is None:
+                return num.array(self._getTThRanges(self.tThWidth))
             tThRanges = []
-            for iHKLr, hklData in enumerate(self.hklDataList):
-                if not self.__thisHKL(iHKLr): continue
-                #tThRanges.append([hklData['tThetaLo'], hklData['tThetaHi']])
-                if strainMag is None:
-                    tThRanges.append(self.__getTThRange(iHKLr))
-                else:
-                    hklData = self.hklDataList[iHKLr]
-                    d = hklData['dSpacings']
-                    tThLo = 2.0 * num.arcsin(self.__wavelength / 2.0 / (d*(1.+strainMag)))
-                    tThHi = 2.0 * num.arcsin(self.__wavelength / 2.0 / (d*(1.-strainMag)))
-                    tThRanges.append((tThLo, tThHi))
+            for hklData in self.__included():
+                d = hklData['dSpacings']
+                tThLo = 2.0 * num.arcsin(self.__wavelength / 2.0 / (d*(1.+strainMag)))
+                tThHi = 2.0 * num.arcsin(self.__wavelength / 2.0 / (d*(1.-strainMag)))
+                tThRanges.append((tThLo, tThHi))
         else:
             new = self.__class__(self.__hkls, self)
             new.lparms = lparms
             tThRanges = new.getTThRanges(strainMag=strainMag)
         return num.array(tThRanges)
+    def _getTThRanges(self, tThWidth):
+        """
+        shared read-only 2-theta ranges of the included hkls for tThWidth
+        """
+        def calc():
+            tThRanges = [PlaneData.__hklTThRange(hklData, tThWidth)
+                         for hklData in self.__included()]
+            return _readOnly(num.array(tThRanges))
+        return self._memo(('tThRanges', tThWidth), calc)
     def getMergedRanges(self, cullDupl=False):
         """
         return indices and ranges for specified planeData, merging where
         there is overlap based on the tThWidth and line positions
         """
-        tThs      = self.getTTh()
-        tThRanges = self.getTThRanges()
+        iHKLLists, mergedRanges = self._getMergedRanges(self.tThWidth,
+                                                        cullDupl)
+        return [list(i) for i in iHKLLists], [list(i) for i in mergedRanges]
+    def _getMergedRanges(self, tThWidth, cullDupl=False):
+        """
+        shared merged ranges for tThWidth; do not modify
+        """
+        return self._memo(
+            ('mergedRanges', tThWidth, cullDupl),
+            lambda: self.__calcMergedRanges(tThWidth, cullDupl))
+    def __calcMergedRanges(self, tThWidth, cullDupl):
+        tThs      = self._getTTh()
+        tThRanges = self._getTThRanges(tThWidth)
 
         # if you end exlcusions in a doublet (or multiple close rings)
         # then this will 'fail'.  May need to revisit...
@@ -887,17 +952,28 @@ def getMergedRanges(self, cullDupl=False):
     def makeNew(self):
         new = self.__class__(None, self)
         return new
+    def view(self, **kwargs):
+        """
+        read-only view sharing the cached quantities of this PlaneData;
+        kwargs may override tThWidth for the view only
+        """
+        return PlaneDataView(self, **kwargs)
     def getTTh(self, lparms=None):
         if lparms is None:
-            tTh = []
-            for iHKLr, hklData in enumerate(self.hklDataList):
-                if not self.__thisHKL(iHKLr): continue
-                tTh.append(hklData['tTheta'])
+            return num.array(self._getTTh())
         else:
             new = self.makeNew()
             new.lparms = lparms
             tTh = new.getTTh()
         return num.array(tTh)
+    def _getTTh(self):
+        """
+        shared read-only 2-theta of the included hkls
+        """
+        def calc():
+            tTh = [hklData['tTheta'] for hklData in self.__included()]
+            return _readOnly(num.array(tTh))
+        return self._memo('tTh', calc)
     def getDD_tThs_lparms(self):
         """
         derivatives of tThs with respect to lattice parameters;
@@ -928,11 +1004,13 @@ def getDD_tThs_lparms(self):
         return ddtTh
 
     def getMultiplicity(self):          # ... JVB: is this incorrect?
-        multip = []
-        for iHKLr, hklData in enumerate(self.hklDataList):
-            if not self.__thisHKL(iHKLr): continue
-            multip.append( hklData['symHKLs'].shape[1] )
-        return num.array(multip)
+        return num.array(self._getMultiplicity())
+    def _getMultiplicity(self):
+        def calc():
+            multip = [hklData['symHKLs'].shape[1]
+                      for hklData in self.__included()]
+            return _readOnly(num.array(multip))
+        return self._memo('multiplicity', calc)
 
     def getHKLID(self, hkl):
         'can call on a single hkl or list of hkls'
@@ -961,6 +1039,11 @@ def getHKLs(self, asStr=False, thisTTh=None, allHKLs=False):
         if pass thisTTh, then only return hkls overlapping the specified 2-theta;
         if set allHKLs to true, the ignore exlcusions, tThMax, etc
         """
+        if thisTTh is None:
+            hkls = self._getHKLs(allHKLs=allHKLs)
+            if asStr:
+                return map(hklToStr, hkls)
+            return num.array(hkls)
         hkls = []
         for iHKLr, hklData in enumerate(self.hklDataList):
             if not allHKLs:
@@ -977,30 +1060,52 @@ def getHKLs(self, asStr=False, thisTTh=None, allHKLs=False):
         else:
             retval = num.array(hkls)
         return retval
+    def _getHKLs(self, allHKLs=False):
+        """
+        shared read-only hkls in 2-theta order
+        """
+        def calc():
+            if allHKLs:
+                hklDataList = self.hklDataList
+            else:
+                hklDataList = self.__included()
+            return _readOnly(num.array(
+                [hklData['hkl'] for hklData in hklDataList]))
+        return self._memo(('hkls', allHKLs), calc)
     def getSymHKLs(self, asStr=False, withID=False, indices=None):
         """
         new function that returns all symmetric hkls
         """
-        retval = []
-        iRetval = 0
-        if indices is not None:
-            indB = num.zeros(self.nHKLs,dtype=bool)
-            indB[num.array(indices)] = True
+        if asStr:
+            copier = list
         else:
-            indB = num.ones(self.nHKLs,dtype=bool)
-        for iHKLr, hklData in enumerate(self.hklDataList):
-            if not self.__thisHKL(iHKLr): continue
-            if indB[iRetval]:
+            copier = num.array
+        return [copier(i) for i in
+                self._getSymHKLs(asStr=asStr, withID=withID, indices=indices)]
+    def _getSymHKLs(self, asStr=False, withID=False, indices=None):
+        """
+        shared symmetric hkls; arrays are read-only, lists must not be
+        modified
+        """
+        def calc():
+            retval = []
+            for hklData in self.__included():
                 hkls = hklData['symHKLs']
                 if asStr:
                     myStr = lambda x: re.sub('\[|\]|\(|\)','',str(x))
                     retval.append(map(myStr, num.array(hkls).T))
                 elif withID:
-                    retval.append(num.vstack([num.tile(hklData['hklID'], (1, hkls.shape[1])),
-                                              hkls]))
+                    retval.append(_readOnly(num.vstack(
+                        [num.tile(hklData['hklID'], (1, hkls.shape[1])),
+                         hkls])))
                 else:
-                    retval.append(num.array(hkls))
-            iRetval += 1
+                    retval.append(_readOnly(num.array(hkls)))
+            return retval
+        retval = self._memo(('symHKLs', bool(asStr), bool(withID)), calc)
+        if indices is not None:
+            indB = num.zeros(self.nHKLs,dtype=bool)
+            indB[num.array(indices)] = True
+            retval = [retval[i] for i in num.where(indB)[0]]
         return retval
     def getCentroSymHKLs(self):
         retval = []
@@ -1128,6 +1233,121 @@ def calcStructFactor(self,atominfo):
 
         return FSquared
 
+class PlaneDataView(object):
+    """
+    Cheap read-only view of a PlaneData
+
+    Shares the memoized quantities of the underlying PlaneData instead of
+    copying them, so arrays returned here are read-only and lists must not
+    be modified.  The view follows later changes of the PlaneData, except
+    for tThWidth, which may be overridden for the view:
+
+        pd_view = planeData.view(tThWidth=num.radians(0.25))
+
+    Use makeNew() for a modifiable PlaneData.
+    """
+
+    def __init__(self, planeData, **kwargs):
+        if isinstance(planeData, PlaneDataView):
+            if not kwargs.has_key('tThWidth'):
+                kwargs['tThWidth'] = planeData.tThWidth
+            planeData = planeData.planeData
+        object.__setattr__(self, '_planeData', planeData)
+        object.__setattr__(self, '_overrideTThWidth',
+                           kwargs.has_key('tThWidth'))
+        object.__setattr__(self, '_tThWidth', kwargs.pop('tThWidth', None))
+        if len(kwargs) > 0:
+            raise RuntimeError, 'have unparsed keyword arguments with keys: '+str(kwargs.keys())
+
+    def __setattr__(self, name, value):
+        raise RuntimeError, \
+            'PlaneDataView is read-only; use makeNew() for a modifiable copy'
+
+    @property
+    def planeData(self):
+        return self._planeData
+
+    @property
+    def tThWidth(self):
+        if self._overrideTThWidth:
+            return self._tThWidth
+        return self._planeData.tThWidth
+
+    @property
+    def phaseID(self):
+        return self._planeData.phaseID
+
+    @property
+    def nHKLs(self):
+        return self._planeData.nHKLs
+
+    @property
+    def hkls(self):
+        return self.getHKLs().T
+
+    @property
+    def lparms(self):
+        return self._planeData.lparms
+
+    @property
+    def wavelength(self):
+        return self._planeData.wavelength
+
+    @property
+    def strainMag(self):
+        return self._planeData.strainMag
+
+    @property
+    def tThMax(self):
+        return self._planeData.tThMax
+
+    @property
+    def exclusions(self):
+        return self._planeData.exclusions
+
+    @property
+    def latVecOps(self):
+        return self._planeData._getLatticeOperators()
+
+    def getNHKLs(self):
+        return self.nHKLs
+    def getPhaseID(self):
+        return self.phaseID
+    def getParams(self):
+        return self._planeData.getParams()[:4] + (self.tThWidth, )
+    def getLatticeType(self):
+        return self._planeData.getLatticeType()
+    def getLaueGroup(self):
+        return self._planeData.getLaueGroup()
+    def getQSym(self):
+        return self._planeData.getQSym()
+    def getTTh(self):
+        return self._planeData._getTTh()
+    def getTThRanges(self):
+        return self._planeData._getTThRanges(self.tThWidth)
+    def getMergedRanges(self, cullDupl=False):
+        return self._planeData._getMergedRanges(self.tThWidth, cullDupl)
+    def getHKLs(self, allHKLs=False):
+        return self._planeData._getHKLs(allHKLs=allHKLs)
+    def getSymHKLs(self, withID=False, indices=None):
+        return self._planeData._getSymHKLs(withID=withID, indices=indices)
+    def getMultiplicity(self):
+        return self._planeData._getMultiplicity()
+    def getPlaneSpacings(self):
+        return self._planeData._getPlaneSpacings()
+    def view(self, **kwargs):
+        return PlaneDataView(self, **kwargs)
+    def _memo(self, key, func):
+        return self._planeData._memo(key, func)
+    def makeNew(self):
+        new = self._planeData.makeNew()
+        new.tThWidth = self.tThWidth
+        return new
+
+def _readOnly(a):
+    a.flags.writeable = False
+    return a
+
 def getFriedelPair(tth0, eta0, *ome0, **kwargs):
     """
     Get the diffractometer angular coordinates in degrees for
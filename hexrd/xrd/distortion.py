@@ -5,6 +5,22 @@
 if USE_NUMBA:
     import numba
 
+# radius normalizing the GE_41RT power laws (half-width of a GE detector)
+RHO_MAX = 204.8
+
+# inputs of at least this many points use the parallel kernels and, for the
+# inverse, the lookup table
+PARALLEL_MIN_POINTS = 10000
+
+# number of eta nodes of the inverse table, and of radii fitted at each node
+LUT_SHAPE = (91, 1024)
+
+# order of the polynomial in rho fitted at each eta node of the inverse table
+LUT_ORDER = 6
+
+# number of parameter sets whose engines are kept
+ENGINE_CACHE_SIZE = 16
+
 def dummy(xy_in, params, invert=False):
     """
     """
@@ -89,6 +105,101 @@ def _ge_41rt_distortion(out, in_, rhoMax, params):
             out[el, 1] = yi
 
         return out
+
+    @numba.njit(nogil=True, parallel=True)
+    def _ge_41rt_distortion_parallel(out, in_, rhoMax, params):
+        p0, p1, p2, p3, p4, p5 = params[0:6]
+        rxi = 1.0/rhoMax
+
+        for el in numba.prange(len(in_)):
+            xi = in_[el, 0]
+            yi = in_[el, 1]
+            ri = np.sqrt(xi*xi + yi*yi)
+            if ri < sqrt_epsf:
+                ri_inv = 0.0
+            else:
+                ri_inv = 1.0/ri
+            sinni = yi*ri_inv
+            cosni = xi*ri_inv
+            cos2ni = cosni*cosni - sinni*sinni
+            sin2ni = 2*sinni*cosni
+            cos4ni = cos2ni*cos2ni - sin2ni*sin2ni
+            ratio = ri*rxi
+
+            ri = (p0*ratio**p3*cos2ni + p1*ratio**p4*cos4ni + p2*ratio**p5 + 1)*ri
+            out[el, 0] = ri*cosni
+            out[el, 1] = ri*sinni
+
+        return out
+
+    @numba.njit(nogil=True, parallel=True)
+    def _ge_41rt_inverse_distortion_lut(out, in_, rhoMax, params,
+                                        lut, dc, rho_lut_max):
+        # the inverse radius is ro plus a polynomial in ro/rho_lut_max whose
+        # coefficients, the rows of lut, are interpolated linearly in
+        # cos(2 eta); one newton step then brings it to full precision.
+        # radii beyond the table fall back to the plain newton solver
+        maxiter = 100
+        prec = epsf
+        neta, ncoef = lut.shape
+
+        p0, p1, p2, p3, p4, p5 = params[0:6]
+        rxi = 1.0/rhoMax
+        rti = 1.0/rho_lut_max
+        for el in numba.prange(len(in_)):
+            xi = in_[el, 0]
+            yi = in_[el, 1]
+            ri = np.sqrt(xi*xi + yi*yi)
+            if ri < sqrt_epsf:
+                ri_inv = 0.0
+            else:
+                ri_inv = 1.0/ri
+            sinni = yi*ri_inv
+            cosni = xi*ri_inv
+            ro = ri
+            cos2ni = cosni*cosni - sinni*sinni
+            sin2ni = 2*sinni*cosni
+            cos4ni = cos2ni*cos2ni - sin2ni*sin2ni
+
+            t = ro*rti
+            if t <= 1.0:
+                fc = (cos2ni + 1.0)/dc
+                ic = min(max(int(fc), 0), neta - 2)
+                fc = fc - ic
+                corr = 0.0
+                for k in range(ncoef):
+                    corr = corr*t + (1. - fc)*lut[ic, k] + fc*lut[ic + 1, k]
+                ri = ro + corr
+
+                # one newton step; the three powers share a log
+                if ri > 0.0:
+                    lratio = np.log(ri*rxi)
+                    a2 = p0*np.exp(p3*lratio)*cos2ni
+                    a4 = p1*np.exp(p4*lratio)*cos4ni
+                    a0 = p2*np.exp(p5*lratio)
+                    fx = (a2 + a4 + a0 + 1)*ri - ro # f(x)
+                    fxp = a2*(p3+1) + a4*(p4+1) + a0*(p5+1) + 1 # f'(x)
+                    ri = ri - fx/fxp
+                else:
+                    ri = ro
+            else:
+                for i in range(maxiter): # newton solver iteration
+                    ratio = ri*rxi
+                    a2 = p0*ratio**p3*cos2ni
+                    a4 = p1*ratio**p4*cos4ni
+                    a0 = p2*ratio**p5
+                    fx = (a2 + a4 + a0 + 1)*ri - ro # f(x)
+                    fxp = a2*(p3+1) + a4*(p4+1) + a0*(p5+1) + 1 # f'(x)
+
+                    delta = fx/fxp
+                    ri = ri - delta
+                    if np.abs(delta) <= prec*np.abs(ri): # convergence check
+                        break
+
+            out[el, 0] = ri*cosni
+            out[el, 1] = ri*sinni
+
+        return out
 else:
     # non-numba versions for the direct and inverse distortion
     def _ge_41rt_inverse_distortion(out, in_, rhoMax, params):
@@ -102,7 +213,7 @@ def _ge_41rt_inverse_distortion(out, in_, rhoMax, params):
         ri = np.sqrt(xi*xi + yi*yi)
         # !!! adding fix TypeError when processings list of coords
         zfix = []
-        if np.any(ri) < sqrt_epsf:
+        if np.any(ri < sqrt_epsf):
             zfix = ri < sqrt_epsf
             ri[zfix] = 1.0
         ri_inv = 1.0/ri
@@ -142,10 +253,9 @@ def _ge_41rt_distortion(out, in_, rhoMax, params):
 
         xi, yi = in_[:, 0], in_[:,1]
         ri = np.sqrt(xi*xi + yi*yi)
-        if ri < sqrt_epsf:
-            ri_inv = 0.0
-        else:
-            ri_inv = 1.0/ri
+        ri_inv = np.zeros_like(ri)
+        nz = ri >= sqrt_epsf
+        ri_inv[nz] = 1.0/ri[nz]
         sinni = yi*ri_inv
         cosni = xi*ri_inv
         cos2ni = cosni*cosni - sinni*sinni
@@ -159,6 +269,63 @@ def _ge_41rt_distortion(out, in_, rhoMax, params):
 
         return out
 
+    _ge_41rt_distortion_parallel = _ge_41rt_distortion
+
+    def _ge_41rt_inverse_distortion_lut(out, in_, rhoMax, params,
+                                        lut, dc, rho_lut_max):
+        neta, ncoef = lut.shape
+
+        p0, p1, p2, p3, p4, p5 = params[0:6]
+        rxi = 1.0/rhoMax
+
+        xi, yi = in_[:, 0], in_[:, 1]
+        ro = np.sqrt(xi*xi + yi*yi)
+        ri_inv = np.zeros_like(ro)
+        nz = ro >= sqrt_epsf
+        ri_inv[nz] = 1.0/ro[nz]
+
+        sinni = yi*ri_inv
+        cosni = xi*ri_inv
+        cos2ni = cosni*cosni - sinni*sinni
+        sin2ni = 2*sinni*cosni
+        cos4ni = cos2ni*cos2ni - sin2ni*sin2ni
+
+        # radii beyond the table go to the plain newton solver
+        t = ro/rho_lut_max
+        inlut = t <= 1.0
+        if not np.all(inlut):
+            off = ~inlut
+            out_off = np.empty((np.count_nonzero(off), 2))
+            _ge_41rt_inverse_distortion(out_off, in_[off], rhoMax, params)
+            out[off] = out_off
+
+        c2 = cos2ni[inlut]
+        c4 = cos4ni[inlut]
+        r0 = ro[inlut]
+        t = t[inlut]
+        fc = (c2 + 1.0)/dc
+        ic = np.clip(fc.astype(int), 0, neta - 2)
+        fc = (fc - ic)[:, np.newaxis]
+        coef = (1. - fc)*lut[ic] + fc*lut[ic + 1]
+        corr = np.zeros_like(r0)
+        for k in range(ncoef):
+            corr = corr*t + coef[:, k]
+        ri = np.maximum(r0 + corr, 0.)
+
+        # one newton step
+        ratio = ri*rxi
+        a2 = p0*ratio**p3*c2
+        a4 = p1*ratio**p4*c4
+        a0 = p2*ratio**p5
+        fx = (a2 + a4 + a0 + 1)*ri - r0 # f(x)
+        fxp = a2*(p3+1) + a4*(p4+1) + a0*(p5+1) + 1 # f'(x)
+        ri = ri - fx/fxp
+
+        out[inlut, 0] = ri*cosni[inlut]
+        out[inlut, 1] = ri*sinni[inlut]
+
+        return out
+
 def inverse_distortion_numpy(rho0, eta0, rhoMax, params):
     rhoSclFuncInv = lambda ri, ni, ro, rx, p: \
         (p[0]*(ri/rx)**p[3] * np.cos(2.0 * ni) + \
@@ -173,7 +340,7 @@ def inverse_distortion_numpy(rho0, eta0, rhoMax, params):
     return newton(rho0, rhoSclFuncInv, rhoSclFIprime,
                   (eta0, rho0, rhoMax, params))
 
-def GE_41RT(xy_in, params, invert=False):
+def GE_41RT(xy_in, params, invert=False, rhoMax=RHO_MAX):
     """
     Apply radial distortion to polar coordinates on GE detector
 
@@ -183,17 +350,139 @@ def GE_41RT(xy_in, params, invert=False):
     Available Keyword Arguments :
 
     invert = True or >False< :: apply inverse warping
+    rhoMax = radius normalizing the power laws; defaults to RHO_MAX
+
+    The work is done by a GE41RTDistortion instance, cached by parameters.
     """
 
     if params[0] == 0 and params[1] == 0 and params[2] ==0:
         return xy_in
     else:
-        rhoMax = 204.8
-        xy_out = np.empty_like(xy_in)
+        return ge_41rt_engine(params, rhoMax)(xy_in, invert=invert)
+
+
+class GE41RTDistortion(object):
+    """GE_41RT distortion for a fixed set of parameters
+
+    The parameters are checked once, at construction. Inputs of at least
+    PARALLEL_MIN_POINTS points are mapped by parallel kernels. The inverse
+    of such inputs is evaluated from a table built on first use: at each of
+    a set of eta nodes, the correction ri - ro of the inverse radius is
+    fitted by a polynomial of order LUT_ORDER in ro. As the model depends
+    on eta only through cos(2 eta) and cos(4 eta), the nodes are spaced
+    evenly in cos(2 eta) over [-1, 1], which also spares an arctan2 per
+    point. The coefficients are interpolated linearly between nodes, and a
+    single newton step then brings the radius to the precision of the plain
+    solver, so the inverse costs about one forward evaluation.
+    """
+
+    def __init__(self, params, rhoMax=RHO_MAX, rho_lut_max=None,
+                 lut_shape=LUT_SHAPE):
+        """Constructor
+
+        *params* - the GE_41RT parameters (at least 6)
+        *rhoMax* - radius normalizing the power laws
+        *rho_lut_max* - largest radius in the inverse table; the default,
+                        1.5*rhoMax, covers the corners of a square detector
+                        of half-width rhoMax
+        *lut_shape* - number of eta nodes of the inverse table, and of
+                      radii fitted at each node
+        """
+        params = np.asarray(params, dtype=float).flatten()
+        if len(params) < 6:
+            raise ValueError(
+                "GE_41RT needs 6 parameters, got %d" % len(params)
+            )
+        if not np.all(np.isfinite(params)):
+            raise ValueError("GE_41RT parameters must be finite")
+        if rhoMax <= 0:
+            raise ValueError("rhoMax must be positive")
+        self._params = params
+        self._rhoMax = float(rhoMax)
+        self._rho_lut_max = float(
+            1.5*rhoMax if rho_lut_max is None else rho_lut_max
+        )
+        self._lut_shape = tuple(lut_shape)
+        self._lut = None
+
+    @property
+    def params(self):
+        return self._params
+
+    @property
+    def rhoMax(self):
+        return self._rhoMax
+
+    @property
+    def is_identity(self):
+        return not np.any(self._params[:3])
+
+    def __call__(self, xy_in, invert=False):
         if invert:
-            _ge_41rt_inverse_distortion(xy_out, xy_in, float(rhoMax), np.asarray(params))
-            #rhoOut = inverse_distortion_numpy(rhoOut, rho0, eta0, rhoMax, params)
+            return self.invert(xy_in)
+        return self.apply(xy_in)
+
+    def apply(self, xy_in):
+        """distorted coordinates of xy_in"""
+        if self.is_identity:
+            return xy_in
+        xy_out = np.empty_like(xy_in)
+        if len(xy_in) >= PARALLEL_MIN_POINTS:
+            _ge_41rt_distortion_parallel(xy_out, xy_in, self._rhoMax,
+                                         self._params)
         else:
-            _ge_41rt_distortion(xy_out, xy_in, float(rhoMax), np.asarray(params))
+            _ge_41rt_distortion(xy_out, xy_in, self._rhoMax, self._params)
+        return xy_out
 
+    def invert(self, xy_in):
+        """undistorted coordinates of xy_in"""
+        if self.is_identity:
+            return xy_in
+        xy_out = np.empty_like(xy_in)
+        if len(xy_in) >= PARALLEL_MIN_POINTS:
+            lut, dc, rho_lut_max = self.lut()
+            _ge_41rt_inverse_distortion_lut(xy_out, xy_in, self._rhoMax,
+                                            self._params, lut, dc,
+                                            rho_lut_max)
+        else:
+            _ge_41rt_inverse_distortion(xy_out, xy_in, self._rhoMax,
+                                        self._params)
         return xy_out
+
+    def lut(self, order=LUT_ORDER):
+        """inverse correction table, its cos(2 eta) spacing and max radius
+
+        Row k holds the coefficients, highest order first, of the
+        polynomial in ro/rho_lut_max fitted to ri - ro at cos(2 eta) equal
+        to -1 + k*spacing.
+        """
+        if self._lut is None:
+            neta, nrho = self._lut_shape
+            dc = 2.0/(neta - 1)
+            eta = 0.5*np.arccos(np.clip(dc*np.arange(neta) - 1.0, -1., 1.))
+            rho = np.linspace(0., self._rho_lut_max, nrho)
+            xy = np.vstack([np.outer(np.cos(eta), rho).flatten(),
+                            np.outer(np.sin(eta), rho).flatten()]).T
+            xy_i = np.empty_like(xy)
+            _ge_41rt_inverse_distortion(xy_i, xy, self._rhoMax, self._params)
+            corr = np.sqrt(np.sum(xy_i**2, axis=1)).reshape(neta, nrho) - rho
+            vander = np.vander(rho/self._rho_lut_max, order + 1)
+            lut = np.linalg.lstsq(vander, corr.T, rcond=-1)[0].T
+            self._lut = (np.ascontiguousarray(lut), dc, self._rho_lut_max)
+        return self._lut
+
+    pass  # end class
+
+
+_engines = {}
+
+
+def ge_41rt_engine(params, rhoMax=RHO_MAX):
+    """GE41RTDistortion instance for params, shared between calls"""
+    key = (tuple(np.asarray(params, dtype=float).flatten()), float(rhoMax))
+    engine = _engines.get(key)
+    if engine is None:
+        if len(_engines) >= ENGINE_CACHE_SIZE:
+            _engines.clear()
+        engine = _engines[key] = GE41RTDistortion(params, rhoMax=rhoMax)
+    return engine
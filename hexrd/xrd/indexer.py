@@ -32,6 +32,7 @@
 import tempfile
 import glob
 import logging
+from multiprocessing.pool import ThreadPool
 import time
 import pdb
 
@@ -688,13 +689,18 @@ def paintGrid(quats, etaOmeMaps,
               omeTol=d2r, etaTol=d2r,
               omePeriod=(-num.pi, num.pi),
               doMultiProc=False,
-              nCPUs=None, debug=False):
+              nCPUs=None, debug=False,
+              doThreads=False):
     """
     do a direct search of omega-eta maps to paint each orientation in
     quats with a completeness
 
     bMat is in CRYSTAL frame
 
+    doThreads=True runs the nCPUs workers as threads sharing the maps
+    rather than as processes; the transforms and numba kernels release the
+    GIL, so this avoids copying the maps to each worker
+
     etaOmeMaps is instance of xrd.xrdutil.CollapseOmeEta
 
     omegaRange=([-num.pi/3., num.pi/3.],) for example
@@ -790,10 +796,10 @@ def paintGrid(quats, etaOmeMaps,
 
     if multiProcMode:
         nCPUs = nCPUs or xrdbase.dfltNCPU
-        chunksize = min(quats.shape[1] // nCPUs, 10)
+        chunksize = max(min(quats.shape[1] // nCPUs, 10), 1)
         logger.info(
-            "using multiprocessing with %d processes and a chunk size of %d",
-            nCPUs, chunksize
+            "using multiprocessing with %d %s and a chunk size of %d",
+            nCPUs, 'threads' if doThreads else 'processes', chunksize
             )
     else:
         logger.info("running in serial mode")
@@ -834,17 +840,32 @@ def paintGrid(quats, etaOmeMaps,
     # do the mapping
     start = time.time()
     retval = None
-    if multiProcMode:
+    global paramMP
+    if multiProcMode and doThreads:
+        # multiple thread version; threads share paramMP
+        paintgrid_init(params)    # sets paramMP
+        pool = ThreadPool(nCPUs)
+        try:
+            retval = pool.map(paintGridThis, quats.T, chunksize=chunksize)
+        finally:
+            pool.terminate()
+            pool.join()
+            paramMP = None    # clear paramMP
+    elif multiProcMode:
         # multiple process version
         pool = multiprocessing.Pool(nCPUs, paintgrid_init, (params, ))
-        retval = pool.map(paintGridThis, quats.T, chunksize=chunksize)
-        pool.close()
+        try:
+            retval = pool.map(paintGridThis, quats.T, chunksize=chunksize)
+        finally:
+            pool.terminate()
+            pool.join()
     else:
         # single process version.
-        global paramMP
         paintgrid_init(params)    # sets paramMP
-        retval = map(paintGridThis, quats.T)
-        paramMP = None    # clear paramMP
+        try:
+            retval = map(paintGridThis, quats.T)
+        finally:
+            paramMP = None    # clear paramMP
     elapsed = (time.time() - start)
     logger.info("paintGrid took %.3f seconds", elapsed)
 
@@ -1118,7 +1139,7 @@ def _angle_is_hit(ang, eta_offset, ome_offset, hkl, valid_eta_spans,
         else:
             return isHit, 1
 
-    @numba.njit
+    @numba.njit(nogil=True)
     def _filter_and_count_hits(angs_0, angs_1, symHKLs_ix, etaEdges,
                                valid_eta_spans, valid_ome_spans, omeEdges,
                                omePeriod, etaOmeMaps, etaIndices, omeIndices,
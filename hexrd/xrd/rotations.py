@@ -42,9 +42,11 @@
 from numpy import int_ as nInt
 
 from scipy.optimize import leastsq
+from scipy import sparse
 
 from hexrd.matrixutil import columnNorm, unitVector, skewMatrixOfVector, \
     multMatArray, nullSpace
+from hexrd.xrd import transforms_CAPI as xfcapi
 #
 #  Module Data
 tinyRotAng = finfo(float).eps         # ~2e-16
@@ -190,6 +192,35 @@ def misorientation(q1, q2, *args):
 
     return angle, mis
 
+def quatDistanceNeighbors(q1, qsym, radius, q2=None, block=1024):
+    """
+    sparse matrix of the distances between unit quaternions that are
+    within radius (in radians)
+
+    q1 is (4, n1), q2 is (4, n2) and defaults to q1; qsym is (4, nsym).
+    The distances are computed by blocks of rows with xfcapi.quat_distances
+    and returned as an (n1, n2) scipy.sparse csr matrix. Zero distances
+    are kept as explicit entries, so the matrix can be used as a sparse
+    precomputed metric (e.g. in sklearn's dbscan).
+    """
+    if q2 is None:
+        q2 = q1
+    n1 = q1.shape[1]
+    n2 = q2.shape[1]
+    data = []
+    indices = []
+    counts = [zeros(1, dtype=int)]
+    for i in range(0, n1, block):
+        d = xfcapi.quat_distances(q1[:, i:i + block], q2, qsym)
+        rows, cols = (d <= radius).nonzero()
+        data.append(d[rows, cols])
+        indices.append(cols)
+        counts.append(numpy.bincount(rows, minlength=len(d)))
+    indptr = numpy.cumsum(hstack(counts))
+    return sparse.csr_matrix(
+        (hstack(data), hstack(indices), indptr), shape=(n1, n2)
+        )
+
 def quatProduct(q1, q2):
     """
     Product of two unit quaternions.
@@ -848,6 +879,72 @@ def discreteFiber(c, s, B=I3, ndiv=120, invert=False, csym=None, ssym=None):
         else:
             retval.append(fixQuat(qfib).squeeze())
     return retval
+
+def discreteFibers(c, s, B=I3, ndiv=120, csym=None, ssym=None,
+                   tol=1.e-8, chunk=4096):
+    """
+    fibers for many (c, s) pairs at once
+
+    c is (3, n), the hkls, and s is (3, n), the matching scattering vectors
+    in the sample frame.  The fiber of pair i holds the same quaternions as
+    discreteFiber(c[:, i], s[:, i], B=B, ndiv=ndiv, csym=csym, ssym=ssym)[0].
+    The fibers are built in one vectorized pass and brought to the
+    fundamental region in chunks of pairs.  Duplicates within a fiber
+    (within tol) are removed by hashing onto a grid of spacing tol.
+
+    Returns the (4, m) quaternions of all the fibers, in pair order.
+    """
+    import symmetry as S
+
+    ztol = 1.e-8
+
+    c = unitVector(dot(B, asarray(c, dtype=float).reshape(3, -1)))
+    s = unitVector(asarray(s, dtype=float).reshape(3, -1))
+    npts = c.shape[1]
+
+    # axes of the rotations taking c to s; for antiparallel c, s use any
+    # vector perpendicular to c
+    ax = s + c
+    anrm = columnNorm(ax)
+    okay = anrm > ztol
+    ax[:, okay] = ax[:, okay] / anrm[okay]
+    for i in (~okay).nonzero()[0]:
+        ax[:, i] = nullSpace(c[:, i].reshape(3, 1))[:, 0]
+
+    # fiber points: q0 * qh, with q0 = (0, ax) and qh the rotations by phi
+    # about c, arranged as (4, npts, ndiv)
+    phi = arange(0, ndiv) * (2*pi/float(ndiv))
+    ch = cos(0.5*phi)
+    sh = sin(0.5*phi)
+    cdota = numpy.sum(c*ax, axis=0)
+    axc = cross(ax, c, axis=0)
+    qfib = numpy.empty((4, npts, ndiv))
+    qfib[0] = -numpy.outer(cdota, sh)
+    qfib[1:] = ax[:, :, None]*ch + axc[:, :, None]*sh
+    qfib = qfib.reshape(4, npts*ndiv)
+
+    if csym is not None:
+        step = max(chunk, 1)*ndiv
+        for i in range(0, npts*ndiv, step):
+            qfib[:, i:i + step] = S.toFundamentalRegion(
+                qfib[:, i:i + step], crysSym=csym, sampSym=ssym
+            )
+    else:
+        qfib = fixQuat(qfib)
+
+    # remove duplicates within each fiber: hash the quaternions onto a grid
+    # and keep the first of each (fiber, cell)
+    keys = numpy.vstack(
+        [numpy.rint(qfib/tol).astype(numpy.int64),
+         numpy.repeat(arange(npts), ndiv)]
+    )
+    order = numpy.lexsort(keys)
+    keys = keys[:, order]
+    first = numpy.ones(len(order), dtype=bool)
+    first[1:] = numpy.any(keys[:, 1:] != keys[:, :-1], axis=0)
+    keep = sort(order[first])
+
+    return qfib[:, keep]
 #
 #  ==================== Utility Functions
 #
@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+
+from hexrd.xrd import distortion as dfuncs
+
+# parameters from a GE detector calibration, and a set with non-integer
+# exponents that a polynomial in rho fits less well
+PARAMS = [
+    np.array([-2.277777438488093e-05, -8.763805946784612e-05,
+              -3.9641765567465504e-04, 2.0, 2.0, 2.0]),
+    np.array([3e-4, -2e-4, 5e-4, 1.5, 2.7, 3.3]),
+]
+
+# tolerance in mm on radii of up to 1.5*RHO_MAX
+TOL = 1e-11
+
+
+def detector_grid(n):
+    """n*n points covering a square detector of half-width RHO_MAX"""
+    pvec = dfuncs.RHO_MAX*np.linspace(-1, 1, n)
+    x, y = np.meshgrid(pvec, pvec)
+    return np.ascontiguousarray(np.vstack([x.flatten(), y.flatten()]).T)
+
+
+def newton_inverse(xy, params):
+    xy_out = np.empty_like(xy)
+    dfuncs._ge_41rt_inverse_distortion(xy_out, xy, dfuncs.RHO_MAX, params)
+    return xy_out
+
+
+class TestGE41RTInverse(unittest.TestCase):
+
+    def setUp(self):
+        # more than PARALLEL_MIN_POINTS, so invert uses the table
+        self.xy = detector_grid(128)
+        self.assertTrue(len(self.xy) >= dfuncs.PARALLEL_MIN_POINTS)
+
+    def test_table_matches_newton(self):
+        for params in PARAMS:
+            engine = dfuncs.GE41RTDistortion(params)
+            xy_i = engine.invert(self.xy)
+            self.assertTrue(np.allclose(xy_i, newton_inverse(self.xy, params),
+                                        rtol=0, atol=TOL))
+
+    def test_round_trip(self):
+        for params in PARAMS:
+            xy_i = dfuncs.GE_41RT(self.xy, params, invert=True)
+            self.assertTrue(np.allclose(dfuncs.GE_41RT(xy_i, params), self.xy,
+                                        rtol=0, atol=TOL))
+
+    def test_beyond_table(self):
+        # radii past rho_lut_max fall back to the plain solver
+        params = PARAMS[0]
+        engine = dfuncs.GE41RTDistortion(params, rho_lut_max=100.)
+        xy_i = engine.invert(self.xy)
+        self.assertTrue(np.allclose(xy_i, newton_inverse(self.xy, params),
+                                    rtol=0, atol=TOL))
+
+    def test_origin(self):
+        xy = np.zeros((dfuncs.PARALLEL_MIN_POINTS, 2))
+        xy_i = dfuncs.GE41RTDistortion(PARAMS[0]).invert(xy)
+        self.assertTrue(np.all(xy_i == 0))
+
+    def test_small_and_large_inputs_agree(self):
+        n = dfuncs.PARALLEL_MIN_POINTS
+        for params in PARAMS:
+            engine = dfuncs.GE41RTDistortion(params)
+            small = self.xy[:n - 1]
+            large = self.xy[:n]
+            for invert in (False, True):
+                self.assertTrue(np.allclose(
+                    engine(small, invert=invert),
+                    engine(large, invert=invert)[:n - 1],
+                    rtol=0, atol=TOL))
+
+
+class TestGE41RTEngine(unittest.TestCase):
+
+    def test_identity(self):
+        xy = detector_grid(8)
+        params = np.r_[0., 0., 0., 2., 2., 2.]
+        self.assertTrue(dfuncs.GE_41RT(xy, params) is xy)
+        self.assertTrue(dfuncs.GE_41RT(xy, params, invert=True) is xy)
+
+    def test_shared_engine(self):
+        params = PARAMS[0]
+        self.assertTrue(dfuncs.ge_41rt_engine(params)
+                        is dfuncs.ge_41rt_engine(list(params)))
+
+    def test_bad_params(self):
+        self.assertRaises(ValueError, dfuncs.GE41RTDistortion, [1e-4, 0., 0.])
+        self.assertRaises(ValueError, dfuncs.GE41RTDistortion,
+                          [np.nan, 0., 0., 2., 2., 2.])
+        self.assertRaises(ValueError, dfuncs.GE41RTDistortion, PARAMS[0],
+                          rhoMax=0.)
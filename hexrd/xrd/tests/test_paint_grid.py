@@ -0,0 +1,79 @@
+import argparse
+import unittest
+
+import numpy as np
+
+from hexrd.xrd import indexer
+from hexrd.xrd import material
+from hexrd.xrd import rotations as rot
+from hexrd.xrd import transforms_CAPI as xfcapi
+
+
+def make_eta_ome_maps(quat, neta=360, nome=180, seed=0):
+    """eta-omega maps of noise, plus the reflections of one orientation"""
+    rng = np.random.RandomState(seed)
+    mat = material.Material('copper')
+    mat.sgnum = 225
+    mat.latticeParameters = [3.59]
+    mat.hklMax = 10
+    pd = mat.planeData
+    pd.wavelength = 71.676
+
+    maps = argparse.Namespace()
+    maps.planeData = pd
+    maps.iHKLList = [0, 1, 2]
+    maps.etaEdges = np.linspace(-np.pi, np.pi, neta + 1)
+    maps.omeEdges = np.linspace(-np.pi, np.pi, nome + 1)
+    maps.dataStore = []
+    rMat = xfcapi.makeRotMatOfQuat(quat)
+    bMat = pd.latVecOps['B']
+    for hkl_id in maps.iHKLList:
+        data = rng.uniform(0, 1, (nome, neta))
+        hkls = np.ascontiguousarray(pd.getSymHKLs()[hkl_id].T)
+        for angs in xfcapi.oscillAnglesOfHKLs(hkls, 0., rMat, bMat,
+                                              pd.wavelength):
+            angs = angs[np.all(np.isfinite(angs), axis=1)]
+            i_ome = np.digitize(xfcapi.mapAngle(angs[:, 2], (-np.pi, np.pi)),
+                                maps.omeEdges) - 1
+            i_eta = np.digitize(xfcapi.mapAngle(angs[:, 1], (-np.pi, np.pi)),
+                                maps.etaEdges) - 1
+            data[i_ome, i_eta] = 10.
+        maps.dataStore.append(data)
+    return maps
+
+
+class TestPaintGrid(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.quats = rot.quatOfExpMap(rng.uniform(-1, 1, (3, 40)))
+        self.maps = make_eta_ome_maps(self.quats[:, 0])
+
+    def paint(self, **kwargs):
+        return indexer.paintGrid(self.quats, self.maps, threshold=0.9,
+                                 omeTol=np.radians(2.), etaTol=np.radians(2.),
+                                 omePeriod=np.r_[-np.pi, np.pi],
+                                 **kwargs)
+
+    def test_threads(self):
+        """paintGrid: threads give the serial completeness"""
+        serial = self.paint()
+        # the planted orientation is found, not the others
+        self.assertEqual(serial[0], 1.)
+        self.assertTrue(max(serial[1:]) < 1.)
+        threaded = self.paint(doMultiProc=True, nCPUs=3, doThreads=True)
+        self.assertEqual(threaded, serial)
+        self.assertTrue(indexer.paramMP is None)
+
+    def test_threads_error(self):
+        """paintGrid: parameters cleared when a thread fails"""
+        def fail(quat):
+            raise ValueError
+        paint_grid_this = indexer.paintGridThis
+        indexer.paintGridThis = fail
+        try:
+            self.assertRaises(ValueError, self.paint, doMultiProc=True,
+                              nCPUs=3, doThreads=True)
+        finally:
+            indexer.paintGridThis = paint_grid_this
+        self.assertTrue(indexer.paramMP is None)
@@ -0,0 +1,133 @@
+import unittest
+
+import numpy as np
+
+from hexrd.xrd import material
+
+
+def make_plane_data():
+    mat = material.Material('nickel')
+    mat.sgnum = 225
+    mat.latticeParameters = [3.52]
+    mat.hklMax = 30
+    pd = mat.planeData
+    pd.wavelength = 65.351
+    return pd
+
+
+def getters(pd):
+    """everything a PlaneData reports, from its public getters"""
+    return [
+        pd.getTTh(),
+        pd.getTThRanges(),
+        pd.getTThRanges(strainMag=0.001),
+        pd.getMergedRanges(),
+        pd.getMergedRanges(cullDupl=True),
+        pd.getHKLs(),
+        pd.getHKLs(allHKLs=True),
+        pd.getHKLs(asStr=True),
+        pd.getSymHKLs(),
+        pd.getSymHKLs(withID=True),
+        pd.getSymHKLs(asStr=True),
+        pd.getSymHKLs(indices=[0, 1]),
+        pd.getMultiplicity(),
+        pd.getPlaneSpacings(),
+        pd.latVecOps['B'],
+        pd.exclusions,
+        pd.nHKLs,
+        pd.hkls,
+    ]
+
+
+class TestPlaneDataMemo(unittest.TestCase):
+
+    steps = (
+        ('tThWidth', np.radians(0.2)),
+        ('lparms', [3.6]),
+        ('wavelength', 60.),
+        ('exclusions', np.array([0, 2])),
+        ('tThMax', np.radians(12.)),
+        ('tThWidth', np.radians(0.3)),
+        ('strainMag', 0.002),
+        ('exclusions', None),
+        ('tThWidth', np.radians(0.25)),
+    )
+
+    def assertSame(self, a, b, msg):
+        if isinstance(a, (list, tuple)):
+            self.assertEqual(len(a), len(b), msg)
+            for x, y in zip(a, b):
+                self.assertSame(x, y, msg)
+        else:
+            self.assertTrue(np.array_equal(a, b), msg)
+
+    def test_setters(self):
+        """PlaneData: getters after each setter match a fresh PlaneData"""
+        pd0 = make_plane_data()
+        warm = pd0.makeNew()
+        getters(warm)
+        for i, (name, value) in enumerate(self.steps):
+            setattr(warm, name, value)
+            # replay the steps on a PlaneData that was never read
+            cold = pd0.makeNew()
+            for n, v in self.steps[:i + 1]:
+                setattr(cold, n, v)
+            expected = getters(cold)
+            found = getters(warm)
+            for j, (a, b) in enumerate(zip(found, expected)):
+                self.assertSame(a, b, 'getter %d after %s' % (j, name))
+
+    def test_copies(self):
+        """PlaneData: getters return copies of the cached values"""
+        pd = make_plane_data()
+        tth = pd.getTTh()
+        tth[:] = 0.
+        self.assertTrue(np.all(pd.getTTh() > 0.))
+        hkls = pd.getSymHKLs()
+        hkls[0][:] = 0
+        self.assertTrue(np.any(pd.getSymHKLs()[0] != 0))
+
+
+class TestPlaneDataView(unittest.TestCase):
+
+    def setUp(self):
+        self.pd = make_plane_data()
+        self.pd.tThWidth = np.radians(0.2)
+
+    def test_read_only(self):
+        """PlaneDataView: arrays are read-only, attributes can not be set"""
+        view = self.pd.view()
+        arrays = [view.getTTh(), view.getTThRanges(), view.getHKLs(),
+                  view.getHKLs(allHKLs=True), view.getMultiplicity(),
+                  view.latVecOps['B']]
+        arrays += view.getSymHKLs() + view.getSymHKLs(withID=True)
+        for a in arrays:
+            self.assertFalse(a.flags.writeable)
+            with self.assertRaises(ValueError):
+                a[...] = 0
+        with self.assertRaises(RuntimeError):
+            view.tThWidth = 0.1
+        self.assertTrue(np.array_equal(view.getTTh(), self.pd.getTTh()))
+
+    def test_tth_width(self):
+        """PlaneDataView: tThWidth override leaves the parent alone"""
+        ranges = self.pd.getTThRanges()
+        merged = self.pd.getMergedRanges()
+        width = np.radians(0.5)
+        view = self.pd.view(tThWidth=width)
+        self.assertEqual(view.tThWidth, width)
+        self.assertTrue(np.allclose(np.diff(view.getTThRanges(), axis=1),
+                                    width))
+
+        self.assertEqual(self.pd.tThWidth, np.radians(0.2))
+        self.assertTrue(np.array_equal(self.pd.getTThRanges(), ranges))
+        self.assertEqual(self.pd.getMergedRanges(), merged)
+
+        # the view follows later changes of the parent, but keeps its width
+        self.pd.lparms = [3.6]
+        self.assertTrue(np.array_equal(view.getTTh(), self.pd.getTTh()))
+        self.assertTrue(np.allclose(np.diff(view.getTThRanges(), axis=1),
+                                    width))
+        new = view.makeNew()
+        self.assertEqual(new.tThWidth, width)
+        self.assertEqual(self.pd.tThWidth, np.radians(0.2))
@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+
+from hexrd.xrd import rotations as rot
+from hexrd.xrd import symmetry as sym
+from hexrd.xrd import transforms_CAPI as xfcapi
+
+
+def random_quats(n, rng):
+    q = rng.normal(size=(4, n))
+    return q/np.sqrt(np.sum(q**2, axis=0))
+
+
+class TestQuatDistances(unittest.TestCase):
+
+    groups = ('ci', 'c2h', 'd2h', 'd4h', 'd3d', 'd6h', 'oh')
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.q1 = random_quats(7, rng)
+        self.q2 = random_quats(11, rng)
+
+    def reference(self, q1, q2, qsym):
+        return np.array([rot.misorientation(q1[:, [i]], q2, (qsym,))[0]
+                         for i in range(q1.shape[1])])
+
+    def test_misorientation(self):
+        """quat_distances: same as misorientation for each group"""
+        for group in self.groups:
+            qsym = sym.quatOfLaueGroup(group)
+            expected = self.reference(self.q1, self.q2, qsym)
+            found = xfcapi.quat_distances(self.q1, self.q2, qsym)
+            self.assertEqual(found.shape, (7, 11))
+            self.assertTrue(np.allclose(found, expected, atol=1e-7), group)
+
+            single = xfcapi.quat_distances(self.q1[:, 0], self.q2, qsym)
+            self.assertTrue(np.array_equal(single, found[0]))
+            self.assertAlmostEqual(
+                xfcapi.quat_distance(self.q1[:, 0], self.q2[:, 0], qsym),
+                found[0, 0])
+
+    def test_noncontiguous(self):
+        """quat_distances: strided and Fortran ordered inputs"""
+        qsym = sym.quatOfLaueGroup('oh')
+        expected = xfcapi.quat_distances(self.q1, self.q2, qsym)
+
+        # every other column of wider arrays, and Fortran order
+        wide = np.repeat(qsym, 2, axis=1)
+        self.assertFalse(wide[:, ::2].flags.c_contiguous)
+        q2 = np.asfortranarray(self.q2)
+        found = xfcapi.quat_distances(np.repeat(self.q1, 2, axis=1)[:, ::2],
+                                      q2, wide[:, ::2])
+        self.assertTrue(np.array_equal(found, expected))
+        self.assertAlmostEqual(
+            xfcapi.quat_distance(self.q1[:, 0], self.q2[:, 0], wide[:, ::2]),
+            expected[0, 0])
+
+    def test_bad_shape(self):
+        """quat_distances: wrong shapes raise"""
+        qsym = sym.quatOfLaueGroup('oh')
+        self.assertRaises(RuntimeError, xfcapi.quat_distances,
+                          self.q1[:3], self.q2, qsym)
+        self.assertRaises(RuntimeError, xfcapi.quat_distances,
+                          self.q1, self.q2, qsym.T)
+
+
+class TestQuatDistanceNeighbors(unittest.TestCase):
+
+    def test_dense(self):
+        """quatDistanceNeighbors: entries within radius of the dense matrix"""
+        rng = np.random.RandomState(1)
+        # clusters of nearby orientations
+        q = random_quats(5, rng)
+        q = rot.quatProduct(
+            np.repeat(q, 8, axis=1),
+            rot.quatOfExpMap(rng.normal(scale=0.05, size=(3, 40))))
+        for group in ('d2h', 'oh'):
+            qsym = sym.quatOfLaueGroup(group)
+            dense = xfcapi.quat_distances(q, q, qsym)
+            radius = 0.1
+            nbrs = rot.quatDistanceNeighbors(q, qsym, radius, block=7)
+            self.assertEqual(nbrs.shape, (40, 40))
+            rows, cols = (dense <= radius).nonzero()
+            self.assertEqual(nbrs.nnz, len(rows))
+            self.assertTrue(np.array_equal(np.asarray(nbrs[rows, cols])[0],
+                                           dense[rows, cols]))
+            # self distances kept as explicit entries
+            self.assertTrue(np.all(nbrs.getnnz(axis=1) >= 1))
+
+            other = rot.quatDistanceNeighbors(q[:, :9], qsym, radius, q2=q)
+            self.assertEqual(other.shape, (9, 40))
+            self.assertTrue(np.array_equal(other.toarray(),
+                                           nbrs[:9].toarray()))
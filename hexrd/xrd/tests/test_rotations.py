@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from hexrd import matrixutil as mutil
+from hexrd.xrd import rotations as rot
+from hexrd.xrd import symmetry as sym
+
+
+def random_unit_vectors(n, rng):
+    v = rng.normal(size=(3, n))
+    return v/np.sqrt(np.sum(v**2, axis=0))
+
+
+class TestDiscreteFibers(unittest.TestCase):
+
+    def check(self, csym, ndiv=90):
+        rng = np.random.RandomState(0)
+        hkls = rng.randint(-3, 4, size=(3, 12)).astype(float)
+        hkls[:, np.all(hkls == 0, axis=0)] = 1.
+        gvecs = random_unit_vectors(12, rng)
+        bmat = np.diag([1., 1., 1./1.6])
+
+        # one fiber per spot, as find-orientations used to do
+        expected = np.hstack([
+            mutil.uniqueVectors(
+                rot.discreteFiber(hkls[:, i], gvecs[:, i], B=bmat,
+                                  ndiv=ndiv, csym=csym)[0])
+            for i in range(12)
+        ])
+        found = rot.discreteFibers(hkls, gvecs, B=bmat, ndiv=ndiv,
+                                   csym=csym)
+        self.assertEqual(found.shape, expected.shape)
+
+        # same quaternions, up to ordering within the fibers
+        dist = np.sqrt(np.sum(
+            (found[:, :, None] - expected[:, None, :])**2, axis=0))
+        self.assertTrue(np.all(dist.min(axis=1) < 1e-7))
+        self.assertTrue(np.all(dist.min(axis=0) < 1e-7))
+
+    def test_cubic(self):
+        """discreteFibers: same as discreteFiber per spot, cubic"""
+        self.check(sym.quatOfLaueGroup('oh'))
+
+    def test_hexagonal(self):
+        """discreteFibers: same as discreteFiber per spot, hexagonal"""
+        self.check(sym.quatOfLaueGroup('d6h'))
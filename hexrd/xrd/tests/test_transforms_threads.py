@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+
+from hexrd.xrd import transforms_CAPI as xfcapi
+
+# the kernels run in parallel above this many points (transforms_CFUNC.c)
+OMP_MIN_POINTS = 10000
+
+NPTS = OMP_MIN_POINTS + 37
+
+NTHREADS = 4
+
+
+class TestThreadedTransforms(unittest.TestCase):
+    """the OpenMP kernels give the same bits on 1 and on NTHREADS threads"""
+
+    def setUp(self):
+        self.nthreads = xfcapi.getNumThreads()
+        rng = np.random.RandomState(0)
+        self.rMat_d = xfcapi.makeDetectorRotMat(
+            [0.0011546340766314521, -0.0040527538387122993,
+             -0.0026221336905160211])
+        self.tVec_d = np.array([-1.44904, -3.235616, -1050.74026])
+        self.chi = -0.0011591608938627839
+        self.tVec_s = np.array([-0.15354144, 0., -0.23294777])
+        self.tVec_c = np.array([0.01, -0.02, 0.03])
+        self.rMat_c = xfcapi.makeRotMatOfExpMap(rng.uniform(-1, 1, 3))
+        self.xy = rng.uniform(-204.8, 204.8, (NPTS, 2))
+        self.angs = np.column_stack([
+            rng.uniform(0.05, 0.3, NPTS),
+            rng.uniform(-np.pi, np.pi, NPTS),
+            rng.uniform(-np.pi, np.pi, NPTS),
+        ])
+
+    def tearDown(self):
+        xfcapi.setNumThreads(self.nthreads)
+
+    def serial_and_threaded(self, func, *args):
+        xfcapi.setNumThreads(1)
+        serial = func(*args)
+        if xfcapi.setNumThreads(NTHREADS) == 1:
+            self.skipTest("transforms_CAPI built without OpenMP")
+        return serial, func(*args)
+
+    def assertSameArrays(self, serial, threaded):
+        if isinstance(serial, tuple):
+            self.assertEqual(len(serial), len(threaded))
+            for s, t in zip(serial, threaded):
+                self.assertSameArrays(s, t)
+        else:
+            # compare the bits, as NaN marks points off the detector
+            s = np.asarray(serial)
+            t = np.asarray(threaded)
+            self.assertEqual(s.shape, t.shape)
+            self.assertTrue(np.array_equal(s.view(np.uint8),
+                                           t.view(np.uint8)))
+
+    def test_detectorXYToGvec(self):
+        rMat_s = xfcapi.makeOscillRotMat([self.chi, 0.])
+        self.assertSameArrays(*self.serial_and_threaded(
+            xfcapi.detectorXYToGvec, self.xy, self.rMat_d, rMat_s,
+            self.tVec_d, self.tVec_s, self.tVec_c))
+
+    def test_gvecToDetectorXYArray(self):
+        gVec_c = xfcapi.anglesToGVec(self.angs, chi=self.chi,
+                                     rMat_c=self.rMat_c)
+        rMat_s = xfcapi.makeOscillRotMatArray(self.chi, self.angs[:, 2])
+        self.assertSameArrays(*self.serial_and_threaded(
+            xfcapi.gvecToDetectorXYArray, gVec_c, self.rMat_d, rMat_s,
+            self.rMat_c, self.tVec_d, self.tVec_s, self.tVec_c))
+
+    def test_gvecToDetectorXY(self):
+        gVec_c = xfcapi.anglesToGVec(self.angs, rMat_c=self.rMat_c)
+        rMat_s = xfcapi.makeOscillRotMat([self.chi, 0.3])
+        self.assertSameArrays(*self.serial_and_threaded(
+            xfcapi.gvecToDetectorXY, gVec_c, self.rMat_d, rMat_s,
+            self.rMat_c, self.tVec_d, self.tVec_s, self.tVec_c))
+
+    def test_anglesToGVec(self):
+        self.assertSameArrays(*self.serial_and_threaded(
+            xfcapi.anglesToGVec, self.angs, xfcapi.bVec_ref,
+            xfcapi.eta_ref, self.chi, self.rMat_c))
+
+    def test_anglesToDVec(self):
+        self.assertSameArrays(*self.serial_and_threaded(
+            xfcapi.anglesToDVec, self.angs, xfcapi.bVec_ref,
+            xfcapi.eta_ref, self.chi, self.rMat_c))
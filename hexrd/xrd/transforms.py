@@ -454,6 +454,8 @@ def polarRebin(thisFrame,
     corrected=False - uses 2-theta instead of rho
     verbose=True,
 
+    For caking many frames with a fixed geometry, the precomputed weights
+    of hexrd.instrument.caking.CakingEngine are much faster.
     """
 
     startEta = etaRange[0]
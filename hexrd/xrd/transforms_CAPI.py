@@ -530,12 +530,39 @@ def rotate_vecs_about_axis(angle, axis, vecs):
 
 def quat_distance(q1, q2, qsym):
     """
-    qsym coming from hexrd.xrd.crystallogray.PlaneData.getQSym() is C-contiguous
+    qsym is (4, nsym), as from hexrd.xrd.crystallography.PlaneData.getQSym();
+    the extension reads it one symmetry (column) at a time, that is in
+    Fortran order
     """
     q1 = np.ascontiguousarray(q1.flatten())
     q2 = np.ascontiguousarray(q2.flatten())
+    qsym = np.asfortranarray(qsym, dtype=float)
     return _transforms_CAPI.quat_distance(q1, q2, qsym)
 
+def quat_distances(q1, q2, qsym):
+    """
+    Distances between each of the unit quaternions q1 and each of q2
+
+    q1 is (4,) or (4, n1), q2 is (4, n2) and qsym is (4, nsym), as from
+    PlaneData.getQSym(); returns an (n1, n2) array, or (n2,) if q1 is a
+    single quaternion.  The values are those of quat_distance.
+    """
+    q1 = np.asarray(q1)
+    q2 = np.asarray(q2)
+    qsym = np.asarray(qsym)
+    # the extension only asserts on the shapes
+    if q1.shape[0] != 4 or q1.ndim > 2 or q2.shape[0] != 4 or q2.ndim > 2 \
+       or qsym.shape[0] != 4 or qsym.ndim != 2:
+        raise RuntimeError("quaternion args must be (4,) or (4, n) and "
+                           "qsym (4, nsym); got %s, %s and %s"
+                           % (q1.shape, q2.shape, qsym.shape))
+    single = q1.ndim == 1
+    q1 = np.ascontiguousarray(np.atleast_2d(q1.T).reshape(-1, 4), dtype=float)
+    q2 = np.ascontiguousarray(np.reshape(q2.T, (-1, 4)), dtype=float)
+    qsym = np.ascontiguousarray(qsym.T, dtype=float)
+    dist = _transforms_CAPI.quat_distances(q1, q2, qsym)
+    return dist[0] if single else dist
+
 def homochoricOfQuat(quats):
     """
     Compute homochoric parameters of unit quaternions
@@ -545,5 +572,22 @@ def homochoricOfQuat(quats):
     q = np.ascontiguousarray(quats.T)
     return _transforms_CAPI.homochoricOfQuat(q)
 
+def setNumThreads(n):
+    """
+    Set the number of threads used by the large-N kernels (anglesToGVec,
+    anglesToDVec, gvecToDetectorXY[Array], detectorXYToGvec[Array])
+
+    Returns the number of threads in use, which is always 1 if the
+    extension was built without OpenMP.  The default is taken from
+    OMP_NUM_THREADS, or else is the number of cores.
+    """
+    return _transforms_CAPI.setNumThreads(int(n))
+
+def getNumThreads():
+    """
+    Number of threads used by the large-N kernels
+    """
+    return _transforms_CAPI.setNumThreads(0)
+
 #def rotateVecsAboutAxis(angle, axis, vecs):
 #    return _transforms_CAPI.rotateVecsAboutAxis(angle, axis, vecs)
@@ -3560,13 +3560,13 @@ def simulateOmeEtaMaps(omeEdges, etaEdges, planeData, expMaps,
 
 
 
-_memo_hkls = {}
 def _fetch_hkls_from_planedata(pd):
-    if pd not in _memo_hkls:
-        _memo_hkls[pd] = num.ascontiguousarray(num.hstack(pd.getSymHKLs(withID=True)).T,
-                                               dtype=float)
-
-    return _memo_hkls[pd]
+    # memoized by the PlaneData itself, so exclusion changes are honored
+    return pd._memo(
+        'fullSymHKLs',
+        lambda: num.ascontiguousarray(
+            num.hstack(pd.getSymHKLs(withID=True)).T, dtype=float)
+        )
 
 
 def _filter_hkls_eta_ome(hkls, angles, eta_range, ome_range):
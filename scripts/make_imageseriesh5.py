@@ -17,6 +17,8 @@
 import h5py
 import fabio
 
+from hexrd.imageseries.save import DirectChunkWriter, blosc_h5opts
+
 # Error messages
 
 ERR_NO_FILE = 'Append specified, but could not open file'
@@ -45,14 +47,14 @@ def __init__(self, a):
         self.nfiles = len(self.files)
         self.nempty = a.empty
         self.maxframes = a.max_frames
+        self.threads = a.threads
         #self._setloglevel(a)
 
         self._info()
-        self.h5opts = self._seth5opts(a)
-
 
         self.ntowrite = numpy.min((self.maxframes, self.nframes))\
           if self.maxframes > 0 else self.nframes
+        self.h5opts = self._seth5opts(a)
 
         self.outfile = a.outfile
         self.dgrppath = a.dset
@@ -63,7 +65,10 @@ def _seth5opts(self, a):
 
         # compression type and level
         clevel =  min(a.compression_level, 9)
-        if clevel > 0:
+        if a.blosc is not None:
+            h5d.update(blosc_h5opts(a.blosc, max(clevel, 1)))
+            logging.info('compression: blosc/%s, level %s' % (a.blosc, clevel))
+        elif clevel > 0:
             h5d['compression'] = 'gzip'
             h5d['compression_opts'] = clevel
             logging.info('compression level: %s' % clevel)
@@ -83,8 +88,9 @@ def _seth5opts(self, a):
             nrows = min(ckb / (bpp * sh1), sh0)
             nrows = max(nrows, 1) # at least one row
             block = (nrows, sh1)
-        h5d['chunks'] = (1,) + block
-        logging.info('chunk size: %s X %s' % block)
+        nframes = max(min(a.chunk_frames, self.ntowrite), 1)
+        h5d['chunks'] = (nframes,) + block
+        logging.info('chunk size: %s X %s X %s' % h5d['chunks'])
 
         return h5d
 
@@ -164,16 +170,9 @@ def opendset(self):
 
         return f, ds
 
-    def write(self):
-        """write to HDF5 file"""
-        f, ds = self.opendset()
-        #
-        # Now add the images
-        #
-        start_time = time.clock() # time this
+    def frames(self):
+        """generate the nonempty frames to write"""
         nframes = 0 # number completed
-        print_every = 1; marker = " .";
-        print('Frames written (of %s):' % self.ntowrite, end="")
         for i in range(self.nfiles):
             if nframes >= self.ntowrite: break
 
@@ -186,14 +185,8 @@ def write(self):
                 if j < self.nempty:
                     logging.debug('... empty frame ... skipping')
                 else:
-                    ds[nframes, :, :] = img_i.data
+                    yield img_i.data
                     nframes += 1
-                    if numpy.mod(nframes, print_every) == 0:
-                        print(marker, nframes, end="")
-                        print_every *= 2
-                    sys.stdout.flush()
-                    logging.debug('... wrote image %s of %s' %\
-                                  (nframes, self.ntowrite))
                     if nframes >= self.ntowrite:
                         logging.debug('wrote last frame: stopping')
                         break
@@ -201,6 +194,29 @@ def write(self):
                     # on last frame in file, fabio will look for next file
                     img_i = img_i.next()
 
+    def write(self):
+        """write to HDF5 file"""
+        f, ds = self.opendset()
+        #
+        # Now add the images
+        #
+        start_time = time.clock() # time this
+        if self.threads > 0:
+            print('Compressing with %d threads' % self.threads)
+            writer = DirectChunkWriter(ds, threads=self.threads, **self.h5opts)
+            writer.write(self.frames())
+        else:
+            print_every = 1; marker = " .";
+            print('Frames written (of %s):' % self.ntowrite, end="")
+            for nframes, frame in enumerate(self.frames()):
+                ds[nframes, :, :] = frame
+                if numpy.mod(nframes + 1, print_every) == 0:
+                    print(marker, nframes + 1, end="")
+                    print_every *= 2
+                sys.stdout.flush()
+                logging.debug('... wrote image %s of %s' %\
+                              (nframes + 1, self.ntowrite))
+
         f.close()
         print("\nTime to write: %f seconds " %(time.clock()-start_time))
 
@@ -240,6 +256,19 @@ def set_options():
     parser.add_argument("--chunk-KB",
                         help=help_d,
                         metavar="K", type=int, action="store", default=0)
+    help_d = "number of frames per chunk"
+    parser.add_argument("--chunk-frames",
+                        help=help_d,
+                        metavar="N", type=int, action="store", default=1)
+    help_d = "use the named blosc compressor (e.g. lz4, zstd) instead of gzip"
+    parser.add_argument("--blosc",
+                        help=help_d,
+                        metavar="CNAME", action="store", default=None)
+    help_d = "number of threads compressing chunks for direct chunk writes;"\
+      " 0 leaves compression to HDF5"
+    parser.add_argument("-t", "--threads",
+                        help=help_d,
+                        metavar="N", type=int, action="store", default=0)
 
     return parser
 
@@ -95,6 +95,10 @@
 num_dilations = 2  # num iterations of images erosion
 ome_dilation_iter = 1  # num iterations of 3d image stack dilations
 chunk_size = 500  # chunksize for multiprocessing
+save_raw_confidence = True  # raw confidence is very big, save if needed
+# diffraction angles of the grains are saved here and reused by later runs
+# (layers) with the same grains and instrument; None to always compute them
+angle_cache_file = None
 
 # thresholds for accepting FF grains in NF reconstruction
 min_completeness = 0.5
@@ -139,9 +143,11 @@
 # %% TOMO PROCESSING - BUILD RADIOGRAPHS
 # =============================================================================
 
+# only the layer row is kept
 rad_stack = tomoutil.gen_attenuation_rads(
     tomo_data_folder, tbf, tomo_img_start, tomo_num_imgs,
-    experiment.nrows, experiment.ncols
+    experiment.nrows, experiment.ncols,
+    rows=[layer_row], threads=mp.cpu_count()
 )
 
 # =============================================================================
@@ -149,7 +155,7 @@
 # =============================================================================
 
 reconstruction_fbp = tomoutil.tomo_reconstruct_layer(
-    rad_stack, cross_sectional_dim, layer_row=layer_row,
+    rad_stack, cross_sectional_dim, layer_row=0,
     start_tomo_ang=ome_range_deg[0][0], end_tomo_ang=ome_range_deg[0][1],
     tomo_num_imgs=tomo_num_imgs, center=experiment.detector_params[3]
 )
@@ -206,7 +212,8 @@
 
 dark = nfutil.gen_nf_dark(
     data_folder, img_nums, num_for_dark,
-    experiment.nrows, experiment.ncols
+    experiment.nrows, experiment.ncols,
+    threads=mp.cpu_count()
 )
 
 # =============================================================================
@@ -216,7 +223,8 @@
 image_stack = nfutil.gen_nf_image_stack(
     data_folder, img_nums, dark,
     num_erosions, num_dilations, ome_dilation_iter,
-    threshold, experiment.nrows, experiment.ncols
+    threshold, experiment.nrows, experiment.ncols,
+    packed=True, threads=mp.cpu_count()
 )
 
 # =============================================================================
@@ -224,14 +232,22 @@
 # =============================================================================
 plt.close('all')
 img_to_view = 0
-plt.imshow(image_stack[img_to_view, :, :], interpolation='none')
+plt.imshow(nfutil.unpack_image_stack(image_stack[img_to_view, :, :],
+                                     experiment.ncols),
+           interpolation='none')
 
 # =============================================================================
 # %% INSTANTIATE CONTROLLER - RUN BLOCK NO EDITING
 # =============================================================================
 
 progress_handler = nfutil.progressbar_progress_observer()
-save_handler = nfutil.forgetful_result_handler()
+# reduces the confidence chunk by chunk, optionally saving it all to hdf5
+if save_raw_confidence:
+    save_handler = nfutil.streaming_result_handler(
+        output_dir + output_stem + '_raw_confidence.h5',
+        id_remap=nf_to_ff_id_map)
+else:
+    save_handler = nfutil.streaming_result_handler()
 
 controller = nfutil.ProcessController(save_handler, progress_handler,
                                       ncpus=mp.cpu_count(),
@@ -243,31 +259,28 @@
 # %% TEST ORIENTATIONS - RUN BLOCK NO EDITING
 # =============================================================================
 
-raw_confidence = nfutil.test_orientations(
+if angle_cache_file is not None:
+    angle_cache = nfutil.AngleCache(angle_cache_file)
+else:
+    angle_cache = None
+
+nfutil.test_orientations(
     image_stack, experiment, test_crds,
-    controller, multiprocessing_start_method
+    controller, multiprocessing_start_method,
+    angle_cache=angle_cache
 )
+save_handler.close()
 
 # =============================================================================
 # %% POST PROCESS W WHEN TOMOGRAPHY HAS BEEN USED
 # =============================================================================
 
-grain_map, confidence_map = nfutil.process_raw_confidence(
-    raw_confidence, Xs.shape,
+grain_map, confidence_map = nfutil.process_streamed_confidence(
+    save_handler, Xs.shape,
     tomo_mask=tomo_mask,
     id_remap=nf_to_ff_id_map
 )
 
-# =============================================================================
-# %% SAVE RAW CONFIDENCE FILES
-# ===========================================================================
-
-# This will be a very big file, don't save it if you don't need it
-nfutil.save_raw_confidence(
-    output_dir, output_stem, raw_confidence,
-    id_remap=nf_to_ff_id_map
-)
-
 # =============================================================================
 # %% SAVE PROCESSED GRAIN MAP DATA
 # =============================================================================
@@ -292,6 +305,6 @@
 # %% SAVE DATA AS VTK
 # =============================================================================
 
-vtkutil.output_grain_map_vtk(
+vtkutil.stream_grain_map_vtk(
     output_dir, [output_stem], output_stem, 0.1
 )
@@ -80,13 +80,48 @@ def run(self):
     )
 
 
+# OpenMP for the transforms kernels, if the compiler supports it;
+# set HEXRD_NO_OPENMP to build them serial
+def openmp_flags():
+    if os.environ.get('HEXRD_NO_OPENMP'):
+        return [], []
+    import shutil
+    import tempfile
+    from distutils.ccompiler import new_compiler
+    from distutils.errors import CompileError, LinkError
+    from distutils.sysconfig import customize_compiler
+    cc = new_compiler()
+    customize_compiler(cc)
+    if cc.compiler_type == 'msvc':
+        cflags, lflags = ['/openmp'], []
+    else:
+        cflags, lflags = ['-fopenmp'], ['-fopenmp']
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp_dir, 'omp_test.c')
+        with open(src, 'w') as f:
+            f.write('#include <omp.h>\n'
+                    'int main(void) { return omp_get_max_threads() < 1; }\n')
+        objs = cc.compile([src], output_dir=tmp_dir, extra_postargs=cflags)
+        cc.link_executable(objs, os.path.join(tmp_dir, 'omp_test'),
+                           extra_postargs=lflags)
+    except (CompileError, LinkError):
+        return [], []
+    finally:
+        shutil.rmtree(tmp_dir)
+    return cflags, lflags
+
+omp_cflags, omp_lflags = openmp_flags()
+
 # for transforms
 srclist = ['transforms_CAPI.c', 'transforms_CFUNC.c']
 srclist = [os.path.join('hexrd/transforms', f) for f in srclist]
 transforms_mod = Extension(
     'hexrd.xrd._transforms_CAPI',
     sources=srclist,
-    include_dirs=[np_include_dir]
+    include_dirs=[np_include_dir],
+    extra_compile_args=omp_cflags,
+    extra_link_args=omp_lflags
     )
 
 ext_modules = [sglite_mod, transforms_mod]
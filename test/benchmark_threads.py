@@ -0,0 +1,52 @@
+import sys, os, time
+import numpy as np
+
+from hexrd.xrd import transforms as xf
+from hexrd.xrd import transforms_CAPI as xfcapi
+
+# input parameters
+bVec_ref = xf.bVec_ref
+
+tilt_angles = (  0.0011546340766314521,
+                -0.0040527538387122993,
+                 -0.0026221336905160211 )
+rMat_d = xf.makeDetectorRotMat( tilt_angles )
+tVec_d = np.array( [   -1.44904, -3.235616, -1050.74026 ] )
+
+chi    = -0.0011591608938627839
+tVec_s = np.array( [ -0.15354144, 0., -0.23294777 ] )
+tVec_c = np.zeros(3)
+
+rMat_s = xf.makeOscillRotMat([chi, 0.])
+
+# ######################################################################
+# Whole-detector angle map, serial and threaded
+#
+pvec  = 204.8 * np.linspace(-1, 1, 4096)
+dcrds = np.meshgrid(pvec, pvec)
+XY    = np.ascontiguousarray(np.vstack([dcrds[0].flatten(), dcrds[1].flatten()]).T)
+
+nthreads = xfcapi.getNumThreads()
+
+# wall clock times; time.clock would add up the threads
+xfcapi.setNumThreads(1)
+start1 = time.time()                       # time this
+dangs1 = xfcapi.detectorXYToGvec(XY, rMat_d, rMat_s,
+                                 tVec_d, tVec_s, tVec_c)
+elapsed1 = (time.time() - start1)
+print "Time for detectorXYToGvec on 1 thread: %f"%(elapsed1)
+
+xfcapi.setNumThreads(nthreads)
+start2 = time.time()                       # time this
+dangs2 = xfcapi.detectorXYToGvec(XY, rMat_d, rMat_s,
+                                 tVec_d, tVec_s, tVec_c)
+elapsed2 = (time.time() - start2)
+print "Time for detectorXYToGvec on %d threads: %f"%(nthreads, elapsed2)
+print "Speedup: %f"%(elapsed1/elapsed2)
+
+maxDiff_tTh = np.linalg.norm(dangs1[0][0]-dangs2[0][0],np.inf)
+print "Maximum disagreement in tTh:  %f"%maxDiff_tTh
+maxDiff_eta = np.linalg.norm(dangs1[0][1]-dangs2[0][1],np.inf)
+print "Maximum disagreement in eta:  %f"%maxDiff_eta
+maxDiff_gVec = np.linalg.norm(np.sqrt(np.sum((dangs1[1]-dangs2[1])**2,1)),np.inf)
+print "Maximum disagreement in gVec: %f"%maxDiff_gVec